@@ -1,7 +1,6 @@
 from sqlmodel import Session, select, func
 from app.models import Forecast_Input, Vendor, Template
 from app.core.database import engine
-from app.forecasting.database_creation.generate_input_forecasts import sync_forecast_inputs
 from app.schema import post_window_datapoint, post_windows_data, popular_bundle_datapoint, popular_bundle_data
 from typing import List
 from datetime import date, timedelta, time
@@ -13,10 +12,9 @@ def get_posting_windows(session: Session, vendor_id: int, days_back: int = 42) -
     identify the most popular posting windows of a vendor regardless of bundle type
     for a set of time slots identify the weekly average over the last days_back days for a vendor
     package results into custom datapoint to be returned
+    the forecast inputs are kept up to date by core/forecast_ingestion.py, this only reads them
     """
 
-    sync_forecast_inputs(session, vendor_id, days_back)
-
     end_date = date.today() - timedelta(days=1)
 
     start_date = end_date - timedelta(days=days_back) 
@@ -64,10 +62,9 @@ def get_bestselling_bundle_titles(session: Session, vendor_id: int, days_back: i
     data intended to be returned to fronted and display the top 3 best selling bundle titles
     we gather the weekly average of each bundle sold over the last days_back days
     use custom datapoints to return the result
+    the forecast inputs are kept up to date by core/forecast_ingestion.py, this only reads them
     """
 
-    sync_forecast_inputs(session, vendor_id, days_back)
-
     end_date = date.today() - timedelta(days=1)
     start_date = end_date - timedelta(days=days_back) 
     total_days = (end_date - start_date).days + 1
@@ -79,6 +76,7 @@ def get_bestselling_bundle_titles(session: Session, vendor_id: int, days_back: i
         Template, Forecast_Input.template_id == Template.template_id
     ).where(
         Forecast_Input.vendor_id == vendor_id,
+        Template.vendor == vendor_id, # the same templates, but lets the planner use the template vendor index
         Forecast_Input.date.between(start_date, end_date)
     ).group_by(Template.title)
     
@@ -1,22 +1,20 @@
 from sqlmodel import Session, select
 from app.models import Forecast_Input, Vendor
 from app.core.database import engine
-from app.forecasting.database_creation.generate_input_forecasts import sync_forecast_inputs
 from typing import List
 from app.schema import discount_coordinate, discount_coordinate_data
 
 
 
-def pricing_effectiveness(session: Session, vendor_id: int, days_back = 42) -> discount_coordinate_data:
+def pricing_effectiveness(session: Session, vendor_id: int) -> discount_coordinate_data:
     """
     we want to return coordinates for a scatter plot with
     x axis: discount
     y axis: sold vs posted as a fraction
     this is represented as custom classes defined in schema
+    the forecast inputs are kept up to date by core/forecast_ingestion.py, this only reads them
     """
 
-    sync_forecast_inputs(session, vendor_id, days_back)
-
     statement = select(
         Forecast_Input.discount, Forecast_Input.bundles_posted, Forecast_Input.bundles_reserved, Forecast_Input.no_shows
     ).where(Forecast_Input.vendor_id == vendor_id)
@@ -1,12 +1,31 @@
-from sqlmodel import Session, select
-from app.models import Template, Bundle, Reservation, Vendor
+from sqlmodel import Session, select, func, distinct, and_
+from app.models import Template, Bundle, Reservation, Vendor, Vendor_Listing, Vendor_Listing_Reserved
 from app.core.database import engine
 from app.schema import week_sell_through_proportions, all_time_sell_through_proportions
 from datetime import date, timedelta
 from typing import Dict, Tuple
 
+# a bundle counts as collected or a no show by the status of its reservation, and as expired while nobody holds it
+# (never reserved, or reserved and then cancelled), bundles from today that are still for sale count as expired too
+# the last week is counted straight from the bundles, all time is the sum of the daily rollup in vendor_listing, where
+# the expired bundles are the ones posted less the ones held by a reservation (see core/vendor_listing.py)
 
 
+def sell_through_statement(vendor_id: int, start_date: date, end_date: date):
+    """(collected, no_show, expired) for the vendors bundles between the dates, counted in one grouped query"""
+    return (
+        select(
+            func.count(Reservation.reservation_id).filter(Reservation.status == "collected"),
+            func.count(Reservation.reservation_id).filter(Reservation.status == "no_show"),
+            func.count(distinct(Bundle.bundle_id)).filter(and_(Bundle.purchased_by == None, Bundle.picked_up.is_(False))),
+        )
+        .select_from(Bundle)
+        .join(Template, Bundle.template_id == Template.template_id)
+        .outerjoin(Reservation, Bundle.bundle_id == Reservation.bundle_id)
+        .where(Template.vendor == vendor_id)
+        .where(Bundle.date.between(start_date, end_date))
+    )
+
 
 def proportions_last_week(session: Session, vendor_id: int) -> week_sell_through_proportions:
 
@@ -20,36 +39,8 @@ def proportions_last_week(session: Session, vendor_id: int) -> week_sell_through
     start_date = date.today()-timedelta(days=(day_today+7))
     end_date = start_date + timedelta(days=6)
 
-    relevant_bundles = session.exec(
-        select(Bundle, Reservation.status)
-        .join(Template, Bundle.template_id == Template.template_id)
-        .where(Template.vendor == vendor_id)
-        .where(Bundle.date.between(start_date, end_date))
-        .outerjoin(Reservation, Bundle.bundle_id == Reservation.bundle_id)
-    ).all()
-
-    collected: int = 0
-    no_shows: int = 0
-    expired: int = 0
-
-    for _, reservation in relevant_bundles:
-        if reservation == 'no_show':
-            no_shows += 1
-        elif reservation == 'collected':
-            collected += 1
-        elif reservation is None:
-            expired+=1
-
-    total = no_shows + collected + expired
-
-    if total == 0:
-        return week_sell_through_proportions(
-            collected=0,
-            no_show=0,
-            expired=0,
-            week_start_date=start_date.isoformat()
-        )   
-    
+    collected, no_shows, expired = session.exec(sell_through_statement(vendor_id, start_date, end_date)).one()
+
     return week_sell_through_proportions(
             collected=collected,
             no_show=no_shows,
@@ -64,39 +55,24 @@ def proportions_last_week(session: Session, vendor_id: int) -> week_sell_through
 def proportions_all_time(session: Session, vendor_id: int) -> all_time_sell_through_proportions:
 
     """
-    we select all relevant bundles and their reservation status with a join
-    tally no show vs collected vs expired
+    sums the vendors rows of the daily rollup, one row per day the vendor has posted bundles
     return the dictionary of proportions
     """
 
-    relevant_bundles = session.exec(
-        select(Bundle, Reservation.status)
-        .join(Template, Bundle.template_id == Template.template_id)
-        .where(Template.vendor == vendor_id)
-        .outerjoin(Reservation, Bundle.bundle_id == Reservation.bundle_id)
-    ).all()
-
-    collected: int = 0
-    no_shows: int = 0
-    expired: int = 0
-
-    for _, reservation in relevant_bundles:
-        if reservation == 'no_show':
-            no_shows += 1
-        elif reservation == 'collected':
-            collected += 1
-        elif reservation is None:
-            expired+=1
-
-    total = no_shows + collected + expired
-
-    if total == 0:
-        return all_time_sell_through_proportions(
-            collected=0,
-            no_show=0,
-            expired=0
-        )   
-    
+    held = (
+        select(func.coalesce(func.sum(Vendor_Listing_Reserved.reserved_count), 0))
+        .where(Vendor_Listing_Reserved.vendor_id == vendor_id)
+        .scalar_subquery()
+    )
+    collected, no_shows, expired = session.exec(
+        select(
+            func.coalesce(func.sum(Vendor_Listing.collected_count), 0),
+            func.coalesce(func.sum(Vendor_Listing.no_show_count), 0),
+            func.coalesce(func.sum(Vendor_Listing.posted_count), 0) - held,
+        )
+        .where(Vendor_Listing.vendor_id == vendor_id)
+    ).one()
+
     return all_time_sell_through_proportions(
             collected=collected,
             no_show=no_shows,
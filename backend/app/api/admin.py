@@ -1,10 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select 
-from app.core.database import get_session, engine
+from app.core.database import get_session, engine, async_engine, get_pool_stats
 from app.core.security import get_password_hash
 from app.models import Vendor, User
-from app.schema import AdminVendorList, AllUsers
-from app.api.deps import get_current_user
+from app.schema import AdminVendorList, AllUsers, DatabasePoolStats
+from app.api.deps import get_current_principal
+from app.api.pagination import Page, page_params, paginate, page_items, count_rows
+from app.core.principal_cache import Principal, principal_cache
 
 
 router = APIRouter()
@@ -15,7 +17,7 @@ router = APIRouter()
 def delete_user(
     user_id: int,
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
     ):
 
     if user_id == current_user.user_id:
@@ -41,24 +43,29 @@ def delete_user(
     except Exception as e:
         session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
+
+    # the deleted user's token must stop working straight away
+    principal_cache.invalidate(str(user_id))
     return {"message":f"user {user_id} deleted successfully"}
 
 # vendor functions 
 
 @router.get("/vendors", response_model=AdminVendorList, tags=["Admin","Vendors"], summary="Get list of vendors to be verified")
 def get_vendors(
+    page: Page = Depends(page_params),
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
     ):
 
     if current_user.role != "admin":
         raise HTTPException(status_code=401, detail="must be an admin to view uncertified vendors")
     
     statement = select(Vendor).where(Vendor.validated == False)
-    vendors = session.exec(statement).all()
+    vendors, next_cursor = page_items(session.exec(paginate(statement, Vendor.vendor_id, page)).all(), Vendor.vendor_id, page)
 
     return {
-        "total_count": len(vendors),
+        "total_count": count_rows(session, statement) if page.include_total else None,
+        "next_cursor": next_cursor,
         "vendors":vendors
     }
 
@@ -66,7 +73,7 @@ def get_vendors(
 def validate_vendor(
     vendor_id: int,
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
     ):
 
     if current_user.role != "admin":
@@ -116,14 +123,16 @@ if __name__ == "__main__":
 
 @router.get("/users", response_model=AllUsers, tags=["Admin"], summary="Get all users for the admin view")
 def get_all_users(
+    page: Page = Depends(page_params),
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
     ):
 
     if current_user.role != "admin":
         raise HTTPException(status_code=401, detail="Must be an admin to view all accounts.")
     
-    users = session.exec(select(User)).all()
+    statement = select(User)
+    users, next_cursor = page_items(session.exec(paginate(statement, User.user_id, page)).all(), User.user_id, page)
 
     trunked = [
         {
@@ -133,4 +142,22 @@ def get_all_users(
         } for user in users
     ]
 
-    return { "total_count":len(trunked), "users":trunked }
+    return {
+        "total_count": count_rows(session, statement) if page.include_total else None,
+        "next_cursor": next_cursor,
+        "users":trunked
+    }
+
+
+@router.get("/pool", response_model=DatabasePoolStats, tags=["Admin"], summary="Get the state of the database connection pools")
+def get_database_pool_stats(
+    current_user: Principal = Depends(get_current_principal)
+    ):
+
+    if current_user.role != "admin":
+        raise HTTPException(status_code=401, detail="Must be an admin to view the connection pools.")
+
+    return {
+        "sync_engine": get_pool_stats(engine.pool),
+        "async_engine": get_pool_stats(async_engine.pool)
+    }
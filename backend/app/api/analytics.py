@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Query, Depends, HTTPException
 from sqlmodel import Session
 from app.core.database import get_session
-from app.api.deps import get_current_user
+from app.api.deps import get_current_principal
 from datetime import date, timedelta
 import logging
 from typing import Optional, Dict, Tuple, List
@@ -10,6 +10,7 @@ from app.analytics.sell_through_prop import proportions_all_time, proportions_la
 from app.analytics.waste_proxy import waste_proxy
 from app.analytics.pricing_effectiveness import pricing_effectiveness
 from app.analytics.operational_insights import get_bestselling_bundle_titles, get_posting_windows
+from app.core.forecast_ingestion import last_synced
 from app.schema import discount_coordinate_data, popular_bundle_data, post_windows_data, waste_proxy_data, week_sell_through_proportions, all_time_sell_through_proportions, combined_sell_through_data
 
 # log errors produced
@@ -19,7 +20,7 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.get("/sell_through_proportions", response_model=combined_sell_through_data)
-def get_sell_through_proportions(current_user = Depends(get_current_user), session: Session = Depends(get_session)):
+def get_sell_through_proportions(current_user = Depends(get_current_principal), session: Session = Depends(get_session)):
 
     """
     endpoint for returning a data for sell through
@@ -29,10 +30,10 @@ def get_sell_through_proportions(current_user = Depends(get_current_user), sessi
     """
 
     # if the vendor does not exist or has been incorrectly received: 400 code: client send bad request
-    if not current_user.vendor_profile:
+    if not current_user.vendor_id:
         raise HTTPException(status_code=400, detail="User has no vendor profile associated")
         
-    vendor_id = current_user.vendor_profile.vendor_id
+    vendor_id = current_user.vendor_id
 
     try:
         # attempt to call the functions we use for different sell through
@@ -54,17 +55,17 @@ def get_sell_through_proportions(current_user = Depends(get_current_user), sessi
 
 
 @router.get("/waste_proxy", response_model=waste_proxy_data)
-def get_waste_proxy(current_user = Depends(get_current_user), session: Session = Depends(get_session)):
+def get_waste_proxy(current_user = Depends(get_current_principal), session: Session = Depends(get_session)):
     """
     endpoint to call the function waste_proxy
     this function returns a dictionary in the form: {"total_waste_avoided": x, "average_bundle_weight": y}
     """
 
     # if the vendor does not exist or has been incorrectly received: 400 code: client send bad request
-    if not current_user.vendor_profile:
+    if not current_user.vendor_id:
         raise HTTPException(status_code=400, detail="User has no vendor profile associated")
         
-    vendor_id = current_user.vendor_profile.vendor_id # get the vendor id from current user
+    vendor_id = current_user.vendor_id # get the vendor id from current user
 
     try: # attempt to extract info from the function for the current vendor
         waste: waste_proxy_data = waste_proxy(session, vendor_id)
@@ -82,7 +83,7 @@ def get_waste_proxy(current_user = Depends(get_current_user), session: Session =
 
 
 @router.get("/pricing_effectiveness", response_model=discount_coordinate_data)
-def get_pricing_effectiveness(current_user = Depends(get_current_user), session: Session = Depends(get_session)):
+def get_pricing_effectiveness(current_user = Depends(get_current_principal), session: Session = Depends(get_session)):
     """
     endpoint that calls the function pricing_effectiveness
     this return a list of custom classes to represent the datapoints
@@ -91,14 +92,15 @@ def get_pricing_effectiveness(current_user = Depends(get_current_user), session:
     """
 
     # if the vendor does not exist or has been incorrectly received: 400 code: client send bad request
-    if not current_user.vendor_profile:
+    if not current_user.vendor_id:
         raise HTTPException(status_code=400, detail="User has no vendor profile associated")
         
-    vendor_id = current_user.vendor_profile.vendor_id # get the vendor id from current user
+    vendor_id = current_user.vendor_id # get the vendor id from current user
 
     try:
         # call and return result of plots
-        plots: discount_coordinate_data = pricing_effectiveness(session, vendor_id, days_back=42)
+        plots: discount_coordinate_data = pricing_effectiveness(session, vendor_id)
+        plots.synced_at = last_synced(session, vendor_id) # how fresh the data is
         return plots
     
     # use the logger to log the exceptions made
@@ -113,7 +115,7 @@ def get_pricing_effectiveness(current_user = Depends(get_current_user), session:
 
 
 @router.post("/posting_windows", response_model=post_windows_data)
-def get_post_window_data(current_user = Depends(get_current_user), session: Session = Depends(get_session)):
+def get_post_window_data(current_user = Depends(get_current_principal), session: Session = Depends(get_session)):
     """
     Endpoint for frontend to call that returns the necessary datapoints for a bar chart
     function get_posting_windows is called returning a class to represent datapoints
@@ -123,14 +125,15 @@ def get_post_window_data(current_user = Depends(get_current_user), session: Sess
     subtitle: your most popular timeslot is xx:yy:zz - xx:yy:zz
     """
     # if the vendor does not exist or has been incorrectly received: 400 code: client send bad request
-    if not current_user.vendor_profile:
+    if not current_user.vendor_id:
         raise HTTPException(status_code=400, detail="User has no vendor profile associated")
         
-    vendor_id = current_user.vendor_profile.vendor_id # get the vendor id from current user
+    vendor_id = current_user.vendor_id # get the vendor id from current user
 
     try:
         # call and return result of datapoints
         points: post_windows_data = get_posting_windows(session=session, vendor_id=vendor_id, days_back=42)
+        points.synced_at = last_synced(session, vendor_id) # how fresh the data is
         return points
     
     # use the logger to log the exceptions made
@@ -145,7 +148,7 @@ def get_post_window_data(current_user = Depends(get_current_user), session: Sess
 
 
 @router.post("/bestsellers", response_model=popular_bundle_data)
-def get_popular_bundle_data(current_user = Depends(get_current_user), session: Session = Depends(get_session)):
+def get_popular_bundle_data(current_user = Depends(get_current_principal), session: Session = Depends(get_session)):
     """
     endpoint to be called for making a bar chart to identify the top 3 most popular bundles by title
     x axis: bundle title
@@ -154,14 +157,15 @@ def get_popular_bundle_data(current_user = Depends(get_current_user), session: S
     subtitle: you best selling bundle is {x}_bundle
     """
     # if the vendor does not exist or has been incorrectly received: 400 code: client send bad request
-    if not current_user.vendor_profile:
+    if not current_user.vendor_id:
         raise HTTPException(status_code=400, detail="User has no vendor profile associated")
         
-    vendor_id = current_user.vendor_profile.vendor_id # get the vendor id from current user
+    vendor_id = current_user.vendor_id # get the vendor id from current user
 
     try:
         # call and return result of datapoints
         points: popular_bundle_data = get_bestselling_bundle_titles(session=session, vendor_id=vendor_id, days_back=42)
+        points.synced_at = last_synced(session, vendor_id) # how fresh the data is
         return points
     
     # use the logger to log the exceptions made
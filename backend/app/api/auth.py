@@ -5,6 +5,7 @@ from app.core.database import get_session
 from app.models import Customer, User, Vendor
 from app.core.security import get_password_hash, verify_password, create_access_token
 from ukpostcodeio.client import UKPostCodeIO
+from app.core.geocoding import lookup_postcode, lat_cell
 from app.schema import LoginResponse, LoginRequest, CustomerSignupRequest, VendorSignupRequest, PasswordCheck, PasswordCheckRead
 from app.api.deps import get_current_user
 router = APIRouter()
@@ -67,10 +68,14 @@ def register_customer(
         session.flush() # this sends sql to the db so the id can be generated but the transaction isnt committed or finished yet
 
         # now the obj is added to the db, so we can get its user id 
+        # coordinates are stored now so distances never need a geocoding request
+        latitude, longitude = lookup_postcode(parsed_postcode)
         new_customer = Customer(
             user_id = new_user.user_id,
             name = data.customer.name,
             post_code = parsed_postcode,
+            latitude = latitude,
+            longitude = longitude,
         )
 
         session.add(new_customer)
@@ -110,6 +115,7 @@ def register_vendor(
         session.flush() # this sends sql to the db so the id can be generated but the transaction isnt committed or finished yet
 
         # now the obj is added to the db, so we can get its user id 
+        latitude, longitude = lookup_postcode(parsed_postcode)
         new_vendor = Vendor(
             user_id = new_user.user_id,
             name = data.vendor.name,
@@ -118,6 +124,9 @@ def register_vendor(
             phone_number = data.vendor.phone_number,
             opening_hours = data.vendor.opening_hours,
             post_code = parsed_postcode,
+            latitude = latitude,
+            longitude = longitude,
+            lat_cell = lat_cell(latitude),
         )
 
         session.add(new_vendor)
@@ -2,49 +2,60 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select, delete
 from app.core.database import get_session
 from app.models import Template, Bundle, Reservation, User
-from app.schema import BundleCreate, BundleRead, VendBundleList, DeleteBundles
-from app.api.deps import get_current_user
+from app.schema import BundleCreate, BulkBundleCreate, CreatedBundles, BundleRead, VendBundleList, DeleteBundles
+from app.api.deps import get_current_principal
+from app.core.principal_cache import Principal
+from app.core.vendor_listing import bundles_removed
+from app.core.bundle_engine import post_bundles
 from datetime import datetime
 
 router = APIRouter()
 
 # post a bundle 
-@router.post("/create", tags=["Bundles"], summary="Create an amount of bundles for a specified template")
+@router.post("/create", response_model=CreatedBundles, tags=["Bundles"], summary="Create an amount of bundles for a specified template")
 def create_bundles(
     data: BundleCreate,
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
     ):
 
+    return create_bundles_for_templates(session, current_user, [data])
+
+# post bundles for several templates at once, eg. everything left at closing time
+@router.post("/create/bulk", response_model=CreatedBundles, tags=["Bundles"], summary="Create bundles for several templates in one request")
+def create_bundles_bulk(
+    data: BulkBundleCreate,
+    session: Session = Depends(get_session),
+    current_user = Depends(get_current_principal)
+    ):
+
+    return create_bundles_for_templates(session, current_user, data.bundles)
+
+def create_bundles_for_templates(session: Session, current_user: Principal, bundles: list[BundleCreate]):
     if current_user.role != "vendor":
         raise HTTPException(status_code=403, detail="Not a vendor account")
-    
-    # get the template
-    template : Template = session.exec(select(Template).where(Template.template_id == data.template_id)).first()
 
-    if not template: # no template
-        raise HTTPException(status_code=400, detail="No corresponding template")
-    if template.vendor != current_user.vendor_profile.vendor_id: # wrong vendor
-        raise HTTPException(status_code=403, detail="You are not the vendor of the template")
-    
+    # the same template listed twice is posted once with the amounts added up
+    amounts = {}
+    for bundle in bundles:
+        amounts[bundle.template_id] = amounts.get(bundle.template_id, 0) + bundle.amount
+
     try:
-        for i in range(data.amount):
-            new_bundle = Bundle(
-                template_id= template.template_id
-                # all other attributes are auto generated
-            )
-            session.add(new_bundle)
+        created = post_bundles(session, current_user.vendor_id, amounts)
         session.commit()
-        return {"message": "Bundles created successfully"}
+        return {"message": "Bundles created successfully", "created": created}
+    except HTTPException:
+        session.rollback()
+        raise
     except Exception as e:
-        session.rollback() # If anything fails, undo the Vendor creation
+        session.rollback() # If anything fails, undo the bundle creation
         raise HTTPException(status_code=500, detail=str(e))
     
 # get bundles for store view 
 @router.get("/mystore", response_model=VendBundleList, tags=["Bundles"], summary="Gets a list of bundles that are current, and not picked up yet")
 def vendor_list_bundles(
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
     ):
         
     if current_user.role != "vendor":
@@ -55,7 +66,7 @@ def vendor_list_bundles(
     statement = (select(Bundle)
             .join(Reservation, Bundle.bundle_id == Reservation.bundle_id, isouter=True)
             .join(Template, Bundle.template_id == Template.template_id)
-            .where(Template.vendor == current_user.vendor_profile.vendor_id)
+            .where(Template.vendor == current_user.vendor_id)
             .where(Bundle.picked_up.is_(False))
             .where(Bundle.date == today)
             # .where(Reservation.status == "booked") do we want checks 
@@ -80,7 +91,7 @@ def vendor_list_bundles(
 def bundle_read(
     bundle_id: int,
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
     ):
 
     statement = select(Bundle).where(Bundle.bundle_id == bundle_id)
@@ -90,7 +101,7 @@ def bundle_read(
 
     statement = select(Template.vendor).where(Template.template_id == Bundle.template_id)
     vendor = session.exec(statement).first()
-    if vendor != current_user.vendor_profile.vendor_id:
+    if vendor != current_user.vendor_id:
         raise HTTPException(status_code=403, detail="Not corresponding vendor account")
 
     return bundle
@@ -100,7 +111,7 @@ def bundle_read(
 def delete_bundles(
     data: DeleteBundles,
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
     ):
 
     # checks 
@@ -111,7 +122,7 @@ def delete_bundles(
     statement = select(Template).where(Template.template_id == data.template_id)
     template = session.exec(statement).first()
 
-    if current_user.role == "vendor" and current_user.vendor_profile.vendor_id != template.vendor:
+    if current_user.role == "vendor" and current_user.vendor_id != template.vendor:
         raise HTTPException(status_code=403, detail="you are not the vendor of this template")
     
     # delete active bundles that aren't reserved 
@@ -125,6 +136,7 @@ def delete_bundles(
     statement = delete(Bundle).where(Bundle.bundle_id.in_(subquery))
     try:
         response = session.exec(statement)
+        bundles_removed(session, template, datetime.now().date(), response.rowcount)
         session.commit()
         return { "message": f"deleted {response.rowcount} bundles from the template {data.template_id}"}
     except Exception as e:
@@ -1,14 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlmodel import Session, select, func
-from app.core.database import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.database import get_session, get_async_session
 from app.models import Customer, User, Streak, Badge, User_Badge
 from app.schema import BadgeList, CustomerRead, CustomerUpdate, LeaderboardList, StreakRead, BadgeRead, CreditTopUpDetails
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, get_current_principal, get_current_principal_async
+from app.core.principal_cache import principal_cache
 from app.core.security import verify_password, get_password_hash
 from typing import Optional, List
 from datetime import datetime
 import re
 from ukpostcodeio.client import UKPostCodeIO
+from app.core.geocoding import lookup_postcode
 
 router = APIRouter()
 postcodeAPI = UKPostCodeIO()
@@ -16,15 +19,16 @@ postcodeAPI = UKPostCodeIO()
 @router.get("/profile", response_model= CustomerRead, tags=["Customers"], summary="Get the Customer Profile for the User logged in")
 def get_customer_profile(
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
     ):
     if current_user.role != "customer":
         raise HTTPException(status_code=403, detail="Not a customer account")
         
-    if not current_user.customer_profile:
+    customer = session.get(Customer, current_user.customer_id) if current_user.customer_id else None
+    if not customer:
         raise HTTPException(status_code=404, detail="Profile not found")
     
-    return current_user.customer_profile
+    return customer
 
 @router.patch("/profile", tags = ["Customers"], summary = "Updating the settings of customer's accounts")
 def update_customer_profile(
@@ -66,25 +70,29 @@ def update_customer_profile(
         if not postcodeAPI.validate_postcode(parsed_postcode):
             raise HTTPException(status_code=400, detail="Postcode is not valid")
         current_user.customer_profile.post_code = data.customer.post_code
+        current_user.customer_profile.latitude, current_user.customer_profile.longitude = lookup_postcode(parsed_postcode)
     try:
         session.add(current_user)
         session.commit()
     except Exception as e:
         session.rollback() # If anything fails
         raise HTTPException(status_code=500, detail=str(e))
+
+    # the cached principal is reloaded on the next request
+    principal_cache.invalidate(str(current_user.user_id))
     return {"message": "Customer updated successfully"}
     
 # get customer streak 
 @router.get("/streak", response_model=Optional[StreakRead], tags=["Customer","Streaks"], summary="Get the current streak")
 def get_streak(
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
     ):
 
     if current_user.role != "customer":
         raise HTTPException(status_code=403, detail="Not a customer account")
         
-    if not current_user.customer_profile:
+    if not current_user.customer_id:
         raise HTTPException(status_code=404, detail="Profile not found")
     
     # get the current streak: 
@@ -92,7 +100,7 @@ def get_streak(
         select(
             Streak
         )
-        .where(Streak.customer_id == current_user.customer_profile.customer_id)
+        .where(Streak.customer_id == current_user.customer_id)
         .where(Streak.ended.is_(False))
     )
 
@@ -103,14 +111,14 @@ def get_streak(
 def add_credit_customer(
     card_details : CreditTopUpDetails,
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
     ):
 
     # Ensures user is a customer
     if current_user.role != "customer":
         raise HTTPException(status_code=403, detail="Not a customer account")
         
-    if not current_user.customer_profile:
+    if not current_user.customer_id:
         raise HTTPException(status_code=404, detail="Profile not found")
     
     # Ensures all details are entered
@@ -203,10 +211,13 @@ def add_credit_customer(
 
     # If all above is correct, then all the card information could be correct (we do not know for
     # sure as we are not querying a bank for actual details)
-    current_user.customer_profile.store_credit += card_details.credit_top_up
+    customer = session.get(Customer, current_user.customer_id)
+    if not customer:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    customer.store_credit += card_details.credit_top_up
     
     try:
-        session.add(current_user)
+        session.add(customer)
         session.commit()
     except Exception as e:
         session.rollback() # If anything fails
@@ -218,14 +229,14 @@ def add_credit_customer(
 @router.get("/badges/owned", response_model=BadgeList, tags=["Customer", "Badges"], summary="Get the badges for the current customer")
 def get_customer_owned_badges(
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
     ):
 
 
     if current_user.role != "customer":     #if the user is not a customer, they should not have access to this endpoint
         raise HTTPException(status_code=403, detail="Not a customer account")
         
-    if not current_user.customer_profile:   #if the user does not have a customer profile, they should not have access to this endpoint
+    if not current_user.customer_id:   #if the user does not have a customer profile, they should not have access to this endpoint
         raise HTTPException(status_code=404, detail="Profile not found")
 
     # gets all badges owned by the customer ,joins the Badge and User_Badge tables and filters for entries where the user_id matches the current user's id
@@ -242,14 +253,14 @@ def get_customer_owned_badges(
 @router.get("/badges/unowned", response_model=BadgeList, tags=["Customer", "Badges"], summary="Get unowned badges for the current customer")
 def get_customer_unowned_badges(
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
     ):
 
     # if the user is not a customer, they should not have access to this endpoint
     if current_user.role != "customer":
         raise HTTPException(status_code=403, detail="Not a customer account")
         
-    if not current_user.customer_profile:
+    if not current_user.customer_id:
         raise HTTPException(status_code=404, detail="Profile not found")
 
     # gets all badge_ids the user already owns
@@ -270,9 +281,9 @@ def get_customer_unowned_badges(
 
 # return the leaderboard of customers sorted by food saved returns 10 or 11 entries depending on whether the current customer is in the top 10 or not. If the user is not a customer, they should not have access to this endpoint and an error message should be given.
 @router.get("/leaderboard", response_model=LeaderboardList, tags=["Leaderboard"], summary="Get the food saved leaderboard")
-def get_leaderboard(
-    session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+async def get_leaderboard(
+    session: AsyncSession = Depends(get_async_session),
+    current_user = Depends(get_current_principal_async)
 ):
     # checks if the current user is a customer, if not they shouldn't have access and returns an error
     if current_user.role != "customer":
@@ -283,9 +294,11 @@ def get_leaderboard(
         .order_by(Customer.food_saved.desc())
         .limit(10)
     )
-    top_ten = session.exec(statement).all()
+    top_ten = (await session.exec(statement)).all()
 
-    current_customer = current_user.customer_profile
+    current_customer = await session.get(Customer, current_user.customer_id)
+    if not current_customer:
+        raise HTTPException(status_code=404, detail="Profile not found")
 
     # simple boolean checking if any of the IDs in the top ten are the current customer's
     in_top_ten = any(c.customer_id == current_customer.customer_id for c in top_ten)
@@ -308,7 +321,7 @@ def get_leaderboard(
         rank_statement = select(func.count(Customer.customer_id)).where(
             Customer.food_saved > current_customer.food_saved
         )
-        rank = session.exec(rank_statement).one() + 1
+        rank = (await session.exec(rank_statement)).one() + 1
 
         # adds the current customer's id, rank, name and food saved to the end of the results list with is_you as true for frontend display purposes
         results.append({
@@ -1,46 +1,103 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from sqlmodel import Session
-from app.models import User
-from app.core.database import get_session
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.models import User, Vendor, Customer
+from app.core.database import get_session, get_async_session
 from app.core.security import SECRET_KEY, ALGORITHM
+from app.core.principal_cache import Principal, principal_cache
 from datetime import datetime, timedelta, timezone
 
 # this tells FastAPI that the token is in the "Authorization: Bearer <token>" header
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-# get current user performs some basic checks and gets the user from the db 
-# get current user is called within all the other functions where we need to check a user's credentials
-# for example in customers.py current_user depends on this function 
-# this function is called when get_customer_profile is called, providing the user object
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    session: Session = Depends(get_session)
-    ) -> User:
-    
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+# checks the token and returns the user id it was issued for
+def get_token_subject(token: str) -> str:
     # checking token:
     # jwt.decode automatically checks the expiration time of the token
-    try: 
+    try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str | None = payload.get("sub")
-        
+
         if user_id is None:
             raise credentials_exception
 
     except JWTError:
         raise credentials_exception
 
+    return user_id
+
+# get current user performs some basic checks and gets the user from the db
+# get current user is called within the functions that need the full user object
+# for example in customers.py updating the profile changes the user's email and password
+def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    session: Session = Depends(get_session)
+    ) -> User:
+
+    user_id = get_token_subject(token)
+
     # gets the user from the db
     user = session.get(User, user_id)
-    
+
     if user is None:
         raise credentials_exception
-        
+
     return user # returns the user
+
+# get current principal is used by everything that only needs to know who the user is for authorization
+# it returns the role and profile ids from the principal cache, so the db is only hit the first time a token is seen
+# (or after the entry expires) and then with one query instead of the user and profile lazy loads
+def get_current_principal(
+    token: str = Depends(oauth2_scheme),
+    session: Session = Depends(get_session)
+    ) -> Principal:
+
+    user_id = get_token_subject(token)
+
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+
+    return cache_principal(user_id, session.exec(principal_statement(user_id)).first())
+
+# the same for the async routes, so they don't hold a sync connection (and a threadpool worker) to authorize
+async def get_current_principal_async(
+    token: str = Depends(oauth2_scheme),
+    session: AsyncSession = Depends(get_async_session)
+    ) -> Principal:
+
+    user_id = get_token_subject(token)
+
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+
+    return cache_principal(user_id, (await session.exec(principal_statement(user_id))).first())
+
+# the role and profile ids of the user in one query
+def principal_statement(user_id: str):
+    if not user_id.isdigit():
+        raise credentials_exception
+
+    return (
+        select(User.user_id, User.role, Vendor.vendor_id, Customer.customer_id)
+        .outerjoin(Vendor, Vendor.user_id == User.user_id)
+        .outerjoin(Customer, Customer.user_id == User.user_id)
+        .where(User.user_id == int(user_id))
+    )
+
+def cache_principal(user_id: str, row) -> Principal:
+    if row is None:
+        raise credentials_exception
+
+    principal = Principal(user_id=row.user_id, role=row.role, vendor_id=row.vendor_id, customer_id=row.customer_id)
+    principal_cache.set(user_id, principal)
+    return principal
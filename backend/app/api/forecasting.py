@@ -1,17 +1,17 @@
-from fastapi import APIRouter, Query, Depends, HTTPException
+from fastapi import APIRouter, Query, Depends, HTTPException, Response
 from sqlmodel import Session
 from app.core.database import get_session
-from app.api.deps import get_current_user
+from app.api.deps import get_current_principal
 from app.schema import ForecastWeekData
-from app.forecasting.baseline_approaches.seasonal_naive.seasonal_naive_forecast import get_naive_forecast_chart
-from app.forecasting.baseline_approaches.moving_average.moving_average_forecast import get_moving_average_forecast_chart
-from app.forecasting.linear_regression.linear_regression_forecast import get_linear_regression_forecast_chart
+from app.forecasting.forecast_cache import model_forecast, FORECAST_CACHE_HEADER
 from datetime import date, timedelta
 import logging
 from typing import Optional
 from sqlalchemy.exc import SQLAlchemyError
 
 # all forecasting functions that need to be called will be of the form: get_{model name}_forecast_chart
+# a repeated request is answered from the forecast cache while the vendors inputs and the models are unchanged,
+# the X-Forecast-Cache header says whether it came from memory, the stored outputs or was computed (miss)
 
 # log errors produced
 logger = logging.getLogger(__name__)
@@ -22,7 +22,8 @@ router = APIRouter()
 # changed to post for now as modifies the db
 @router.post("/naive", response_model=ForecastWeekData)
 def naive_forecast(
-    current_user = Depends(get_current_user),
+    response: Response,
+    current_user = Depends(get_current_principal),
     session: Session = Depends(get_session) 
 ):
     
@@ -34,16 +35,17 @@ def naive_forecast(
     """
 
     # if the vendor does not exist or has been incorrectly recieved: 400 code: client send bad request
-    if not current_user.vendor_profile:
+    if not current_user.vendor_id:
         raise HTTPException(status_code=400, detail="User has no vendor profile associated")
         
-    vendor_id = current_user.vendor_profile.vendor_id
+    vendor_id = current_user.vendor_id
 
     start_date = date.today() + timedelta(days=1) # the default start date is set to tomrrow for baseline forcasts as they can only predict a week into the future
 
     try:
         # pass logic to dedicated function
-        forecast_response = get_naive_forecast_chart(session, vendor_id, start_date)
+        forecast_response, source = model_forecast(session, vendor_id, "seasonal_naive", start_date)
+        response.headers[FORECAST_CACHE_HEADER] = source
         return forecast_response
     
     # use the logger to log the exceptions made
@@ -62,7 +64,8 @@ def naive_forecast(
 # endpoint for moving average baseline
 @router.post("/moving-average", response_model=ForecastWeekData)
 def moving_average_forecast(
-    current_user = Depends(get_current_user),
+    response: Response,
+    current_user = Depends(get_current_principal),
     session: Session = Depends(get_session) 
 ):
     
@@ -74,15 +77,16 @@ def moving_average_forecast(
     """
     
     # if the vendor does not exist or has been incorrectly recieved: 400 code: client send bad request
-    if not current_user.vendor_profile:
+    if not current_user.vendor_id:
         raise HTTPException(status_code=400, detail="User has no vendor profile associated")
     
-    vendor_id = current_user.vendor_profile.vendor_id
+    vendor_id = current_user.vendor_id
 
     start_date = date.today() + timedelta(days=1) # the default start date is set to tomrrow for baseline forcasts as they can only predict a week into the future
 
     try:
-        forecast_response = get_moving_average_forecast_chart(session=session, vendor_id=vendor_id, start_date=start_date)
+        forecast_response, source = model_forecast(session, vendor_id, "moving_average", start_date)
+        response.headers[FORECAST_CACHE_HEADER] = source
         return forecast_response
     
     # catch exceptions: status 500: somwthing wrong on the server level
@@ -100,10 +104,11 @@ def moving_average_forecast(
 # endpoint for advanced forecasting - linear regression
 @router.post("/linear-regression", response_model=ForecastWeekData)
 def linear_regression_forecast(
+    response: Response,
     # default to tomorrow 
     start_date: Optional[date] = Query(None, description="First day of the target week"),
     days_ahead: Optional[int] = Query(None, description="the number of days from start date when the forecast should end -> (Optional) defaults to 7 days"),
-    current_user = Depends(get_current_user),
+    current_user = Depends(get_current_principal),
     session: Session = Depends(get_session) 
 ):
     
@@ -117,10 +122,10 @@ def linear_regression_forecast(
 
     
     # if the vendor does not exist or has been incorrectly recieved: 400 code: client send bad request
-    if not current_user.vendor_profile:
+    if not current_user.vendor_id:
         raise HTTPException(status_code=400, detail="User has no vendor profile associated")
     
-    vendor_id = current_user.vendor_profile.vendor_id
+    vendor_id = current_user.vendor_id
 
     if start_date is None:
         start_date = date.today() + timedelta(days=1)
@@ -141,7 +146,8 @@ def linear_regression_forecast(
         raise HTTPException(status_code=400, detail="Start date cannot be in the past")
 
     try:
-        forecast_response = get_linear_regression_forecast_chart(session=session, vendor_id=vendor_id, start_date=start_date, days_ahead=days_ahead)
+        forecast_response, source = model_forecast(session, vendor_id, "linear_regression", start_date, days_ahead)
+        response.headers[FORECAST_CACHE_HEADER] = source
         return forecast_response
     
     # catch exceptions: status 500: somwthing wrong on the server level
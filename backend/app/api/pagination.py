@@ -0,0 +1,115 @@
+import base64
+import json
+from dataclasses import dataclass
+from typing import Optional
+from fastapi import HTTPException, Query
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from sqlmodel import Session, select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# keyset pagination shared by the list endpoints
+# a page is the next `limit` rows ordered by the primary key after the one in the cursor,
+# so every page costs the same no matter how far into the list it is (unlike OFFSET)
+# the cursor is opaque to the client, it just sends back the next_cursor it was given
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+COUNT_EXACT_LIMIT = 10000 # totals above this are estimated instead of counted
+
+
+@dataclass
+class Page:
+    limit: int
+    after: Optional[int] # primary key of the last row of the previous page
+    include_total: bool
+
+
+def encode_cursor(after: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"after": after}).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        after = json.loads(base64.urlsafe_b64decode(cursor.encode()))["after"]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(after, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return after
+
+
+# used as a dependency by the list endpoints: page: Page = Depends(page_params)
+def page_params(
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(default=None, description="next_cursor from the previous page"),
+    include_total: bool = Query(default=True, description="set to false to skip counting the whole list")
+    ) -> Page:
+    return Page(limit=limit, after=decode_cursor(cursor) if cursor else None, include_total=include_total)
+
+
+def paginate(statement, key, page: Page):
+    """
+    restricts statement to one page ordered by key (the primary key column)
+    one extra row is fetched so we know whether there is a next page
+    """
+    if page.after is not None:
+        statement = statement.where(key > page.after)
+    return statement.order_by(key).limit(page.limit + 1)
+
+
+def page_items(rows, key, page: Page) -> tuple[list, Optional[str]]:
+    """splits the rows of a paginated statement into the page and the cursor for the next one"""
+    rows = list(rows)
+    if len(rows) <= page.limit:
+        return rows, None
+    rows = rows[:page.limit]
+    return rows, encode_cursor(getattr(rows[-1], key.key))
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) of a select, only compiled for postgres"""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def capped_count_statement(statement):
+    # counts at most COUNT_EXACT_LIMIT + 1 rows so a huge list can't make the count slow
+    capped = statement.order_by(None).limit(COUNT_EXACT_LIMIT + 1).subquery()
+    return select(func.count()).select_from(capped)
+
+
+def planner_rows(plan) -> int:
+    if isinstance(plan, str): # asyncpg returns json as text
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_rows(session: Session, statement) -> int:
+    """
+    number of rows statement returns, exact up to COUNT_EXACT_LIMIT
+    above that postgres' planner estimate is used rather than scanning every row
+    """
+    count = session.exec(capped_count_statement(statement)).one()
+    if count <= COUNT_EXACT_LIMIT:
+        return count
+    if session.get_bind().dialect.name == "postgresql":
+        return max(planner_rows(session.exec(Explain(statement.order_by(None))).scalar()), count)
+    return session.exec(select(func.count()).select_from(statement.order_by(None).subquery())).one()
+
+
+async def count_rows_async(session: AsyncSession, statement) -> int:
+    """async version of count_rows"""
+    count = (await session.exec(capped_count_statement(statement))).one()
+    if count <= COUNT_EXACT_LIMIT:
+        return count
+    if session.get_bind().dialect.name == "postgresql":
+        return max(planner_rows((await session.exec(Explain(statement.order_by(None)))).scalar()), count)
+    return (await session.exec(select(func.count()).select_from(statement.order_by(None).subquery()))).one()
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select 
 from app.core.database import get_session
-from app.api.deps import get_current_user
+from app.api.deps import get_current_principal
+from app.api.pagination import Page, page_params, paginate, page_items, count_rows
 from app.models import Report
 from app.schema import ReportCreate, ReportRead, ReportRespond, ReportList
 from datetime import datetime
@@ -13,7 +14,7 @@ router = APIRouter()
 def create_report(
     data: ReportCreate,
     session: Session = Depends(get_session),
-    current_user  = Depends(get_current_user)
+    current_user  = Depends(get_current_principal)
     ):
     
     # checks 
@@ -30,7 +31,7 @@ def create_report(
     
     
     # create new report 
-    new_report = Report(customer_id= current_user.customer_profile.customer_id, 
+    new_report = Report(customer_id= current_user.customer_id, 
                         vendor_id = data.vendor_id,
                         title=data.title,
                         complaint= data.complaint
@@ -48,32 +49,37 @@ def create_report(
 
 @router.get("/list", response_model=ReportList, tags=["Reports"], summary="Return a list of relevant report, can be used for vendors or customer.")
 def get_list(
+    page: Page = Depends(page_params),
     session: Session = Depends(get_session),
-    current_user  = Depends(get_current_user)
+    current_user  = Depends(get_current_principal)
     ):
 
     # if vendor
     if current_user.role =="vendor":
-        statement = select(Report).where(Report.vendor_id == current_user.vendor_profile.vendor_id)
-        reports = session.exec(statement).all()
-        return {"total_count":len(reports), "reports":reports}
+        statement = select(Report).where(Report.vendor_id == current_user.vendor_id)
     # if customer
     elif current_user.role =="customer":
-        statement =  select(Report).where(Report.customer_id == current_user.customer_profile.customer_id)
-        reports = session.exec(statement).all()
-        return {"total_count":len(reports), "reports":reports}
+        statement =  select(Report).where(Report.customer_id == current_user.customer_id)
     
     elif current_user.role == "admin":
         statement = select(Report)
-        reports = session.exec(statement).all()
-        return {"total_count":len(reports), "reports":reports}
+
+    else:
+        raise HTTPException(status_code=403, detail="Not a valid account type")
+
+    reports, next_cursor = page_items(session.exec(paginate(statement, Report.report_id, page)).all(), Report.report_id, page)
+    return {
+        "total_count": count_rows(session, statement) if page.include_total else None,
+        "next_cursor": next_cursor,
+        "reports":reports
+    }
 
 @router.post("/{report_id}/reply", tags=["Reports"], summary="Vendor leaves a response to a report.")
 def respond(
     report_id:int,
     data: ReportRespond,
     session: Session = Depends(get_session),
-    current_user  = Depends(get_current_user)
+    current_user  = Depends(get_current_principal)
     ):
     # get report 
     statement = select(Report).where(Report.report_id == report_id)
@@ -82,7 +88,7 @@ def respond(
     if current_user.role != "vendor":
         raise HTTPException(status_code=401, detail="You are not a vendor.")
 
-    if report.vendor_id != current_user.vendor_profile.vendor_id:
+    if report.vendor_id != current_user.vendor_id:
         raise HTTPException(status_code=401, detail="You are not the correct vendor for this report.")
     
     if report.responded == True:
@@ -108,7 +114,7 @@ def respond(
 def read_report(
     report_id:int,
     session: Session = Depends(get_session),
-    current_user  = Depends(get_current_user)
+    current_user  = Depends(get_current_principal)
     ):
 
     # get report 
@@ -116,10 +122,10 @@ def read_report(
     report = session.exec(statement).first()
 
     # checks
-    if current_user.role == "customer" and report.customer_id != current_user.customer_profile.customer_id:
+    if current_user.role == "customer" and report.customer_id != current_user.customer_id:
         raise HTTPException(status_code=401, detail="You are not the correct customer for this report.")
     
-    if current_user.role == "vendor" and report.vendor_id != current_user.vendor_profile.vendor_id:
+    if current_user.role == "vendor" and report.vendor_id != current_user.vendor_id:
         raise HTTPException(status_code=401, detail="You are not the correct vendor for this report.")
     
     #note admin can read all 
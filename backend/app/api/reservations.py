@@ -1,64 +1,29 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select, func
-from app.core.database import get_session
+from sqlmodel import Session, select, func, and_, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.database import get_session, get_async_session
 from app.models import Badge, Template, Allergen, Bundle, Reservation, Customer, Vendor, Streak, User
 from app.schema import VendReservationRead, CustReservationRead, CustReservationList, VendReservationList, PickupCode
-from app.api.deps import get_current_user
+from app.api.deps import get_current_principal, get_current_principal_async
+from app.api.pagination import Page, page_params, paginate, page_items, count_rows
+from app.core.reservation_engine import reserve_bundle_async
+from app.core.badge_engine import award_badges
+from app.core.vendor_listing import apply_listing_delta, apply_reserved_delta
 from datetime import datetime, timedelta, date
-from random import randint
+from collections import Counter
 
 router = APIRouter()
 
 @router.post("/{template_id}/reserve", tags=["Reservations"], summary="Create a reservation of a template if a bundle is available")
-def create_reservation(
+async def create_reservation(
     template_id: int,
-    session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    session: AsyncSession = Depends(get_async_session),
+    current_user = Depends(get_current_principal_async)
     ):
 
-    # Ensures bundles of the correct template, made for that day and that haven't been purchased yet are selected
-    statement = (select(Bundle).where(Bundle.template_id == template_id, 
-                                     Bundle.date == datetime.now().date(), 
-                                     Bundle.purchased_by == None))
-
-    # Picks the first of any suitable bundles that meet criteria
-    bundle = session.exec(statement).first()
-
-    # If no bundles left, return status error
-    if not bundle:
-        raise HTTPException(status_code=404, detail="No bundle found for that template on the current day")
-
-    # Set that bundle to be bought by that customer so it cannot be bought by any other customer
-    bundle.purchased_by = current_user.customer_profile.customer_id
-
-    new_reservation = Reservation(bundle_id = bundle.bundle_id, 
-                                  customer_id = current_user.customer_profile.customer_id,
-                                  code = randint(0,9999))
-    
-            
-    statement = select(Customer).where(Customer.customer_id == new_reservation.customer_id)
-    customer = session.exec(statement).first()
-    if not customer:
-        raise HTTPException(status_code=403, detail = "Customer not found")
-
-    statement = select(Template).where(Template.template_id == template_id)
-    template = session.exec(statement).first()
-    if not template:
-        raise HTTPException(status_code=403, detail = "Template behind reservation not found")
-
-    if customer.store_credit < template.cost:
-        raise HTTPException(status_code=403, detail="Customer does not have enough credit to purchase")
-    customer.store_credit -= template.cost
-    
-
-    # Update the bought bundle and add the new reservation
-    try:
-        session.add(bundle)
-        session.add(new_reservation)
-        session.commit()
-    except Exception as e:
-        session.rollback() # If anything fails
-        raise HTTPException(status_code=500, detail=str(e))
+    # the engine claims a bundle, debits the customer's credit and creates the reservation in one transaction
+    # so concurrent requests for the same template can never be given the same bundle
+    new_reservation = await reserve_bundle_async(session, template_id, current_user.customer_id)
 
     return {"message": "Reservation created successfully", "reservation_id":new_reservation.reservation_id}
 
@@ -68,7 +33,7 @@ def create_reservation(
 def get_reservation_vendor(
     reservation_id:int,
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
     ):
     
     statement = select(Reservation).where(Reservation.reservation_id == reservation_id)
@@ -85,7 +50,7 @@ def get_reservation_vendor(
 
     # Checks if the vendor that made the bundle that has the reservation is trying to get the reservation
     if current_user.role == "vendor":  
-        if current_user.vendor_profile.vendor_id != reserveVendorID:
+        if current_user.vendor_id != reserveVendorID:
             raise HTTPException(status_code=403, detail="Not the correct vendor")
     
     return VendReservationRead(reservation_id = reservation_id, 
@@ -98,7 +63,7 @@ def get_reservation_vendor(
 def get_reservation_customer(
     reservation_id:int,
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
     ):
     
     statement = select(Reservation).where(Reservation.reservation_id == reservation_id)
@@ -108,7 +73,7 @@ def get_reservation_customer(
 
     # Ensures only the customer that created the reservation can access it
     if current_user.role == "customer":
-        if current_user.customer_profile.customer_id != reservation.customer_id:
+        if current_user.customer_id != reservation.customer_id:
             raise HTTPException(status_code=403, detail = "Not correct customer")
     
     return CustReservationRead(reservation_id = reservation_id, 
@@ -120,18 +85,18 @@ def get_reservation_customer(
 
 @router.get("/customer", response_model= CustReservationList, tags=["Reservations"], summary="Get one reservation details")
 def get_list_of_reservations_customer(
+    page: Page = Depends(page_params),
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
     ):
     
     # Ensures only the customers can call this
     if current_user.role != "customer":
         raise HTTPException(status_code=403, detail = "Not customer")
 
-    statement = select(Reservation).where(Reservation.customer_id == current_user.customer_profile.customer_id)
-    reservations = session.exec(statement).all()
-
-    count = len(reservations)
+    statement = select(Reservation).where(Reservation.customer_id == current_user.customer_id)
+    reservations, next_cursor = page_items(session.exec(paginate(statement, Reservation.reservation_id, page)).all(),
+                                           Reservation.reservation_id, page)
 
     customer_reservations = []
 
@@ -144,26 +109,27 @@ def get_list_of_reservations_customer(
                                    status = reservation.status))
     
     return{
-        "total_count":count,
+        "total_count": count_rows(session, statement) if page.include_total else None,
+        "next_cursor": next_cursor,
         "bundles": customer_reservations
     }
 
 @router.get("/vendor", response_model= VendReservationList, tags=["Reservations"], summary="Get one reservation details")
 def get_list_of_reservations_vendor(
+    page: Page = Depends(page_params),
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
     ):
     
     # Ensures only the vendors can call this
     if current_user.role != "vendor":
         raise HTTPException(status_code=403, detail = "Not vendor")
 
-    statement = select(Reservation).where(Template.vendor == current_user.vendor_profile.vendor_id, 
+    statement = select(Reservation).where(Template.vendor == current_user.vendor_id, 
                                           Reservation.bundle_id == Bundle.bundle_id,
                                           Bundle.template_id == Template.template_id)
-    reservations = session.exec(statement).all()
-
-    count = len(reservations)
+    reservations, next_cursor = page_items(session.exec(paginate(statement, Reservation.reservation_id, page)).all(),
+                                           Reservation.reservation_id, page)
 
     vendor_reservations = []
 
@@ -175,7 +141,8 @@ def get_list_of_reservations_vendor(
                                    status = reservation.status))
     
     return{
-        "total_count":count,
+        "total_count": count_rows(session, statement) if page.include_total else None,
+        "next_cursor": next_cursor,
         "bundles": vendor_reservations
     }
 
@@ -183,7 +150,7 @@ def get_list_of_reservations_vendor(
 def cancel_reservation(
     reservation_id: int,
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
     ):
 
     statement = select(Reservation).where(Reservation.reservation_id == reservation_id)
@@ -204,10 +171,10 @@ def cancel_reservation(
     # Checks if either the vendor that made the bundle that has the reservation or
     # the customer that created the reservation is trying to get the reservation
     if current_user.role == "vendor":  
-        if current_user.vendor_profile.vendor_id != reserveVendorID:
+        if current_user.vendor_id != reserveVendorID:
             raise HTTPException(status_code=403, detail="Not the correct vendor")
     if current_user.role == "customer":
-        if current_user.customer_profile.customer_id != reservation.customer_id:
+        if current_user.customer_id != reservation.customer_id:
             raise HTTPException(status_code=403, detail = "Not correct customer")
 
     reservation.status = "cancelled"
@@ -233,6 +200,8 @@ def cancel_reservation(
         raise HTTPException(status_code=403, detail = "Bundle not found")
 
     bundle.purchased_by = None
+    # the bundle can be reserved again, the reserve counted it on a shard of the day so it comes off there
+    apply_reserved_delta(session, reserveVendorID, bundle.date, bundle.bundle_id, -1)
     try:
         session.add(bundle)
         session.add(reservation)
@@ -250,71 +219,59 @@ def finalise_reservation(
     reservation_id: int,
     pickup_code_obj : PickupCode,
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
     ):
 
     pickup_code = pickup_code_obj.pickup_code
 
-    statement = select(Reservation).where(Reservation.reservation_id == reservation_id)
-    reservation = session.exec(statement).first()
-    if not reservation:
+    # everything the pickup needs in one query, including the customer's current streak
+    statement = (
+        select(Reservation, Template, Customer, Vendor, Streak, Bundle.date)
+        .outerjoin(Bundle, Bundle.bundle_id == Reservation.bundle_id)
+        .outerjoin(Template, Template.template_id == Bundle.template_id)
+        .outerjoin(Customer, Customer.customer_id == Reservation.customer_id)
+        .outerjoin(Vendor, Vendor.vendor_id == Template.vendor)
+        .outerjoin(Streak, and_(Streak.customer_id == Reservation.customer_id, Streak.ended.is_(False)))
+        .where(Reservation.reservation_id == reservation_id)
+    )
+    row = session.exec(statement).first()
+    if not row:
         raise HTTPException(status_code=403, detail = "Reservation not found")
-        
+    reservation, template, customer, vendor, streak, bundle_date = row
 
-    # Gets the ID of the vendor that is responsible for the reservation
-    statement = select(Template.vendor).where(Template.template_id == Bundle.template_id,
-                                              Bundle.bundle_id == reservation.bundle_id)
-    
-    reserveVendorID = session.exec(statement).first()
-    if not reserveVendorID:
+    # the vendor that is responsible for the reservation
+    if not template or not template.vendor:
         raise HTTPException(status_code=403, detail = "Vendor behind reservation not found")
 
     # Ensures the user is of role vendor and that the vendor is the correct vendor that made the bundle behind the reservation
     if current_user.role == "vendor":  
-        if current_user.vendor_profile.vendor_id != reserveVendorID:
+        if current_user.vendor_id != template.vendor:
             raise HTTPException(status_code=403, detail="Not the correct vendor")
     
-    # Gets the customer object
-    statement = select(Customer).where(Customer.customer_id == reservation.customer_id)
-    customer = session.exec(statement).first()
     if not customer:
                 raise HTTPException(status_code=403, detail = "Customer not found")
 
-    statement = select(Template.cost).where(Template.template_id == Bundle.template_id,
-                                            Bundle.bundle_id == reservation.bundle_id)
-
     if pickup_code != reservation.code:
         raise HTTPException(status_code=403, detail="Customer does not the correct accepting code")
 
+    # only a booked reservation can be picked up, finalising it again would count it twice
+    if reservation.status != "booked":
+        raise HTTPException(status_code=409, detail=f"Reservation is already {reservation.status}")
 
-    # Get the carbon saved from the template to be added to the customer and vendor total carbon saved
-    statement = select(Template.carbon_saved).where(Template.template_id == Bundle.template_id,
-                                                    Bundle.bundle_id == reservation.bundle_id)
-    carbon_saved = session.exec(statement).first()
+    # the carbon saved from the template to be added to the customer and vendor total carbon saved
+    carbon_saved = template.carbon_saved
     if not carbon_saved:
         raise HTTPException(status_code=403, detail = "Carbon saved value not found")
 
-    # Get the food saved from the template weight to be added to the customer and vendor total food saved
-    statement = select(Template.weight).where(Template.template_id == Bundle.template_id,
-                                              Bundle.bundle_id == reservation.bundle_id)
-    food_saved = session.exec(statement).first()
-
-    reservation.status = "collected"
+    # the food saved from the template weight to be added to the customer and vendor total food saved
+    food_saved = template.weight
 
-    # Gets the vendor object to update their value
-    statement = select(Vendor).where(Vendor.vendor_id == current_user.vendor_profile.vendor_id)
-    vendor = session.exec(statement).first()
-    if not vendor:
+    # only the vendor themselves can finalise
+    if not vendor or current_user.vendor_id != vendor.vendor_id:
         raise HTTPException(status_code=403, detail = "Vendor not found")
 
-    # Get the money saved from the template to be added to the customer total money saved
-    statement = select(Template.cost).where(Template.template_id == Bundle.template_id,
-                                            Bundle.bundle_id == reservation.bundle_id)
-    money_paid = session.exec(statement).first()
-    statement = select(Template.estimated_value).where(Template.template_id == Bundle.template_id,
-                                            Bundle.bundle_id == reservation.bundle_id)
-    estimated_value = session.exec(statement).first()
-    money_saved = estimated_value - money_paid
+    # the money saved to be added to the customer total money saved
+    money_saved = template.estimated_value - template.cost
 
     # add the carbon saved and food saved to the customer and vendor profiles
     customer.carbon_saved += carbon_saved
@@ -322,14 +279,27 @@ def finalise_reservation(
     customer.food_saved += food_saved
     vendor.food_saved += food_saved
     customer.money_saved += money_saved
+    customer.bundles_saved += 1
 
     try:
-        increment_streak(session,customer)
-        customer_verify_and_give_badges(customer, session)  # check if the customer has earned any badges with this reservation and award them if so
+        # still booked when the update runs, a second request for the same pickup that got past the check above stops here
+        collected = session.exec(
+            update(Reservation)
+            .where(Reservation.reservation_id == reservation.reservation_id, Reservation.status == "booked")
+            .values(status="collected")
+        ).rowcount
+        if not collected:
+            session.rollback()
+            raise HTTPException(status_code=409, detail="Reservation is already finalised")
+        increment_streak(session, customer, streak)
+        award_badges(session, customer)  # check if the customer has earned any badges with this reservation and award them if so
+        apply_listing_delta(session, vendor.vendor_id, bundle_date, collected=1) # for the sell through analytics
         session.add(reservation)
         session.add(customer)
         session.add(vendor)
-        session.commit()
+        session.commit() # the only commit, the pickup is saved completely or not at all
+    except HTTPException:
+        raise
     except Exception as e:
         session.rollback() # If anything fails
         raise HTTPException(status_code=500, detail=str(e))
@@ -340,7 +310,7 @@ def finalise_reservation(
 def set_reservation_no_shows(
     days_back : int = 1,
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
     ):
      # Ensures only the vendors can call this
     if current_user.role != "vendor":
@@ -351,17 +321,22 @@ def set_reservation_no_shows(
 
     go_back_date = datetime.now().date() - timedelta(days = days_back)
 
-    statement = select(Reservation).where(Template.vendor == current_user.vendor_profile.vendor_id, 
+    statement = select(Reservation, Bundle.date).where(Template.vendor == current_user.vendor_id, 
                                           Reservation.bundle_id == Bundle.bundle_id,
                                           Bundle.template_id == Template.template_id,
                                           Bundle.date > go_back_date,
                                           Reservation.status == "booked")
-    reservations = session.exec(statement).all()
+    rows = session.exec(statement).all()
 
     try:
-        for reservation in reservations:
+        no_shows = Counter()
+        for reservation, bundle_date in rows:
             reservation.status = "no_show"
+            no_shows[bundle_date] += 1
             session.add(reservation)
+        # one upsert per day for the sell through analytics
+        for bundle_date, amount in no_shows.items():
+            apply_listing_delta(session, current_user.vendor_id, bundle_date, no_show=amount)
         session.commit()
     except Exception as e:
         session.rollback() # If anything fails
@@ -371,96 +346,36 @@ def set_reservation_no_shows(
     
 
 #logic for incrementing or making a new streak 
-def increment_streak(session: Session, customer):
-    # check if they have a streak
-    statement = (select(Streak)
-                 .where(Streak.customer_id == customer.customer_id)
-                 .where(Streak.ended.is_(False))
-                 )
-    streak = session.exec(statement).first()
-    try:
-        if streak != None:
-            # check date 
-            if streak.last == datetime.now().date():
-                return # streak is not adjusted if last was same day
-
-            last = streak.last + timedelta(days=7)
-            if last >= datetime.now().date(): # streak is in date
-                streak.count +=1
-                streak.last = datetime.now().date()
-                session.add(streak)
-                session.commit()
-                return
-            
-            else: # streak is out of date
-                streak.ended = True
-                session.add(streak)
-    
-        # create new streak
-        new_streak = Streak(
-            customer_id=customer.customer_id,
-            started= datetime.now().date(),
-            last= datetime.now().date(),
-            count = 1
-        )
-
-        session.add(new_streak)
-        session.commit()
-        return
-    
-    except Exception as e:
-        session.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
-
-# This handles the logic for awarding badges to users. Called whenever a reservation is completed
-def customer_verify_and_give_badges(customer: Customer, session: Session):
-
-    # gets all badges that are for customers
-    statement = select(Badge).where(Badge.user_role == "customer")
-    badges = session.exec(statement).all()
-
-    try:
-        # for each badge, get the customer's value of the metric that the badge tracks. If the value meets the threshold for the badge, award the badge to the customer if they don't already have it.
-        for badge in badges:
-            if badge.metric == "carbon_saved": #if the badge is for carbon saved, get the customer's carbon saved value
-                value = customer.carbon_saved
-            
-            elif badge.metric == "food_saved": #if for food saved, get the customer's food saved (in kg) value
-                value = customer.food_saved
-            
-            elif badge.metric == "streak_count": #if for streak count, get the customer's current streak count
-                statement = (
-                    select(Streak.count)
-                    .where(Streak.customer_id == customer.customer_id)
-                    .where(Streak.ended.is_(False))
-                )
-                value = session.exec(statement).first() or 0
-            
-            elif badge.metric == "bundles_saved": #if for bundles saved, get the number of reservations with status collected for that customer
-                statement = (
-                    select(func.count(Reservation.reservation_id))
-                    .where(Reservation.customer_id == customer.customer_id)
-                    .where(Reservation.status == "collected")
-                )
-                value = (session.exec(statement).first()+1) or 0
-            
-            elif badge.metric == "money_saved": #if for money saved, get the money saved attribute from customer
-                value = customer.money_saved
-
-            else:
-                continue
-
-            # if the customer's value for the badge's metric meets the threshold for the badge, and they don't already have the badge, award it to them by adding it to their badges relationship
-            if value >= badge.threshold:
-                if badge not in customer.user.badges:
-                    customer.user.badges.append(badge)
-                    session.add(customer.user)
-
-        session.commit()
-
-    # if anything fails, roll back the session and raise an HTTP exception with the error message
-    except Exception as e:
-        session.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
+# streak is the customer's current streak (None if they don't have one), loaded by the caller
+# the changes are only added to the session, the caller commits them with the rest of the pickup
+def increment_streak(session: Session, customer, streak: Streak | None):
+    if streak != None:
+        # check date 
+        if streak.last == datetime.now().date():
+            return # streak is not adjusted if last was same day
+
+        last = streak.last + timedelta(days=7)
+        if last >= datetime.now().date(): # streak is in date
+            streak.count +=1
+            streak.last = datetime.now().date()
+            customer.streak_count = streak.count
+            session.add(streak)
+            session.add(customer)
+            return
+        
+        else: # streak is out of date
+            streak.ended = True
+            session.add(streak)
+
+    # create new streak
+    new_streak = Streak(
+        customer_id=customer.customer_id,
+        started= datetime.now().date(),
+        last= datetime.now().date(),
+        count = 1
+    )
+    customer.streak_count = 1
+    session.add(new_streak)
+    session.add(customer)
 
 # need to do set no-show if they don't turn up 
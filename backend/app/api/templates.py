@@ -1,9 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from sqlmodel import Session, select, func, delete
-from app.core.database import get_session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.database import get_session, get_async_session
 from app.models import Template, Allergen, Bundle, Reservation, Customer, User
 from app.schema import TemplateCreate, TemplateList, TemplateRead
-from app.api.deps import get_current_user
+from app.api.deps import get_current_principal, get_current_principal_async
+from app.api.pagination import Page, page_params, paginate, page_items, count_rows
+from app.core.vendor_listing import rebuild_vendor_listing
+from app.core.principal_cache import Principal
 from datetime import datetime
 from random import randint
 import uuid
@@ -16,13 +20,13 @@ router = APIRouter()
 def create_template(
     data: TemplateCreate,
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
     ):
     
     if current_user.role != "vendor":
         raise HTTPException(status_code=403, detail="Not a vendor account")
 
-    if session.exec(select(Template).where(Template.title == data.title, Template.vendor == current_user.vendor_profile.vendor_id)).first():
+    if session.exec(select(Template).where(Template.title == data.title, Template.vendor == current_user.vendor_id)).first():
         raise HTTPException(status_code=400, detail="Template already registered")
     
     percents = data.meat_percent + data.carb_percent + data.veg_percent\
@@ -53,7 +57,7 @@ def create_template(
         is_vegan = data.is_vegan,
         is_vegetarian = data.is_vegetarian,
 
-        vendor = current_user.vendor_profile.vendor_id
+        vendor = current_user.vendor_id
     )
 
     # for the allergens it is a bit more complex, we need to get 
@@ -82,7 +86,7 @@ def create_template(
 async def upload_image(
     template_id:int,
     image: UploadFile = File(...),
-    current_user = Depends(get_current_user),
+    current_user = Depends(get_current_principal),
     session: Session = Depends(get_session)
     ):
     # If the image is malformed, throw a 400 error
@@ -97,7 +101,7 @@ async def upload_image(
     with open(file_location, "wb") as buffer:
         shutil.copyfileobj(image.file, buffer)
 
-    if not current_user.vendor_profile:
+    if not current_user.vendor_id:
         raise HTTPException(status_code=400, detail="User is not a vendor")
     
     template = session.exec(select(Template).where(Template.template_id == template_id)).first()
@@ -119,37 +123,30 @@ async def upload_image(
 def get_list_of_templates(
     # doesn't need verification? as anyone can see the templates?
     vendor_id: int,
+    page: Page = Depends(page_params),
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
     ):
     
-    if current_user.role == "vendor" and vendor_id != current_user.vendor_profile.vendor_id:
+    if current_user.role == "vendor" and vendor_id != current_user.vendor_id:
         raise HTTPException(status_code=403, detail="Not the correct vendor")
 
     statement = select(Template).where(Template.vendor == vendor_id)
-    templates = session.exec(statement).all()
-    
-    # if empty send this
-    if not templates:
-        return {
-            "templates":[],
-            "total_count":0
-        }
-        
-    count = len(templates) 
-    # else return items 
+    templates, next_cursor = page_items(session.exec(paginate(statement, Template.template_id, page)).all(), Template.template_id, page)
+    
     return {
         "templates": templates,
-        "total_count":count
+        "total_count": count_rows(session, statement) if page.include_total else None,
+        "next_cursor": next_cursor
     }
     
 # gets the count of how many bundles there are for a template
 # expected use when getting a displaying full bundle/template information 
 @router.get("/count/{template_id}", response_model = int, tags=["Templates"], summary="Get the count of available bundles for a specified template.")
-def count_bundles(
+async def count_bundles(
     template_id: int,
-    session: Session = Depends(get_session),
-    current_user = Depends(get_current_user) # conducts basic security checks even though the variable isn't used
+    session: AsyncSession = Depends(get_async_session),
+    current_user = Depends(get_current_principal_async) # conducts basic security checks even though the variable isn't used
     ):
     
     today = datetime.now().date()
@@ -167,7 +164,7 @@ def count_bundles(
         .group_by(Bundle.template_id) # count template 
     )
 
-    count = session.exec(statement).one_or_none()
+    count = (await session.exec(statement)).one_or_none()
     if count == None:
         return 0
     return count 
@@ -177,7 +174,7 @@ def count_bundles(
 def get_template(
     template_id:int,
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user) # conducts basic security checks even though the variable isn't used
+    current_user = Depends(get_current_principal) # conducts basic security checks even though the variable isn't used
 ):
     statement = select(Template).where(Template.template_id == template_id)
     template = session.exec(statement).first()
@@ -191,7 +188,7 @@ def get_template(
 def delete_template(
     template_id : int, 
     session:Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
     ):
     
     if current_user.role == "customer":
@@ -200,7 +197,7 @@ def delete_template(
     statement = select(Template).where(Template.template_id == template_id)
     template = session.exec(statement).first()
 
-    if current_user.role == "vendor" and current_user.vendor_profile.vendor_id != template.vendor:
+    if current_user.role == "vendor" and current_user.vendor_id != template.vendor:
         raise HTTPException(status_code=403, detail="you are not the vendor of this template")
     
     # check if template has any active reservations 
@@ -226,6 +223,8 @@ def delete_template(
     try:
         session.exec(statement_b)
         session.exec(statement_t)
+        # the vendors older bundles lose their template too, so every day is recounted not just today
+        rebuild_vendor_listing(session, None, template.vendor)
         session.commit()
         return { "message":f"deleted template {template_id} successfully"}
     except Exception as e:
@@ -1,21 +1,21 @@
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlmodel import Session, select, func, case, and_
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlmodel import Session, select, func, case, and_
-from app.core.database import get_session
-from app.models import User, Bundle, Template, Reservation, Vendor
-from app.schema import VendorRead, CustBundleList, VendorList, VendorUpdate
-from app.models import User, Bundle, Template, Reservation, Vendor
-from app.schema import VendorRead, CustBundleList, VendorList, VendorUpdate
-from app.api.deps import get_current_user
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.core.database import get_session, get_async_session
+from app.models import User, Bundle, Template, Reservation, Vendor, Customer, Vendor_Listing, Vendor_Listing_Reserved
+from app.schema import VendorRead, CustBundleList, VendorList, NearbyVendorList, VendorUpdate
+from app.api.deps import get_current_user, get_current_principal, get_current_principal_async
+from app.api.pagination import Page, page_params, paginate, page_items, count_rows_async
+from app.core.principal_cache import Principal, principal_cache
 import uuid
 import shutil
 from datetime import datetime
 from app.core.security import verify_password, get_password_hash
 from ukpostcodeio.client import UKPostCodeIO
-from geopy import distance
-from geopy.geocoders import Nominatim
+from app.core.geocoding import lookup_postcode, haversine_km, bounding_box, lat_cell, lat_cells, KM_PER_MILE
+import numpy as np
 
 router = APIRouter()
 postcodeAPI = UKPostCodeIO()
@@ -24,15 +24,16 @@ postcodeAPI = UKPostCodeIO()
 @router.get("/profile", response_model= VendorRead, tags=["Vendors"], summary="Get the Vendor Profile for the User logged in")
 def get_vendor_profile(
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
     ):
     if current_user.role != "vendor":
         raise HTTPException(status_code=403, detail="Not a vendor account")
         
-    if not current_user.vendor_profile:
+    vendor = session.get(Vendor, current_user.vendor_id) if current_user.vendor_id else None
+    if not vendor:
         raise HTTPException(status_code=404, detail="Profile not found")
     
-    return current_user.vendor_profile
+    return vendor
 
 @router.patch("/profile", tags = ["Vendors"], summary = "Updating the settings of the vendors accounts")
 def update_vendor_profile(
@@ -76,7 +77,9 @@ def update_vendor_profile(
         parsed_postcode = (data.vendor.post_code).upper().replace(" ","")
         if not postcodeAPI.validate_postcode(parsed_postcode):
             raise HTTPException(status_code=400, detail="Postcode is not valid")
-        current_user.vendor_profile.post_code = data.customer.post_code
+        current_user.vendor_profile.post_code = parsed_postcode
+        current_user.vendor_profile.latitude, current_user.vendor_profile.longitude = lookup_postcode(parsed_postcode)
+        current_user.vendor_profile.lat_cell = lat_cell(current_user.vendor_profile.latitude)
 
     if data.vendor.phone_number != None:
          current_user.vendor_profile.phone_number = data.vendor.phone_number
@@ -92,19 +95,22 @@ def update_vendor_profile(
     except Exception as e:
         session.rollback() # If anything fails
         raise HTTPException(status_code=500, detail=str(e))
+
+    # the cached principal is reloaded on the next request
+    principal_cache.invalidate(str(current_user.user_id))
     return {"message": "Customer updated successfully"}
 
 # get a list of bundles for the corresponding vendor
 # for customer view at store page 
 @router.get("/bundles/{vendor_id}",response_model=CustBundleList,tags=["Bundles"], summary="gets a list of simple details for a stores bundles")
-def customer_list_bundles(
+async def customer_list_bundles(
     vendor_id: int,
-    session: Session = Depends(get_session),
-    current_user = Depends(get_current_user) # keep this as it does some checks
+    session: AsyncSession = Depends(get_async_session),
+    current_user = Depends(get_current_principal_async) # keep this as it does some checks
     ):
     
         
-    if current_user.role == "vendor" and vendor_id != current_user.vendor_profile.vendor_id:
+    if current_user.role == "vendor" and vendor_id != current_user.vendor_id:
         return HTTPException(status_code=403, detail="Not the correct vendor")
 
     today = datetime.now().date()
@@ -134,7 +140,7 @@ def customer_list_bundles(
                   )
     )
 
-    rows = session.exec(statement).all()
+    rows = (await session.exec(statement)).all()
     count = len(rows)
 
     templates = [
@@ -163,7 +169,7 @@ def customer_list_bundles(
 @router.post("/upload-image", tags=["Vendors"], summary="Post an image to be stored on the server and set it to be the Vendor photo")
 async def upload_image(
     image: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     session: Session = Depends(get_session)
     ):
     # If the image is malformed, throw a 400 error
@@ -178,16 +184,17 @@ async def upload_image(
     with open(file_location, "wb") as buffer:
         shutil.copyfileobj(image.file, buffer)
 
-    if not current_user.vendor_profile:
+    vendor = session.get(Vendor, current_user.vendor_id) if current_user.vendor_id else None
+    if not vendor:
         raise HTTPException(status_code=400, detail="User is not a vendor")
     
     # Set the vendor photo to the saved filepath
-    current_user.vendor_profile.photo = f"/static/{unique_filename}"
+    vendor.photo = f"/static/{unique_filename}"
 
     try:
-        session.add(current_user.vendor_profile)
+        session.add(vendor)
         session.commit()
-        return {"status": "success", "image_url": current_user.vendor_profile.photo}
+        return {"status": "success", "image_url": vendor.photo}
     except Exception as e:
         session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
@@ -196,47 +203,37 @@ async def upload_image(
         raise HTTPException(status_code=500, detail=str(e))
     
     
-@router.get("", response_model= VendorList, tags=["Vendors"],summary="Gets all the Vendors for Customer View")
-def get_all_vendors(
-    session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
-    ):
+# the vendor list shown to customers, with the number of bundles available today
+# shared by the full list and the nearby search
+# the counts come from the vendor_listing read model (see core/vendor_listing.py) instead of aggregating every bundle,
+# the bundles available today are the vendors posted_count less the reserves counted on their reserved shards for today
+def vendor_list_statement():
     today = datetime.now().date()
-    # get all vendors 
-    statement = ( 
+    reserved = (
+        select(Vendor_Listing_Reserved.vendor_id, func.sum(Vendor_Listing_Reserved.reserved_count).label("reserved_count"))
+        .where(Vendor_Listing_Reserved.date == today)
+        .group_by(Vendor_Listing_Reserved.vendor_id)
+        .subquery()
+    )
+    available = func.coalesce(Vendor_Listing.posted_count, 0) - func.coalesce(reserved.c.reserved_count, 0)
+    return ( 
         select(
             Vendor.vendor_id,
             Vendor.name,
             Vendor.photo,
             Vendor.post_code,
-            func.count(case((
-                and_( # count all the correct bundles 
-                        Bundle.picked_up.is_(False),
-                        Reservation.bundle_id.is_(None),
-                        Bundle.date == today
-                    ),
-                    Bundle.bundle_id
-            ))).label("bundle_count"),
-            func.count(case((Template.is_vegan == True, Bundle.bundle_id))).label("has_vegan"),
-            func.count(case((Template.is_vegetarian == True, Bundle.bundle_id))).label("has_vegetarian")
+            available.label("bundle_count"),
+            func.coalesce(Vendor_Listing.vegan_count, 0).label("has_vegan"),
+            func.coalesce(Vendor_Listing.vegetarian_count, 0).label("has_vegetarian")
         )
-        .outerjoin(Template,Template.vendor == Vendor.vendor_id)
-        .outerjoin(Bundle, Bundle.template_id == Template.template_id)
-        .outerjoin(Reservation, Bundle.bundle_id == Reservation.bundle_id)
+        .outerjoin(Vendor_Listing, and_(Vendor_Listing.vendor_id == Vendor.vendor_id, Vendor_Listing.date == today))
+        .outerjoin(reserved, reserved.c.vendor_id == Vendor.vendor_id)
         .where(Vendor.validated == True)
-        .group_by(
-                Vendor.vendor_id,
-                Vendor.name, # count the number of bundles per vendor
-                Vendor.post_code,
-                Vendor.photo 
-                )
     )
 
-    rows = session.exec(statement).all()
-    count = len(rows)
-
-    vendors = [
-    {
+# converts a row of the statement above into the json format expected
+def vendor_list_item(row) -> dict:
+    return {
         "vendor_id": row.vendor_id,
         "name": row.name,
         "photo": row.photo,
@@ -245,17 +242,75 @@ def get_all_vendors(
         "has_vegan": bool(row.has_vegan),
         "has_vegetarian": bool(row.has_vegetarian)
     }
-    for row in rows # this loops through and converts the rows into the json format expected 
-    ]  
 
-    if count ==0:
+@router.get("", response_model= VendorList, tags=["Vendors"],summary="Gets all the Vendors for Customer View")
+async def get_all_vendors(
+    page: Page = Depends(page_params),
+    session: AsyncSession = Depends(get_async_session),
+    current_user = Depends(get_current_principal_async)
+    ):
+    # get all vendors 
+    statement = vendor_list_statement()
+    rows, next_cursor = page_items((await session.exec(paginate(statement, Vendor.vendor_id, page))).all(), Vendor.vendor_id, page)
+
+    return {
+        "total_count": await count_rows_async(session, statement) if page.include_total else None,
+        "next_cursor": next_cursor,
+        "vendors":[vendor_list_item(row) for row in rows]
+    }
+
+# has to be above /{vendor_id} so "nearby" isn't read as a vendor id
+@router.get("/nearby", response_model=NearbyVendorList, tags=["Vendors"], summary="Gets the Vendors within a radius of the Customer, closest first")
+async def get_nearby_vendors(
+    radius_km: float = Query(default=10, gt=0, le=1000),
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0),
+    session: AsyncSession = Depends(get_async_session),
+    current_user = Depends(get_current_principal_async)
+    ):
+    if current_user.role != "customer":
+        raise HTTPException(status_code=403, detail="Not a customer account")
+
+    customer = await session.get(Customer, current_user.customer_id) if current_user.customer_id else None
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer profile not found")
+
+    # the first lookup may have to load (or download) the postcode index, so it is kept off the event loop
+    latitude, longitude = (customer.latitude, customer.longitude) if customer.latitude is not None else await run_in_threadpool(lookup_postcode, customer.post_code)
+    if latitude is None:
+        raise HTTPException(status_code=404, detail="Could not find the location of that postcode")
+
+    # ix_vendor_lat_cell_longitude cuts the search down to a box around the customer, one range of longitude in each
+    # band of latitude the box covers, only the vendors inside it are counted and measured
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+    statement = (
+        vendor_list_statement()
+        .add_columns(Vendor.latitude, Vendor.longitude)
+        .where(Vendor.lat_cell.in_(lat_cells(min_lat, max_lat)),
+               Vendor.longitude.between(min_lon, max_lon),
+               Vendor.latitude.between(min_lat, max_lat))
+    )
+    rows = (await session.exec(statement)).all()
+
+    if not rows:
         return {
             "total_count":0,
             "vendors":[]
         }
 
+    # exact distances for the whole box in one go, then drop the corners outside the radius
+    distances = haversine_km(latitude, longitude,
+                             np.array([row.latitude for row in rows]),
+                             np.array([row.longitude for row in rows]))
+    order = [i for i in np.argsort(distances, kind="stable") if distances[i] <= radius_km]
+
+    vendors = [
+        {**vendor_list_item(rows[i]), "distance_km": float(distances[i])}
+        for i in order[offset:offset + limit]
+    ]
+
     return {
-        "total_count":count,
+        "total_count":len(order),
         "vendors":vendors
     }
 
@@ -263,7 +318,7 @@ def get_all_vendors(
 def get_vendor_public_profile(
     vendor_id: int,
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_principal)
 ):
     vendor = session.get(Vendor, vendor_id)
     if not vendor:
@@ -275,7 +330,7 @@ def get_vendor_public_profile(
 def get_dist_to_vendor(
     vendor_id: int,
     session: Session = Depends(get_session),
-    current_user = Depends(get_current_user),
+    current_user = Depends(get_current_principal),
     useMiles : bool = False
     ):
 
@@ -283,7 +338,8 @@ def get_dist_to_vendor(
     if current_user.role != "customer":
         raise HTTPException(status_code=403, detail="Not a customer account")
         
-    if not current_user.customer_profile:
+    customer = session.get(Customer, current_user.customer_id) if current_user.customer_id else None
+    if not customer:
         raise HTTPException(status_code=404, detail="Customer profile not found")
 
 
@@ -291,12 +347,16 @@ def get_dist_to_vendor(
     if not vendor:
         raise HTTPException(status_code=404, detail="Vendor not found")
 
-    postcodeConvertor = Nominatim(user_agent="postcode_distance")
+    # coordinates are stored at registration, profiles made before that are looked up in the local index
+    user_lat, user_lon = (customer.latitude, customer.longitude) if customer.latitude is not None else lookup_postcode(customer.post_code)
+    vendor_lat, vendor_lon = (vendor.latitude, vendor.longitude) if vendor.latitude is not None else lookup_postcode(vendor.post_code)
+
+    if user_lat is None or vendor_lat is None:
+        raise HTTPException(status_code=404, detail="Could not find the location of that postcode")
 
-    userLoc = postcodeConvertor.geocode(current_user.customer_profile.post_code)
-    vendorLoc = postcodeConvertor.geocode(vendor.post_code)
+    dist = float(haversine_km(user_lat, user_lon, vendor_lat, vendor_lon))
     
     if useMiles:
-        return distance.distance((userLoc.latitude, userLoc.longitude), (vendorLoc.latitude, vendorLoc.longitude)).miles
+        return dist / KM_PER_MILE
     else:
-        return distance.distance((userLoc.latitude, userLoc.longitude), (vendorLoc.latitude, vendorLoc.longitude)).km
+        return dist
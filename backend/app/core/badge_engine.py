@@ -0,0 +1,115 @@
+from bisect import bisect_right
+from threading import Lock
+from typing import Optional
+from sqlmodel import Session, select, insert, update, func
+from app.models import Badge, User_Badge, Customer, Reservation, Streak
+
+# this module awards customer badges
+# the customer keeps a running value for every metric a badge can track (bundles_saved and streak_count are
+# counters kept up to date when a reservation is finalised, the rest were already totals on the customer)
+# the badges are held in memory sorted by threshold for each metric, so finding what a customer has earned
+# is a bisect per metric instead of loading every badge and counting reservations
+
+
+# the value of each metric for a customer
+def customer_metrics(customer: Customer) -> dict[str, float]:
+    return {
+        "carbon_saved": customer.carbon_saved,
+        "food_saved": customer.food_saved,
+        "money_saved": customer.money_saved,
+        "bundles_saved": customer.bundles_saved,
+        "streak_count": customer.streak_count,
+    }
+
+
+class BadgeIndex:
+    """metric -> badge thresholds in ascending order with the badge ids in the same order"""
+
+    def __init__(self, badges: list[Badge]):
+        self.thresholds: dict[str, list[float]] = {}
+        self.badge_ids: dict[str, list[int]] = {}
+        for badge in sorted(badges, key=lambda b: (b.metric, b.threshold)):
+            self.thresholds.setdefault(badge.metric, []).append(badge.threshold)
+            self.badge_ids.setdefault(badge.metric, []).append(badge.badge_id)
+
+    def earned(self, metric: str, value: float) -> list[int]:
+        """ids of every badge for the metric whose threshold value has reached"""
+        thresholds = self.thresholds.get(metric)
+        if not thresholds:
+            return []
+        return self.badge_ids[metric][:bisect_right(thresholds, value)]
+
+
+_index: Optional[BadgeIndex] = None
+_lock = Lock()
+
+
+def get_badge_index(session: Session) -> BadgeIndex:
+    """the customer badges, loaded from the db the first time they are needed"""
+    global _index
+    with _lock:
+        if _index is None:
+            _index = BadgeIndex(session.exec(select(Badge).where(Badge.user_role == "customer")).all())
+        return _index
+
+
+def invalidate_badge_index():
+    # call after adding or changing badges so they are reloaded
+    global _index
+    with _lock:
+        _index = None
+
+
+def award_badges(session: Session, customer: Customer) -> list[int]:
+    """
+    gives the customer every badge their metrics have reached that they don't have yet
+    the new badges are added in one insert inside the callers transaction, returns their ids
+    """
+    index = get_badge_index(session)
+
+    earned = set()
+    for metric, value in customer_metrics(customer).items():
+        earned.update(index.earned(metric, value))
+    if not earned:
+        return []
+
+    owned = set(session.exec(
+        select(User_Badge.badge_id)
+        .where(User_Badge.user_id == customer.user_id, User_Badge.badge_id.in_(earned))
+    ).all())
+    new_badges = sorted(earned - owned)
+
+    if new_badges:
+        session.exec(insert(User_Badge).values([{"user_id": customer.user_id, "badge_id": badge_id} for badge_id in new_badges]))
+    return new_badges
+
+
+def recount_customer_metrics(session: Session):
+    """
+    recalculates the bundles_saved and streak_count counters of every customer from the reservations and streaks
+    only needed for databases made before the counters existed
+    """
+    collected = (
+        select(func.count(Reservation.reservation_id))
+        .where(Reservation.customer_id == Customer.customer_id, Reservation.status == "collected")
+        .scalar_subquery()
+    )
+    streak = (
+        select(func.coalesce(func.max(Streak.count), 0))
+        .where(Streak.customer_id == Customer.customer_id, Streak.ended.is_(False))
+        .scalar_subquery()
+    )
+    session.exec(update(Customer).values(bundles_saved=collected, streak_count=streak))
+    session.commit()
+
+
+if __name__ == "__main__":
+    # python -m app.core.badge_engine
+    # fills the counters for an existing database then awards any badges customers have already earned
+    from app.core.database import engine
+
+    with Session(engine) as session:
+        recount_customer_metrics(session)
+        awarded = sum(len(award_badges(session, customer)) for customer in session.exec(select(Customer)).all())
+        session.commit()
+        print(f"{awarded} badges awarded")
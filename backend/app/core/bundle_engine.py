@@ -0,0 +1,69 @@
+from fastapi import HTTPException
+from sqlmodel import Session, select, func, literal
+from app.models import Bundle, Template
+from app.core.vendor_listing import bundles_posted
+from datetime import datetime
+
+# this module posts bundles for a vendor
+# instead of building an ORM object and an INSERT for every bundle, postgres makes all of a templates bundles in one
+# INSERT ... SELECT FROM generate_series, other databases get one executemany of a plain insert which sqlalchemy
+# batches into multi row INSERT ... VALUES statements
+# everything happens inside the callers transaction so the bundles and the vendor list counts are committed together
+
+MAX_BUNDLES_PER_REQUEST = 10000
+
+
+def insert_bundles_statement(dialect_name: str, template_id: int, amount: int, now: datetime):
+    """
+    the insert for amount bundles of the template and its parameters, returns the new bundle ids
+    every bundle posted in one request gets the same date and time
+    """
+    # the table rather than the model so the session sends it as is, without the ORM bulk insert bookkeeping
+    table = Bundle.__table__
+    if dialect_name == "postgresql":
+        rows = (
+            select(literal(template_id), literal(False), literal(now.date()), literal(now.time()))
+            .select_from(func.generate_series(1, amount))
+        )
+        return table.insert().from_select(["template_id", "picked_up", "date", "time"], rows).returning(table.c.bundle_id), None
+
+    rows = [{"template_id": template_id, "picked_up": False, "date": now.date(), "time": now.time()}] * amount
+    return table.insert().returning(table.c.bundle_id, sort_by_parameter_order=True), rows
+
+
+def post_bundles(session: Session, vendor_id: int, amounts: dict[int, int]) -> list[dict]:
+    """
+    creates amount bundles for each template_id in amounts, all of which must belong to the vendor
+    raises the same HTTP errors the create endpoint has always returned
+    returns the amount and first/last bundle id for each template, the ids are ascending but only contiguous
+    if no other vendor was posting at the same time
+    """
+    if sum(amounts.values()) > MAX_BUNDLES_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"Can't create more than {MAX_BUNDLES_PER_REQUEST} bundles at once")
+    if any(amount < 1 for amount in amounts.values()):
+        raise HTTPException(status_code=400, detail="Amount must be at least 1")
+
+    # every template checked in one query
+    templates = {template.template_id: template for template in session.exec(
+        select(Template).where(Template.template_id.in_(amounts.keys()))
+    ).all()}
+
+    if len(templates) != len(amounts): # no template
+        raise HTTPException(status_code=400, detail="No corresponding template")
+    if any(template.vendor != vendor_id for template in templates.values()): # wrong vendor
+        raise HTTPException(status_code=403, detail="You are not the vendor of the template")
+
+    dialect_name = session.get_bind().dialect.name
+    now = datetime.now()
+    created = []
+    for template_id, amount in amounts.items():
+        statement, params = insert_bundles_statement(dialect_name, template_id, amount, now)
+        bundle_ids = session.exec(statement, params=params).scalars().all()
+        bundles_posted(session, templates[template_id], now.date(), amount)
+        created.append({
+            "template_id": template_id,
+            "amount": len(bundle_ids),
+            "first_bundle_id": min(bundle_ids, default=None),
+            "last_bundle_id": max(bundle_ids, default=None),
+        })
+    return created
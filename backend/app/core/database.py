@@ -1,11 +1,22 @@
 import os
 from dotenv import load_dotenv
 from sqlmodel import SQLModel, create_engine, Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy import inspect, text
+from alembic import command
+from alembic.config import Config
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from threading import Lock
+import time
 from app.models import *
+from app.core.badge_engine import invalidate_badge_index
 
 # Main functions relating to database functionality
 
-# Running this file *SHOULD will drop all tables, allowing a reset when attributes for functions change 
+# Running this file will drop all tables and migrate a fresh schema, allowing a reset when the models change
 
 # GLOBAL
 # the code outside the functions will run once on start up when the file is imported (typically create_db_and_tables)
@@ -18,7 +29,150 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("No DATABASE_URL found in environment variables")
 
-engine = create_engine(DATABASE_URL, echo=True)
+# async drivers used in place of the sync ones for the async engine
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def get_async_database_url(url: str) -> str:
+    """swaps the sync driver in a database url for the async driver of the same database"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend} databases")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+# connection pool settings, all optional in the .env file
+# size the pool so that (pool size + overflow) * uvicorn workers stays under the postgres max_connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30")) # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800")) # seconds before a connection is replaced, -1 to never recycle
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0")) # 0 means no timeout
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() # false, true (log sql) or debug (log sql and rows)
+
+
+def get_echo(level: str) -> bool | str:
+    """converts the DB_ECHO setting into the value create_engine expects"""
+    if level == "debug":
+        return "debug"
+    return level == "true"
+
+
+class PoolWaitStats:
+    """running totals of how long checkouts have waited for a connection"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, waited: float, timed_out: bool = False):
+        with self.lock:
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            if timed_out:
+                self.timeouts += 1
+
+
+class PoolWaitMixin:
+    """records the time spent waiting for a connection on every checkout from the pool"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.wait_stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.wait_stats.record(time.perf_counter() - start)
+        return connection
+
+class TimedQueuePool(PoolWaitMixin, QueuePool):
+    pass
+
+class TimedAsyncQueuePool(PoolWaitMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """builds the keyword arguments for create_engine/create_async_engine from the settings above"""
+    options = {
+        "echo": get_echo(DB_ECHO),
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+    # sqlite picks its own pool and has no server side settings, so only the above apply
+    if make_url(url).get_backend_name() == "sqlite":
+        return options
+
+    options.update({
+        "poolclass": TimedAsyncQueuePool if is_async else TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+    })
+
+    # the statement timeout is set per connection, each driver takes it in a different way
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        if is_async:
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+
+    return options
+
+
+def create_db_engine(url: str):
+    return create_engine(url, **engine_options(url))
+
+def create_async_db_engine(url: str):
+    async_url = get_async_database_url(url)
+    return create_async_engine(async_url, **engine_options(async_url, is_async=True))
+
+
+def get_pool_stats(pool) -> dict:
+    """current state of a connection pool, used to size the pool against the number of workers"""
+    stats = {
+        "pool": pool.__class__.__name__,
+        "size": pool.size() if hasattr(pool, "size") else 0,
+        "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else 0,
+        "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else 0,
+        # overflow is negative while the pool hasn't been filled yet
+        "overflow": max(pool.overflow(), 0) if hasattr(pool, "overflow") else 0,
+        "max_overflow": getattr(pool, "_max_overflow", 0),
+        "checkouts": 0,
+        "timeouts": 0,
+        "avg_wait_ms": 0.0,
+        "max_wait_ms": 0.0,
+    }
+
+    wait_stats = getattr(pool, "wait_stats", None)
+    if wait_stats and wait_stats.checkouts:
+        stats.update({
+            "checkouts": wait_stats.checkouts,
+            "timeouts": wait_stats.timeouts,
+            "avg_wait_ms": round(wait_stats.total_wait / wait_stats.checkouts * 1000, 3),
+            "max_wait_ms": round(wait_stats.max_wait * 1000, 3),
+        })
+    return stats
+
+
+# the sync engine is kept for scripts (seeding, forecasting, training) and the routes that are still sync
+engine = create_db_engine(DATABASE_URL)
+
+# the async engine is used by the async routes so they don't hold a threadpool slot while waiting on the db
+async_engine = create_async_db_engine(DATABASE_URL)
 
 DEFAULT_ALLERGENS = [
     "Celery", "Gluten", "Crustaceans", "Eggs", "Fish", "Lupin", 
@@ -76,11 +230,35 @@ def seed_badges():
                 badge = Badge(**badge_data)
                 session.add(badge)
             session.commit()
+            invalidate_badge_index()
             print("Badges successfully seeded.")
 
+# the schema is managed by alembic, the revisions are in backend/migrations/versions
+# after changing app/models.py make a new revision with (from backend):
+#   alembic revision --autogenerate -m "what changed" --rev-id <next number>
+# check the generated file then it is applied on the next start up (or with alembic upgrade head)
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), "..", "..", "alembic.ini")
+BASELINE_REVISION = "0001" # the schema as it was before migrations were added
+PRE_MIGRATION_REVISION = "0002" # the schema create_all made just before migrations, it has the vendor_listing table
+
+def alembic_config() -> Config:
+    return Config(os.path.abspath(ALEMBIC_INI))
+
+def run_migrations():
+    """brings the database up to the latest revision"""
+    config = alembic_config()
+    with engine.begin() as connection:
+        config.attributes["connection"] = connection # so alembic runs in this transaction
+        tables = inspect(connection).get_table_names()
+        # databases made with create_all before migrations existed have tables but no alembic_version
+        # they are marked with the revision their tables match so only the newer revisions run
+        if "alembic_version" not in tables and "user" in tables:
+            command.stamp(config, PRE_MIGRATION_REVISION if "vendor_listing" in tables else BASELINE_REVISION)
+        command.upgrade(config, "head")
+
 # connects to the db using the parts declared 
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+    run_migrations()
     # seeds the allergens on table creation
     seed_allergens()
     seed_badges()
@@ -90,12 +268,20 @@ def get_session():
     with Session(engine) as session:
         yield session
 
+# used on the async api calls using the db
+# objects are not expired on commit as lazy loading them again isn't possible outside of an await
+async def get_async_session():
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
 # drops all tables
 def reset_db():
     print("Dropping all tables")
     SQLModel.metadata.drop_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS alembic_version"))
     print("Creating new tables")
-    SQLModel.metadata.create_all(engine)
+    run_migrations()
     
 if __name__ == "__main__":
     reset_db()
\ No newline at end of file
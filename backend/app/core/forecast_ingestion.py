@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+from app.models import Forecast_Sync, Vendor
+from app.core.database import engine
+from app.forecasting.database_creation.generate_input_forecasts import sync_forecast_inputs
+
+# keeps forecast_input up to date in the background so the analytics endpoints only ever read it
+# every FORECAST_SYNC_INTERVAL seconds each vendors days (within the last FORECAST_SYNC_DAYS_BACK) that changed since
+# their high water mark are ingested again, a vendor without a mark gets the whole window
+# the time the vendors run started is stored in forecast_sync, it is both the mark and the freshness the analytics report
+# a run that changes any of the vendors forecast inputs also stores its start as changed_at, which the forecast cache
+# (forecasting/forecast_cache.py) keys on
+# the loop only runs in the app when FORECAST_SYNC_IN_APP is set, otherwise every uvicorn worker would run its own and
+# they would all redo the same vendors, by default run this module on a schedule instead (or set it on one worker)
+
+FORECAST_SYNC_IN_APP = os.getenv("FORECAST_SYNC_IN_APP", "false").lower() == "true"
+FORECAST_SYNC_INTERVAL = float(os.getenv("FORECAST_SYNC_INTERVAL", "900")) # seconds between the in app runs
+FORECAST_SYNC_DAYS_BACK = int(os.getenv("FORECAST_SYNC_DAYS_BACK", "42")) # the window the analytics look at
+# changes stamped just before a run started can still be uncommitted while it reads, so each run looks back this far
+FORECAST_SYNC_OVERLAP = timedelta(minutes=5)
+
+logger = logging.getLogger(__name__)
+
+
+def mark_synced_statement(dialect_name: str, vendor_id: int, synced_at: datetime, changed: bool = True):
+    """the vendors first mark counts as a change, later ones only move changed_at when changed is set"""
+    insert_for_dialect = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    statement = insert_for_dialect(Forecast_Sync).values(vendor_id=vendor_id, synced_at=synced_at, changed_at=synced_at)
+    set_ = {"synced_at": statement.excluded.synced_at}
+    if changed:
+        set_["changed_at"] = statement.excluded.changed_at
+    return statement.on_conflict_do_update(index_elements=["vendor_id"], set_=set_)
+
+
+def last_synced(session: Session, vendor_id: int) -> Optional[datetime]:
+    """when the vendors forecast inputs were last brought up to date, None if they never have been"""
+    return session.exec(select(Forecast_Sync.synced_at).where(Forecast_Sync.vendor_id == vendor_id)).first()
+
+
+def ingest_forecast_inputs(session: Session, vendor_ids: Optional[Iterable[int]] = None,
+                           days_back: int = FORECAST_SYNC_DAYS_BACK, full: bool = False) -> list[int]:
+    """
+    syncs the forecast inputs of the vendors (every vendor if vendor_ids is None) one at a time, only the days
+    changed since the vendors last sync unless full is set
+    a vendor that fails is rolled back and logged without stopping the others
+    returns the ids of the vendors that failed
+    """
+    if vendor_ids is None:
+        vendor_ids = session.exec(select(Vendor.vendor_id)).all()
+    marks = {} if full else dict(session.exec(select(Forecast_Sync.vendor_id, Forecast_Sync.synced_at)).all())
+
+    dialect_name = session.get_bind().dialect.name
+    failed = []
+    for vendor_id in vendor_ids:
+        # taken before reading so anything that changes during the sync is newer than the mark
+        started = datetime.now()
+        since = marks[vendor_id] - FORECAST_SYNC_OVERLAP if vendor_id in marks else None
+        try:
+            written = sync_forecast_inputs(session, vendor_id, days_back, since)
+            session.exec(mark_synced_statement(dialect_name, vendor_id, started, changed=written > 0))
+            session.commit()
+        except Exception:
+            session.rollback()
+            logger.exception("forecast input ingestion failed for vendor %s", vendor_id)
+            failed.append(vendor_id)
+    return failed
+
+
+def ingest_all_vendors(full: bool = False) -> list[int]:
+    with Session(engine) as session:
+        return ingest_forecast_inputs(session, full=full)
+
+
+async def forecast_ingestion_loop(interval: float = FORECAST_SYNC_INTERVAL):
+    """runs the ingestion straight away and then every interval seconds until the app shuts down"""
+    while True:
+        try:
+            # the sync is blocking database work, it runs in a thread so requests keep being served
+            await asyncio.to_thread(ingest_all_vendors)
+        except Exception:
+            logger.exception("forecast input ingestion failed")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+
+    # python -m app.core.forecast_ingestion [--full]
+    # one ingestion run for every vendor, eg. from a cron job every FORECAST_SYNC_INTERVAL seconds
+    # --full redoes every day in the window instead of only the changed ones
+
+    parser = argparse.ArgumentParser(description="sync the forecast inputs of every vendor")
+    parser.add_argument("--full", action="store_true")
+    args = parser.parse_args()
+
+    failed = ingest_all_vendors(full=args.full)
+    print(f"forecast inputs synced, {len(failed)} vendors failed: {failed}")
@@ -0,0 +1,148 @@
+import logging
+import math
+import os
+import time
+import numpy as np
+import pandas as pd
+import pgeocode
+from threading import Lock
+from typing import Optional
+from sqlmodel import Session, select, or_
+from app.models import Vendor, Customer
+
+# this module turns postcodes into coordinates without calling a geocoding service
+# the GB dataset from pgeocode is loaded into a dictionary once per process (it is downloaded and cached on disk
+# by pgeocode the first time), after that every lookup is a dictionary access
+# the dataset only has the outward code (the "EX4" of "EX4 4QJ") so coordinates are the centre of that area
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_MILE = 1.609344
+LOAD_RETRY_SECONDS = 300 # how long to wait before trying to load the dataset again after it failed
+LAT_CELL_DEGREES = 0.1 # height of a band of latitude, about 11km
+
+logger = logging.getLogger(__name__)
+
+
+def outward_code(postcode: str) -> str:
+    """the first half of a uk postcode, the inward code is always the last 3 characters"""
+    parsed = postcode.upper().replace(" ", "")
+    return parsed[:-3] if len(parsed) > 4 else parsed
+
+
+class PostcodeIndex:
+    """outward code -> (latitude, longitude)"""
+
+    def __init__(self, coordinates: Optional[dict[str, tuple[float, float]]] = None):
+        self.coordinates = coordinates or {}
+
+    @classmethod
+    def from_pgeocode(cls) -> "PostcodeIndex":
+        # pgeocode downloads the dataset into its cache the first time and writes GB-index.txt next to it,
+        # one row per outward code, which is read here rather than through its private data frame
+        pgeocode.Nominatim('GB')
+        data = pd.read_csv(os.path.join(pgeocode.STORAGE_DIR, "GB-index.txt"),
+                           usecols=["postal_code", "latitude", "longitude"],
+                           dtype={"postal_code": str}, keep_default_na=False, na_values=[""])
+        data = data.dropna(subset=["latitude", "longitude"])
+        return cls(dict(zip(data.postal_code.str.upper(), zip(data.latitude.astype(float), data.longitude.astype(float)))))
+
+    def lookup(self, postcode: str) -> tuple[Optional[float], Optional[float]]:
+        return self.coordinates.get(outward_code(postcode), (None, None))
+
+    def __len__(self):
+        return len(self.coordinates)
+
+
+_index: Optional[PostcodeIndex] = None
+_last_attempt: Optional[float] = None
+_lock = Lock()
+
+
+def get_postcode_index() -> PostcodeIndex:
+    """
+    the process wide postcode index, loaded on first use
+    if the dataset can't be loaded (eg. no network for the first download) an empty index is returned
+    and loading is retried after LOAD_RETRY_SECONDS
+    """
+    global _index, _last_attempt
+    with _lock:
+        if _index is None and (_last_attempt is None or time.monotonic() - _last_attempt >= LOAD_RETRY_SECONDS):
+            _last_attempt = time.monotonic()
+            try:
+                _index = PostcodeIndex.from_pgeocode()
+            except Exception:
+                logger.exception("could not load the postcode index")
+        return _index if _index is not None else PostcodeIndex()
+
+
+def lookup_postcode(postcode: str) -> tuple[Optional[float], Optional[float]]:
+    """(latitude, longitude) of a postcode, or (None, None) if it isn't in the index"""
+    return get_postcode_index().lookup(postcode)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    great circle distance in km between two points or between arrays of points
+    the arguments can be floats or numpy arrays (which are broadcast), so one point
+    can be measured against many in a single call
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> tuple[float, float, float, float]:
+    """
+    (min_lat, max_lat, min_lon, max_lon) of a box containing every point within radius_km
+    used to narrow a search down with the vendor index before measuring exact distances
+    """
+    lat_delta = np.degrees(radius_km / EARTH_RADIUS_KM)
+    lon_delta = lat_delta / max(np.cos(np.radians(latitude)), 1e-6) # degrees of longitude shrink away from the equator
+    return (float(latitude - lat_delta), float(latitude + lat_delta),
+            float(longitude - lon_delta), float(longitude + lon_delta))
+
+
+def lat_cell(latitude: Optional[float]) -> Optional[int]:
+    """
+    the band of latitude a point is in, stored on each vendor so the nearby search is a few index range scans
+    (one range of longitude per band) instead of a range over every vendor between the two latitudes
+    """
+    return math.floor(latitude / LAT_CELL_DEGREES) if latitude is not None else None
+
+
+def lat_cells(min_lat: float, max_lat: float) -> list[int]:
+    """every band between two latitudes"""
+    return list(range(lat_cell(min_lat), lat_cell(max_lat) + 1))
+
+
+def fill_missing_coordinates(session: Session) -> int:
+    """
+    stores coordinates for vendors and customers that were registered without them
+    (before coordinates were stored, or while the index couldn't be loaded)
+    returns how many profiles were updated
+    """
+    updated = 0
+    # vendors with coordinates from before the bands were stored
+    for vendor in session.exec(select(Vendor).where(Vendor.latitude != None, Vendor.lat_cell == None)).all():
+        vendor.lat_cell = lat_cell(vendor.latitude)
+        session.add(vendor)
+        updated += 1
+
+    index = get_postcode_index()
+    if len(index) == 0:
+        session.commit()
+        return updated
+
+    for model in (Vendor, Customer):
+        profiles = session.exec(select(model).where(or_(model.latitude == None, model.longitude == None))).all()
+        for profile in profiles:
+            latitude, longitude = index.lookup(profile.post_code)
+            if latitude is not None:
+                profile.latitude, profile.longitude = latitude, longitude
+                if model is Vendor:
+                    profile.lat_cell = lat_cell(latitude)
+                session.add(profile)
+                updated += 1
+
+    session.commit()
+    return updated
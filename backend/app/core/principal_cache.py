@@ -0,0 +1,67 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# this module caches who a token belongs to so authorization checks don't need the database
+# every uvicorn worker has its own cache, the ttl bounds how long a deleted account can stay cached in another worker
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60")) # seconds
+
+
+@dataclass(frozen=True)
+class Principal:
+    """the slim, read only view of the logged in user that handlers use for authorization"""
+    user_id: int
+    role: str
+    vendor_id: Optional[int] = None
+    customer_id: Optional[int] = None
+
+
+class PrincipalCache:
+    """
+    least recently used cache of principals keyed by the jwt subject (the user id)
+    entries expire after ttl seconds so changes made by other workers are picked up
+    """
+
+    def __init__(self, maxsize: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, Principal]] = OrderedDict()
+        self._lock = Lock() # sync routes run in a threadpool
+
+    def get(self, key: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, principal = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return principal
+
+    def set(self, key: str, principal: Principal):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False) # drop the least recently used
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache()
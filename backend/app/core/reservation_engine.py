@@ -0,0 +1,138 @@
+from fastapi import HTTPException
+from sqlmodel import Session, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.models import Bundle, Customer, Reservation, Template
+from app.core.vendor_listing import reserved_delta_statement
+from datetime import datetime
+from random import randint
+
+# this module handles claiming a bundle for a customer
+# everything happens inside the callers transaction so the bundle claim, the credit debit and the new reservation
+# are either all committed or all rolled back together
+# the bundle is counted as reserved on one of the vendors vendor_listing_reserved shards in the same transaction, not on
+# the vendors vendor_listing row which every reserve would have to lock (see core/vendor_listing.py)
+# the statements are shared between the sync path (scripts, benchmarks) and the async path (the api)
+
+
+def claim_statement(template_id: int, customer_id: int):
+    """
+    atomically marks one of todays unreserved bundles for the template as bought by the customer
+    the inner select locks the row it picks with FOR UPDATE SKIP LOCKED so concurrent
+    requests each grab a different bundle instead of queueing on the same one
+    returns the claimed bundle id with the templates cost and vendor, or no row if there are none left
+    """
+
+    # the candidate bundle, rows already locked by another request are skipped rather than waited on
+    # (sqlite ignores the lock but only allows one writer at a time anyway)
+    candidate = (
+        select(Bundle.bundle_id)
+        .where(Bundle.template_id == template_id,
+               Bundle.date == datetime.now().date(),
+               Bundle.purchased_by == None)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+
+    # the templates cost and vendor come back with the bundle rather than being looked up afterwards
+    cost = select(Template.cost).where(Template.template_id == Bundle.template_id).scalar_subquery()
+    vendor = select(Template.vendor).where(Template.template_id == Bundle.template_id).scalar_subquery()
+
+    # purchased_by is rechecked in the outer update so a bundle can never be handed out twice
+    return (
+        update(Bundle)
+        .where(Bundle.bundle_id == candidate, Bundle.purchased_by == None)
+        .values(purchased_by=customer_id)
+        .returning(Bundle.bundle_id, cost, vendor)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def debit_statement(customer_id: int, amount: float):
+    """
+    takes amount off the customers store credit in one statement
+    the balance check is part of the update so two reservations can't both spend the same credit
+    returns no row if the customer doesn't have enough credit
+    """
+    return (
+        update(Customer)
+        .where(Customer.customer_id == customer_id, Customer.store_credit >= amount)
+        .values(store_credit=Customer.store_credit - amount)
+        .returning(Customer.customer_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def reserve_bundle(session: Session, template_id: int, customer_id: int) -> Reservation:
+    """
+    claims a bundle, debits the customer and creates the reservation in a single transaction
+    raises the same HTTP errors the reserve endpoint has always returned
+    """
+    try:
+        claimed = session.exec(claim_statement(template_id, customer_id)).one_or_none()
+
+        # If no bundles left, return status error
+        if claimed is None:
+            raise HTTPException(status_code=404, detail="No bundle found for that template on the current day")
+        bundle_id, cost, vendor_id = claimed
+        if cost is None:
+            raise HTTPException(status_code=403, detail="Template behind reservation not found")
+
+        if session.exec(debit_statement(customer_id, cost)).scalar_one_or_none() is None:
+            # only look the customer up on the failure path to give the right error
+            if not session.get(Customer, customer_id):
+                raise HTTPException(status_code=403, detail="Customer not found")
+            raise HTTPException(status_code=403, detail="Customer does not have enough credit to purchase")
+
+        session.exec(reserved_delta_statement(session.get_bind().dialect.name, vendor_id, datetime.now().date(), bundle_id, 1))
+        new_reservation = Reservation(bundle_id=bundle_id,
+                                      customer_id=customer_id,
+                                      code=randint(0, 9999))
+        session.add(new_reservation)
+        session.commit()
+
+    except HTTPException:
+        session.rollback() # releases the claimed bundle and any debit
+        raise
+    except Exception as e:
+        session.rollback() # If anything fails
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return new_reservation
+
+
+async def reserve_bundle_async(session: AsyncSession, template_id: int, customer_id: int) -> Reservation:
+    """
+    async version of reserve_bundle used by the reserve endpoint
+    """
+    try:
+        claimed = (await session.exec(claim_statement(template_id, customer_id))).one_or_none()
+
+        # If no bundles left, return status error
+        if claimed is None:
+            raise HTTPException(status_code=404, detail="No bundle found for that template on the current day")
+        bundle_id, cost, vendor_id = claimed
+        if cost is None:
+            raise HTTPException(status_code=403, detail="Template behind reservation not found")
+
+        if (await session.exec(debit_statement(customer_id, cost))).scalar_one_or_none() is None:
+            # only look the customer up on the failure path to give the right error
+            if not await session.get(Customer, customer_id):
+                raise HTTPException(status_code=403, detail="Customer not found")
+            raise HTTPException(status_code=403, detail="Customer does not have enough credit to purchase")
+
+        await session.exec(reserved_delta_statement(session.get_bind().dialect.name, vendor_id, datetime.now().date(), bundle_id, 1))
+        new_reservation = Reservation(bundle_id=bundle_id,
+                                      customer_id=customer_id,
+                                      code=randint(0, 9999))
+        session.add(new_reservation)
+        await session.commit()
+
+    except HTTPException:
+        await session.rollback() # releases the claimed bundle and any debit
+        raise
+    except Exception as e:
+        await session.rollback() # If anything fails
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return new_reservation
@@ -0,0 +1,138 @@
+from datetime import date, datetime
+from sqlalchemy.dialects import postgresql, sqlite
+from typing import Optional
+from sqlmodel import Session, select, delete, insert, func, distinct, or_, literal
+from app.models import Vendor_Listing, Vendor_Listing_Reserved, Bundle, Template, Reservation
+
+# keeps the vendor_listing read model in step with the bundles and reservations
+# every change is an upsert that adds a delta to the counters of one vendor on one day, so concurrent
+# reserves and bundle posts for the same vendor never overwrite each other
+# the statements run inside the callers transaction and are committed (or rolled back) with the change they describe
+# reserves and cancels are the hot path, they add to vendor_listing_reserved instead of vendor_listing, where the
+# vendors count for the day is split over RESERVED_SHARDS rows picked by the bundle id, so concurrent reserves of one
+# vendor mostly lock different rows rather than all queueing on one
+# the bundles available (and for past days, expired) are then posted_count minus the sum of the reserved shards
+# besides the vendor list, the rows are the daily sell through rollup (see analytics/sell_through_prop.py)
+# and changed_at marks the days the forecast ingestion has to process again (see core/forecast_ingestion.py)
+
+
+COUNTERS = ["posted_count", "vegan_count", "vegetarian_count", "collected_count", "no_show_count"]
+RESERVED_SHARDS = 16
+
+
+def listing_delta_statement(dialect_name: str, vendor_id: int, day: date, posted: int = 0, vegan: int = 0,
+                            vegetarian: int = 0, collected: int = 0, no_show: int = 0):
+    """
+    adds the deltas to the vendors row for the day, creating the row if it doesn't exist yet
+    postgres and sqlite both support ON CONFLICT DO UPDATE
+    """
+    insert_for_dialect = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    statement = insert_for_dialect(Vendor_Listing).values(vendor_id=vendor_id, date=day, posted_count=posted,
+                                                          vegan_count=vegan, vegetarian_count=vegetarian,
+                                                          collected_count=collected, no_show_count=no_show,
+                                                          changed_at=datetime.now())
+    set_ = {counter: getattr(Vendor_Listing, counter) + getattr(statement.excluded, counter) for counter in COUNTERS}
+    set_["changed_at"] = statement.excluded.changed_at
+    return statement.on_conflict_do_update(index_elements=["vendor_id", "date"], set_=set_)
+
+
+def apply_listing_delta(session: Session, vendor_id: int, day: date, posted: int = 0, vegan: int = 0,
+                        vegetarian: int = 0, collected: int = 0, no_show: int = 0):
+    dialect_name = session.get_bind().dialect.name
+    session.exec(listing_delta_statement(dialect_name, vendor_id, day, posted, vegan, vegetarian, collected, no_show))
+
+
+def reserved_delta_statement(dialect_name: str, vendor_id: int, day: date, bundle_id: int, reserved: int):
+    """adds reserved (1 for a reserve, -1 for a cancel) to the vendors shard for the bundle on the day"""
+    insert_for_dialect = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    statement = insert_for_dialect(Vendor_Listing_Reserved).values(vendor_id=vendor_id, date=day,
+                                                                   shard=bundle_id % RESERVED_SHARDS,
+                                                                   reserved_count=reserved, changed_at=datetime.now())
+    return statement.on_conflict_do_update(
+        index_elements=["vendor_id", "date", "shard"],
+        set_={"reserved_count": Vendor_Listing_Reserved.reserved_count + statement.excluded.reserved_count,
+              "changed_at": statement.excluded.changed_at},
+    )
+
+
+def apply_reserved_delta(session: Session, vendor_id: int, day: date, bundle_id: int, reserved: int):
+    dialect_name = session.get_bind().dialect.name
+    session.exec(reserved_delta_statement(dialect_name, vendor_id, day, bundle_id, reserved))
+
+
+def bundles_posted(session: Session, template: Template, day: date, amount: int):
+    # new bundles are available and count towards the vegan/vegetarian flags
+    apply_listing_delta(session, template.vendor, day, posted=amount,
+                        vegan=amount if template.is_vegan else 0,
+                        vegetarian=amount if template.is_vegetarian else 0)
+
+
+def bundles_removed(session: Session, template: Template, day: date, amount: int):
+    # deleted bundles were never reserved, so they only come off the posted count
+    bundles_posted(session, template, day, -amount)
+
+
+def held():
+    """a bundle someone holds, reserved and not cancelled (a pickup or a no show keeps holding it)"""
+    return or_(Bundle.purchased_by != None, Bundle.picked_up.is_(True))
+
+
+def listing_statement(day: Optional[date] = None, vendor_id: Optional[int] = None):
+    """
+    the vendor_listing rows worked out from the bundles and reservations themselves
+    for one day or every day, and for one vendor or all of them
+    a bundle can have several reservations (cancelled ones stay) so bundles are counted distinct
+    """
+    statement = (
+        select(
+            Template.vendor,
+            Bundle.date,
+            func.count(distinct(Bundle.bundle_id)),
+            func.count(distinct(Bundle.bundle_id)).filter(Template.is_vegan == True),
+            func.count(distinct(Bundle.bundle_id)).filter(Template.is_vegetarian == True),
+            func.count(Reservation.reservation_id).filter(Reservation.status == "collected"),
+            func.count(Reservation.reservation_id).filter(Reservation.status == "no_show"),
+        )
+        .join(Template, Template.template_id == Bundle.template_id)
+        .outerjoin(Reservation, Reservation.bundle_id == Bundle.bundle_id)
+        .group_by(Template.vendor, Bundle.date)
+    )
+    return filter_rows(statement, day, vendor_id)
+
+
+def reserved_statement(day: Optional[date] = None, vendor_id: Optional[int] = None):
+    """the vendor_listing_reserved rows worked out from the bundles, everything on the first shard"""
+    statement = (
+        select(Template.vendor, Bundle.date, literal(0), func.count(Bundle.bundle_id))
+        .join(Template, Template.template_id == Bundle.template_id)
+        .where(held())
+        .group_by(Template.vendor, Bundle.date)
+    )
+    return filter_rows(statement, day, vendor_id)
+
+
+def filter_rows(statement, day: Optional[date], vendor_id: Optional[int]):
+    if day is not None:
+        statement = statement.where(Bundle.date == day)
+    if vendor_id is not None:
+        statement = statement.where(Template.vendor == vendor_id)
+    return statement
+
+
+def rebuild_vendor_listing(session: Session, day: Optional[date] = None, vendor_id: Optional[int] = None):
+    """
+    recalculates the rows for the day, or every day if day is None, (for one vendor or all of them)
+    from the bundles and reservations
+    used on start up, after seeding and when a template is deleted, not on the hot paths
+    """
+    for model in (Vendor_Listing, Vendor_Listing_Reserved):
+        statement = delete(model)
+        if day is not None:
+            statement = statement.where(model.date == day)
+        if vendor_id is not None:
+            statement = statement.where(model.vendor_id == vendor_id)
+        session.exec(statement)
+    rows = listing_statement(day, vendor_id).add_columns(literal(datetime.now()))
+    session.exec(insert(Vendor_Listing).from_select(["vendor_id", "date"] + COUNTERS + ["changed_at"], rows))
+    rows = reserved_statement(day, vendor_id).add_columns(literal(datetime.now()))
+    session.exec(insert(Vendor_Listing_Reserved).from_select(["vendor_id", "date", "shard", "reserved_count", "changed_at"], rows))
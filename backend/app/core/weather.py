@@ -0,0 +1,200 @@
+import argparse
+import logging
+import math
+import os
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+from app.models import Vendor, Weather_Daily
+from app.core.database import engine
+from app.core.geocoding import lookup_postcode
+
+# daily precipitation for the forecasts, stored in weather_daily so forecasting never waits on the weather api
+# forecasting only reads the table, it is filled ahead of time by running this module on a schedule and by the
+# forecast batch (see forecasting/forecast_batch.py)
+# vendors are mapped to the grid cell their coordinates round into (GRID_DEGREES, about the resolution of the weather
+# models) so nearby vendors share one request and one set of rows, each cell is fetched as one date range
+# measured days never change once stored, forecast ones are fetched again when older than WEATHER_FORECAST_TTL
+# WEATHER_PROVIDER=stub swaps the api for StubWeatherProvider, for tests and offline development
+
+GRID_DEGREES = 0.1
+FORECAST_DAYS = 16 # open-meteo forecasts at most this many days ahead (today included)
+ARCHIVE_DELAY_DAYS = 5 # the archive api only has a day about this long afterwards, newer days are forecasts
+WEATHER_FORECAST_TTL = timedelta(hours=float(os.getenv("WEATHER_FORECAST_TTL_HOURS", "6")))
+UNKNOWN_PRECIPITATION = -1.0 # what forecast_input and the models use for weather that couldn't be found
+
+logger = logging.getLogger(__name__)
+
+
+class OpenMeteoProvider:
+    """daily precipitation from open-meteo, the archive for measured days and the forecast api for the rest"""
+
+    ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+    FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+
+    def __init__(self):
+        self._client = None
+
+    @property
+    def client(self):
+        # made on first use so importing this module doesn't open the requests cache
+        if self._client is None:
+            import openmeteo_requests
+            import requests_cache
+            from retry_requests import retry
+            cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
+            self._client = openmeteo_requests.Client(session=retry(cache_session, retries=5, backoff_factor=0.2))
+        return self._client
+
+    def _fetch(self, url: str, latitude: float, longitude: float, start: date, end: date) -> dict[date, float]:
+        params = {
+            "latitude": latitude,
+            "longitude": longitude,
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
+            "daily": "precipitation_sum",
+            "timezone": "Europe/London"
+        }
+        responses = self.client.weather_api(url, params=params)
+        values = responses[0].Daily().Variables(0).ValuesAsNumpy() # one per day from start_date
+        return {start + timedelta(days=i): float(value) for i, value in enumerate(values) if not math.isnan(value)}
+
+    def daily_precipitation(self, latitude: float, longitude: float, start: date, end: date) -> dict[date, float]:
+        archived_until = date.today() - timedelta(days=ARCHIVE_DELAY_DAYS)
+        precipitation = {}
+        if start <= archived_until:
+            precipitation.update(self._fetch(self.ARCHIVE_URL, latitude, longitude, start, min(end, archived_until)))
+        if end > archived_until:
+            precipitation.update(self._fetch(self.FORECAST_URL, latitude, longitude, max(start, archived_until + timedelta(days=1)), end))
+        return precipitation
+
+
+class StubWeatherProvider:
+    """
+    made up but repeatable precipitation without any network, for tests and offline development
+    every range asked for is kept in requests
+    """
+
+    def __init__(self, precipitation: Optional[float] = None):
+        self.precipitation = precipitation # the same for every day, or None to vary it by day
+        self.requests: list[tuple[float, float, date, date]] = []
+
+    def daily_precipitation(self, latitude: float, longitude: float, start: date, end: date) -> dict[date, float]:
+        self.requests.append((latitude, longitude, start, end))
+        days = (start + timedelta(days=i) for i in range((end - start).days + 1))
+        return {day: self.precipitation if self.precipitation is not None else (day.toordinal() % 5) * 0.5 for day in days}
+
+
+provider = StubWeatherProvider() if os.getenv("WEATHER_PROVIDER", "open_meteo") == "stub" else OpenMeteoProvider()
+
+
+def grid_cell(latitude: float, longitude: float) -> tuple[float, float]:
+    """the centre of the grid cell a point falls in"""
+    return (round(round(latitude / GRID_DEGREES) * GRID_DEGREES, 4),
+            round(round(longitude / GRID_DEGREES) * GRID_DEGREES, 4))
+
+
+def vendor_cells(session: Session, vendor_ids: Optional[Iterable[int]] = None) -> dict[int, tuple[float, float]]:
+    """the grid cell of each vendor (every vendor if vendor_ids is None), vendors without a known location are left out"""
+    statement = select(Vendor.vendor_id, Vendor.latitude, Vendor.longitude, Vendor.post_code)
+    if vendor_ids is not None:
+        statement = statement.where(Vendor.vendor_id.in_(list(vendor_ids)))
+
+    cells = {}
+    for vendor_id, latitude, longitude, post_code in session.exec(statement).all():
+        if latitude is None or longitude is None:
+            # registered before coordinates were stored
+            latitude, longitude = lookup_postcode(post_code) if post_code else (None, None)
+        if latitude is not None and longitude is not None:
+            cells[vendor_id] = grid_cell(latitude, longitude)
+    return cells
+
+
+def upsert_weather_statement(dialect_name: str, rows: list[dict]):
+    insert_for_dialect = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    statement = insert_for_dialect(Weather_Daily).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=["latitude", "longitude", "date"],
+        set_={column: getattr(statement.excluded, column) for column in ["precipitation", "is_forecast", "fetched_at"]},
+    )
+
+
+def missing_days(session: Session, cells: set[tuple[float, float]], start: date, end: date) -> dict[tuple[float, float], list[date]]:
+    """the days from start to end each cell has no usable weather for, read with one query"""
+    stale_before = datetime.now() - WEATHER_FORECAST_TTL
+    stored = session.exec(
+        select(Weather_Daily.latitude, Weather_Daily.longitude, Weather_Daily.date, Weather_Daily.is_forecast, Weather_Daily.fetched_at)
+        .where(Weather_Daily.latitude.in_({latitude for latitude, _ in cells}),
+               Weather_Daily.longitude.in_({longitude for _, longitude in cells}),
+               Weather_Daily.date.between(start, end))
+    ).all()
+    have = {(row.latitude, row.longitude, row.date) for row in stored if not row.is_forecast or row.fetched_at >= stale_before}
+
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    missing = {cell: [day for day in days if (*cell, day) not in have] for cell in cells}
+    return {cell: cell_days for cell, cell_days in missing.items() if cell_days}
+
+
+def prefetch_weather(session: Session, start: date, end: date, vendor_ids: Optional[Iterable[int]] = None, weather_provider=None) -> int:
+    """
+    makes sure weather_daily has the days from start to end for the cells of the vendors (every vendor if vendor_ids is None)
+    days further ahead than the forecasts go are skipped
+    each cell with missing days is one request for the range spanning them, a cell that fails is logged and tried again next time
+    returns how many cells were fetched
+    """
+    weather_provider = weather_provider or provider
+    end = min(end, date.today() + timedelta(days=FORECAST_DAYS - 1))
+    cells = set(vendor_cells(session, vendor_ids).values())
+    if not cells or start > end:
+        return 0
+
+    dialect_name = session.get_bind().dialect.name
+    archived_until = date.today() - timedelta(days=ARCHIVE_DELAY_DAYS)
+    fetched = 0
+    for (latitude, longitude), days in missing_days(session, cells, start, end).items():
+        try:
+            precipitation = weather_provider.daily_precipitation(latitude, longitude, min(days), max(days))
+        except Exception:
+            logger.exception("weather fetch failed for %s, %s", latitude, longitude)
+            continue
+        now = datetime.now()
+        rows = [{"latitude": latitude, "longitude": longitude, "date": day, "precipitation": value,
+                 "is_forecast": day > archived_until, "fetched_at": now} for day, value in precipitation.items()]
+        if rows:
+            session.exec(upsert_weather_statement(dialect_name, rows))
+            session.commit()
+        fetched += 1
+    return fetched
+
+
+def precipitation_by_day(session: Session, vendor_id: int, start: date, end: date) -> dict[date, float]:
+    """
+    the vendors precipitation for every day from start to end as stored in weather_daily, nothing is fetched
+    days the weather isn't known for (no location, not prefetched yet, too far ahead, the api failed) are UNKNOWN_PRECIPITATION
+    """
+    cell = vendor_cells(session, [vendor_id]).get(vendor_id)
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    if cell is None:
+        return {day: UNKNOWN_PRECIPITATION for day in days}
+
+    stored = dict(session.exec(
+        select(Weather_Daily.date, Weather_Daily.precipitation)
+        .where(Weather_Daily.latitude == cell[0], Weather_Daily.longitude == cell[1], Weather_Daily.date.between(start, end))
+    ).all())
+    return {day: stored.get(day, UNKNOWN_PRECIPITATION) for day in days}
+
+
+if __name__ == "__main__":
+
+    # python -m app.core.weather [--days-back 7]
+    # fills weather_daily for every vendor ahead of the forecasts, eg. from a cron job a few times a day
+
+    parser = argparse.ArgumentParser(description="prefetch the weather of every vendor")
+    parser.add_argument("--days-back", type=int, default=0)
+    args = parser.parse_args()
+
+    with Session(engine) as session:
+        today = date.today()
+        cells = prefetch_weather(session, today - timedelta(days=args.days_back), today + timedelta(days=FORECAST_DAYS - 1))
+    print(f"weather fetched for {cells} grid cells")
@@ -4,7 +4,7 @@ from app.core.database import engine
 from datetime import date, timedelta
 from typing import Optional, List
 from app.schema import ForecastDatapoint, ForecastWeekData, ForecastDayData
-from app.forecasting.baseline_approaches.seasonal_naive.seasonal_naive_forecast import update_or_create
+from app.forecasting.forecast_outputs import write_forecast_outputs, forecast_week
 import json
 
 
@@ -92,6 +92,7 @@ def generate_moving_average_forecast(
                 Forecast_Input.slot_end,
                 Template.title # needed since we are selecting the template title
             ).join(Template, Forecast_Input.template_id == Template.template_id) # join on template so we can use title
+            .order_by(Forecast_Input.template_id, Forecast_Input.slot_start, Forecast_Input.slot_end) # the order the stored rows are read back in
         )
 
         # get results by executing statement
@@ -117,12 +118,10 @@ def generate_moving_average_forecast(
             expected_max = (days_in_range + 6) // 7
             confidence = round(moving_avg_confidence_score(num_days=int(res.num_days), expected_max=expected_max, avg=avg_reserved, std= res.std_reserved), 3)
 
-            # use the helper function to update the output forecast or make it if it doesnt already exist
-            forecast = update_or_create(
-                session=session,
+            forecast = Forecast_Output(
                 vendor_id=vendor_id,
                 template_id=res.template_id,
-                target_date=target_day,
+                date=target_day,
                 slot_start=res.slot_start,
                 slot_end=res.slot_end,
                 model_type="moving_average",
@@ -135,6 +134,9 @@ def generate_moving_average_forecast(
 
             forecast_outputs.append(forecast) # add to master list
 
+    # every day is upserted with one statement once they are all worked out, replacing the older forecast of those days
+    write_forecast_outputs(session, forecast_outputs,
+                           replace=(vendor_id, "moving_average", start_date, start_date + timedelta(days=furthest_day - 1)))
     return forecast_outputs
 
 
@@ -149,86 +151,12 @@ def get_moving_average_forecast_chart(session: Session, vendor_id: int, start_da
     # gather outputs from the helper function
     outputs_needed: List[Forecast_Output] = generate_moving_average_forecast(session=session, vendor_id=vendor_id, start_date=start_date)
 
-    # if there were no outputs produced - meaning the vendor does not have enough data return []
-    if not outputs_needed:
-        return ForecastWeekData(week_date=start_date.isoformat(), day_datapoints=[])
-
-    # logic for making a dictionary mapping template id -> template title
-    template_ids = list({o.template_id for o in outputs_needed if o.template_id})
-    title_rows = session.exec(
-        select(Template.template_id, Template.title).where(Template.template_id.in_(template_ids))).all()
-    
-    title_map = {row.template_id: row.title for row in title_rows}
-
-    day_datapoints: List[ForecastDayData]  = [] # for adding all day datapoints in the loop to be processed before return
-
-    map_total: dict[tuple[str, str], int] = {} # must hold all relevant date, name unique tuples so we can determine how to correctly average averaged fields like confidence
-
-    # go through the forecast outputs
-    for output in outputs_needed:
-        date_d = output.date.isoformat()
-        # calculate no show chance as no_show / no_show+predicted
-        total = output.reservation_prediction + output.no_show_prediction
-        chance_of_no_show = max((round(output.no_show_prediction / total, 3) if total > 0 else 0.0), 0.05)
-
-        title = title_map.get(output.template_id, "Unknown") # use the dictionary to find the exact title from the template id
-
-        index_day = next((i for i, day in enumerate(day_datapoints) if day.date == date_d), None)
-
-        if index_day is not None: # if the day data point already exists
-            day_to_add: List[ForecastDatapoint] = day_datapoints[index_day].datapoints
-            index_point = next((i for i, point in enumerate(day_to_add) if point.bundle_name == title), None)
-            if index_point is not None: #  there are duplicates - already exists
-                agg_point: ForecastDatapoint = day_to_add[index_point]
-                # must update it
-                agg_point.chance_of_no_show += chance_of_no_show
-                agg_point.confidence += output.confidence
-                agg_point.predicted_sales += output.reservation_prediction
-                agg_point.predicted_no_show += output.no_show_prediction
-                agg_point.recommendation.append(output.recommendation)
-                agg_point.rationale.append(output.rationale)
-
-            else: # the day is the same but the bundle name does not already exist
-                p = ForecastDatapoint(bundle_name = title,
-                chance_of_no_show = chance_of_no_show,
-                confidence = output.confidence,
-                predicted_sales = output.reservation_prediction,
-                predicted_no_show = output.no_show_prediction,
-                recommendation= [output.recommendation],
-                rationale = [output.rationale])
-
-                day_datapoints[index_day].datapoints.append(p) # add the new datapoint to the appropriate date
-
-        else: # the day datapoint does not yet exist we need to make a new day datapoint
-            new_day = ForecastDayData(
-                date=output.date.isoformat(),
-                datapoints= [ForecastDatapoint(bundle_name = title,
-                chance_of_no_show = chance_of_no_show,
-                confidence = output.confidence,
-                predicted_sales = output.reservation_prediction,
-                predicted_no_show = output.no_show_prediction,
-                recommendation= [output.recommendation],
-                rationale = [output.rationale])]
-            )
-            day_datapoints.append(new_day)
-
-        # add to the totals 
-        map_total[(date_d, title)] = map_total.get((date_d, title), 0) + 1
-     
-
-
-    # at this point we should have all datapoints added and inside the day datapoints list BUT averages have not yet been averaged
-    for day_da in day_datapoints:
-        for p in day_da.datapoints:
-            p.chance_of_no_show = round(p.chance_of_no_show / map_total.get((day_da.date, p.bundle_name), 1), 3)
-            p.confidence = round(p.confidence / map_total.get((day_da.date, p.bundle_name), 1), 3)
-
+    # group them into the chart, bundles with several slots on a day are averaged
+    week = forecast_week(session, outputs_needed, start_date)
     session.commit()
+    return week
 
-    # return the weekdatapoints object
-    return ForecastWeekData(week_date=start_date.isoformat(), day_datapoints=day_datapoints)
 
-    
 
 
 
@@ -1,84 +1,62 @@
 from datetime import date, timedelta
+from typing import Optional
+import numpy as np
+import pandas as pd
 from sqlmodel import Session, select
-from app.models import Forecast_Input, Vendor
-from app.core.database import engine
+from app.models import Forecast_Input
 
-def get_naive_confidence_for_bundle_day(vendor_id: int,template_id: int,target_date: date,weeks_history: int = 4) -> float:
+NEUTRAL_CONFIDENCE = 0.5 # when there isn't enough data
+
+
+def naive_confidences(session: Session, vendor_id: int, weeks_history: int = 4, today: Optional[date] = None) -> dict[tuple[int, int], float]:
     """
-    for a vendor and date we should calculate how confident we are for this day of the week and bundle
-    This will return confidence reflecting confidence in number of bundles predicted to sell only
+    how confident we are in the seasonal naive forecast of every template of a vendor on every day of the week
+    (template id, weekday) -> confidence, reflecting confidence in number of bundles predicted to sell only
+    each day of the last weeks_history weeks is compared slot by slot with the same day a week earlier, the
+    vendors last weeks_history + 1 weeks are read with one query on the callers session
+    templates and weekdays without a comparison are left out, use NEUTRAL_CONFIDENCE for them
     """
-    day_of_week = target_date.strftime("%A")
-    end_date = date.today() - timedelta(days=1)
+    end_date = (today or date.today()) - timedelta(days=1)
     start_date = end_date - timedelta(weeks=weeks_history) + timedelta(days=1)
 
-    errors = []      
-    actuals = []     
-
-    with Session(engine) as session:
-        current = start_date
-        while current <= end_date:
-            # calculate the days that are of the same day of the week as target_date
-            if current.strftime("%A") != day_of_week:
-                current += timedelta(days=1)
-                continue
-
-            # the data for the current day
-            current_records = session.exec(
-                select(Forecast_Input).where(
-                    Forecast_Input.vendor_id == vendor_id,
-                    Forecast_Input.template_id == template_id,
-                    Forecast_Input.date == current
-                )
-            ).all()
-
-            # data from the same day a week earlier so we can compare them
-            past_date = current - timedelta(days=7)
-            past_records = session.exec(
-                select(Forecast_Input).where(
-                    Forecast_Input.vendor_id == vendor_id,
-                    Forecast_Input.template_id == template_id,
-                    Forecast_Input.date == past_date
-                )
-            ).all()
+    rows = session.exec(
+        select(Forecast_Input.template_id, Forecast_Input.slot_start, Forecast_Input.slot_end, Forecast_Input.date,
+               Forecast_Input.bundles_reserved)
+        .where(Forecast_Input.vendor_id == vendor_id,
+               Forecast_Input.template_id != None,
+               Forecast_Input.date.between(start_date - timedelta(days=7), end_date))
+    ).all()
+    if not rows:
+        return {}
 
-            # lookup for past records
-            past_dict = {}
-            for rec in past_records:
-                key = (rec.slot_start, rec.slot_end)
-                past_dict[key] = rec.bundles_reserved
+    inputs = pd.DataFrame(rows, columns=["template_id", "slot_start", "slot_end", "date", "reserved"])
+    inputs["date"] = pd.to_datetime(inputs["date"])
 
-            # using the lookup table calculate how close the predicted vs actual is
-            for cur in current_records:
-                key = (cur.slot_start, cur.slot_end)
-                if key in past_dict:
-                    past_res = past_dict[key]
-                    errors.append(abs(cur.bundles_reserved - past_res))
-                    actuals.append(cur.bundles_reserved)
+    # every slot is paired with the same slot a week earlier, what the naive model would have predicted for it
+    current = inputs[inputs["date"] >= pd.Timestamp(start_date)]
+    predicted = inputs.assign(date=inputs["date"] + pd.Timedelta(weeks=1))
+    pairs = current.merge(predicted, on=["template_id", "slot_start", "slot_end", "date"], suffixes=("", "_predicted"))
+    if pairs.empty:
+        return {}
 
-            current += timedelta(days=1) # increment our date and continue
+    pairs["error"] = (pairs["reserved"] - pairs["reserved_predicted"]).abs()
+    pairs["weekday"] = pairs["date"].dt.weekday
+    scores = pairs.groupby(["template_id", "weekday"]).agg(mae=("error", "mean"), avg_actual=("reserved", "mean"))
 
-    if not errors or not actuals:
-        # there isnt enough data so the confidence is neutral
-        return 0.5
+    # confidence calculation
+    mae, avg_actual = scores["mae"].to_numpy(), scores["avg_actual"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        confidence = np.where(avg_actual > 0, np.maximum(0.0, 1.0 - mae / avg_actual), np.where(mae == 0, 1.0, 0.0))
 
-    # confidnece calculation
-    mae = sum(errors) / len(errors)
-    avg_actual = sum(actuals) / len(actuals)
-
-    if avg_actual > 0:
-        confidence = max(0.0, 1.0 - (mae / avg_actual))
-    else:
-        confidence = 1.0 if mae == 0 else 0.0
-
-    return round(confidence, 3) # round the result to a 3dp float
+    return {(int(template_id), int(weekday)): round(float(value), 3) # round the result to a 3dp float
+            for (template_id, weekday), value in zip(scores.index, confidence)}
 
 
 if __name__ == "__main__":
-    
+
     pass
-            
+
 
 
 #inside backend
-# run with:  python -m app.forecasting.baseline_approaches.seasonal_naive.evaluate_seasonal_naive
\ No newline at end of file
+# run with:  python -m app.forecasting.baseline_approaches.seasonal_naive.evaluate_seasonal_naive
@@ -1,7 +1,9 @@
-from sqlmodel import Session, select
-from datetime import date, timedelta, time
-from collections import defaultdict
-from app.models import Forecast_Input, Bundle, Reservation, Template, Vendor
+from sqlmodel import Session, select, func, distinct, cast, extract
+from sqlalchemy import Integer, or_, union
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import date, datetime, timedelta, time
+from typing import Optional
+from app.models import Forecast_Input, Bundle, Reservation, Template, Vendor, Vendor_Listing, Vendor_Listing_Reserved
 from app.core.database import engine
 
 def get_slot_from_time(t: time) -> tuple[time, time]:
@@ -15,88 +17,101 @@ def get_slot_from_time(t: time) -> tuple[time, time]:
 
 
 
-def sync_forecast_inputs(session: Session, vendor_id: int, days_back: int = 30):
+def slot_hour_expression():
+    """the hour the 2 hour slot a bundle was posted in starts at, worked out by the database"""
+    return cast(extract("hour", Bundle.time), Integer) // 2 * 2
+
+
+def aggregate_statement(vendor_id: int, start_date: date, since: Optional[datetime] = None):
+    """
+    the vendors bundles from start_date grouped by (template, date, 2 hour slot) with how many were posted,
+    reserved and no shows, only the days changed since `since` if it is given
+    """
+    slot_hour = slot_hour_expression().label("slot_hour")
+    statement = (
+        select(
+            Bundle.template_id,
+            Template.estimated_value,
+            Template.cost,
+            Bundle.date,
+            slot_hour,
+            func.count(distinct(Bundle.bundle_id)),
+            func.count(Reservation.reservation_id),
+            func.count(Reservation.reservation_id).filter(Reservation.status == "no_show"),
+        )
+        .select_from(Bundle)
+        .join(Template, Bundle.template_id == Template.template_id)
+        .outerjoin(Reservation, Bundle.bundle_id == Reservation.bundle_id)
+        .where(Template.vendor == vendor_id)
+        .where(Bundle.date >= start_date)
+        .group_by(Bundle.template_id, Template.estimated_value, Template.cost, Bundle.date, slot_hour)
+    )
+    if since is not None:
+        # changed_at is bumped by every bundle and reservation change of that day, on vendor_listing or (reserves and
+        # cancels) on one of the vendor_listing_reserved shards
+        touched = union(
+            select(Vendor_Listing.date).where(Vendor_Listing.vendor_id == vendor_id, Vendor_Listing.changed_at >= since),
+            select(Vendor_Listing_Reserved.date).where(Vendor_Listing_Reserved.vendor_id == vendor_id,
+                                                       Vendor_Listing_Reserved.changed_at >= since),
+        )
+        statement = statement.where(Bundle.date.in_(touched))
+    return statement
+
+
+def upsert_statement(dialect_name: str):
+    """
+    the INSERT ... ON CONFLICT DO UPDATE the rows are sent with as one executemany
+    sqlalchemy only batches an executemany into multi row statements when it returns something, hence the RETURNING
+    precipitation is only set on insert, it is filled in afterwards by the weather backfill
+    an existing row is only rewritten (and returned) when one of its numbers changed
+    """
+    insert_for_dialect = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    table = Forecast_Input.__table__
+    statement = insert_for_dialect(table)
+    fields = ("discount", "bundles_posted", "bundles_reserved", "no_shows")
+    return statement.on_conflict_do_update(
+        index_elements=["vendor_id", "date", "slot_start", "slot_end", "template_id"],
+        set_={field: getattr(statement.excluded, field) for field in fields},
+        where=or_(*[table.c[field].is_distinct_from(getattr(statement.excluded, field)) for field in fields]),
+    ).returning(table.c.record_id)
+
+
+def sync_forecast_inputs(session: Session, vendor_id: int, days_back: int = 30, since: Optional[datetime] = None) -> int:
     """
     for any vendor we should ensure that days_back days is up to date i.e. forecast input entities have been
     made from all relevent database entities
-    this would ideally be called at the end of every day after the vendors closing time to ensure the database is up to date
+    with since only the days whose bundles or reservations changed after it are redone (incremental), without it
+    every day is
+    the grouping happens in the database and everything is written with one upsert
+    returns the number of rows written, the ones that were new or had changed
     """
     # work out the date function is called
     start_date = date.today() - timedelta(days=days_back)
 
-    # collect all relevant bundles for this vendor, along with their reservation status
-    bundles = session.exec(
-        select(Bundle, Reservation.status)
-        .join(Template, Bundle.template_id == Template.template_id)
-        .where(Template.vendor == vendor_id)
-        .where(Bundle.date >= start_date)
-        .outerjoin(Reservation, Bundle.bundle_id == Reservation.bundle_id)
-    ).all()  
-
-    # funxction to group by (date, slot_start, slot_end, template_id)
-    groups = defaultdict(lambda: {"posted": 0, "reserved": 0, "no_shows": 0})
-
-    for bundle, status in bundles:
-        slot_start, slot_end = get_slot_from_time(bundle.time)
-        key = (bundle.date, slot_start, slot_end, bundle.template_id)
-
-        groups[key]["posted"] += 1
-        if status is not None:          # bundle has a reservation
-            groups[key]["reserved"] += 1
-            if status == "no_show":
-                groups[key]["no_shows"] += 1
-        
-
-    # For each group, get the template to compute discount
-    template_cache = {}  # cache template_id since will be needed to calculate dicount
-    for key, agg in groups.items():
-        rec_date, slot_start, slot_end, template_id = key  
-
-        # Get or compute discount for this template
-        if template_id not in template_cache:
-            template = session.get(Template, template_id)
-            if template:
-                discount = (template.estimated_value - template.cost) / template.estimated_value
-                template_cache[template_id] = discount
-            else:
-                template_cache[template_id] = 0.0
-
-        discount = template_cache[template_id]
-
-        # Prepare data for upsert
-        data = {
+    rows = []
+    for template_id, estimated_value, cost, rec_date, slot_hour, posted, reserved, no_shows in session.exec(
+        aggregate_statement(vendor_id, start_date, since)
+    ):
+        slot_start, slot_end = get_slot_from_time(time(slot_hour))
+        rows.append({
             "vendor_id": vendor_id,
             "template_id": template_id,
             "date": rec_date,
             "slot_start": slot_start,
             "slot_end": slot_end,
-            "discount": discount,
+            "discount": (estimated_value - cost) / estimated_value if estimated_value else 0.0,
             "precipitation": -1.0,
-            "bundles_posted": agg["posted"],
-            "bundles_reserved": agg["reserved"],
-            "no_shows": agg["no_shows"],
-        }
-
-        # Check if a record already exists with these exact keys
-        existing = session.exec(
-            select(Forecast_Input).where(
-                Forecast_Input.vendor_id == vendor_id,
-                Forecast_Input.template_id == template_id,
-                Forecast_Input.date == rec_date,
-                Forecast_Input.slot_start == slot_start,
-                Forecast_Input.slot_end == slot_end,
-            )
-        ).first()
+            "bundles_posted": posted,
+            "bundles_reserved": reserved,
+            "no_shows": no_shows,
+        })
 
-        if existing:
-            # Update all fields (except primary key)
-            for field, value in data.items():
-                setattr(existing, field, value)
-            session.add(existing)
-        else:
-            session.add(Forecast_Input(**data))
+    written = 0
+    if rows:
+        written = len(session.exec(upsert_statement(session.get_bind().dialect.name), params=rows).all())
 
     session.commit()
+    return written
 
 if __name__ == "__main__":
     with Session(engine) as session:
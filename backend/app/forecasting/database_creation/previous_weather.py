@@ -1,31 +1,155 @@
-from datetime import date, timedelta
-from sqlmodel import Session, select
-import openmeteo_requests
-import requests_cache
-from retry_requests import retry
-import pgeocode
-import pandas as pd
+import argparse
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterable, Optional
+from sqlalchemy import Float, Integer, column, values
+from sqlmodel import Session, select, func, update
+from app.core.geocoding import lookup_postcode
+from app.core import weather
+from app.core.weather import precipitation_by_day, vendor_cells, missing_days, upsert_weather_statement, ARCHIVE_DELAY_DAYS
 from app.core.database import engine
-from app.models import Forecast_Input, Vendor
+from app.models import Forecast_Input, Weather_Daily
 
+# fills in the measured precipitation of past forecast inputs (the training data), as a batch for many vendors
+# vendors in the same grid cell share one archive request for the whole range their inputs need, the requests run
+# concurrently (at most concurrency at a time) and every cell is stored in weather_daily as soon as it arrives
+# the forecast inputs are then updated with one UPDATE joining them to weather_daily through a VALUES list of vendor cells
+# a run that stops part way can be started again, the cells already in weather_daily aren't requested twice and only
+# inputs still at -1.0 are updated
 
-# cache api result since we call multiple times
-_cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
-_retry_session = retry(_cache_session, retries=5, backoff_factor=0.2)
-_openmeteo = openmeteo_requests.Client(session=_retry_session)
+BACKFILL_CONCURRENCY = 4
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BackfillReport:
+    cells: int = 0 # grid cells that needed weather
+    fetched: int = 0 # of those, requested from the api in this run
+    failed: list[tuple[float, float]] = field(default_factory=list) # cells the api failed for, tried again next run
+    updated: int = 0 # forecast inputs given their precipitation
 
 
 def get_vendor_coordinates(postcode: str) -> tuple:
     """Get lat/lon for a UK postcode"""
-    nomi = pgeocode.Nominatim('GB')
-    result = nomi.query_postal_code(postcode)
-    
-    if pd.isna(result.latitude):
-        return None, None  
-    
-    return float(result.latitude), float(result.longitude)
+    # the GB dataset is loaded once and shared with the api, see core/geocoding.py
+    return lookup_postcode(postcode)
+
+
+def pending_ranges(session: Session, vendor_ids: Optional[Iterable[int]], start: date, end: date) -> dict[int, tuple[date, date]]:
+    """vendor id -> (first, last) day of their forecast inputs between start and end without precipitation, in one query"""
+    statement = (
+        select(Forecast_Input.vendor_id, func.min(Forecast_Input.date), func.max(Forecast_Input.date))
+        .where(Forecast_Input.date.between(start, end), Forecast_Input.precipitation == -1.0)
+        .group_by(Forecast_Input.vendor_id)
+    )
+    if vendor_ids is not None:
+        statement = statement.where(Forecast_Input.vendor_id.in_(list(vendor_ids)))
+    return {vendor_id: (first, last) for vendor_id, first, last in session.exec(statement).all()}
 
 
+async def fetch_cells(requests: dict[tuple[float, float], tuple[date, date]], weather_provider, concurrency: int):
+    """yields (cell, precipitation or the exception) as each request finishes, at most concurrency run at once"""
+    limit = asyncio.Semaphore(concurrency)
+
+    async def fetch(cell, first, last):
+        async with limit:
+            try:
+                # the providers are blocking http clients
+                return cell, await asyncio.to_thread(weather_provider.daily_precipitation, *cell, first, last)
+            except Exception as e:
+                return cell, e
+
+    for finished in asyncio.as_completed([fetch(cell, first, last) for cell, (first, last) in requests.items()]):
+        yield await finished
+
+
+def fill_precipitation_statement(vendor_cells_rows: list[tuple[int, float, float]], training_mode: bool = False):
+    """
+    sets the precipitation of every forecast input still at -1.0 that weather_daily has a measurement for
+    the vendors cells come in as a VALUES list (a CTE, sqlite doesn't allow naming the columns of a VALUES subquery)
+    """
+    cells = values(column("vendor_id", Integer), column("latitude", Float), column("longitude", Float),
+                   name="vendor_cell").data(vendor_cells_rows).cte("vendor_cell")
+    statement = (
+        update(Forecast_Input)
+        .where(Forecast_Input.vendor_id == cells.c.vendor_id,
+               Weather_Daily.latitude == cells.c.latitude,
+               Weather_Daily.longitude == cells.c.longitude,
+               Weather_Daily.date == Forecast_Input.date,
+               Weather_Daily.is_forecast.is_(False),
+               Forecast_Input.precipitation == -1.0)
+        .values(precipitation=Weather_Daily.precipitation)
+        .returning(Forecast_Input.record_id) # counted for the report, sqlite doesn't give a rowcount for a WITH statement
+    )
+    if training_mode:
+        # IMPORTANT -- it is simulated that 5% of all weather flags are undetermined (-1.0) for whatever reason e.g. failed API call
+        statement = statement.where(Forecast_Input.record_id % 20 != 0)
+    return statement
+
+
+def backfill_weather(session: Session, vendor_ids: Optional[Iterable[int]] = None, days_back: int = 60, training_mode: bool = False,
+                     concurrency: int = BACKFILL_CONCURRENCY, weather_provider=None,
+                     progress: Optional[Callable[[int, int], None]] = None) -> BackfillReport:
+    """
+    fills the precipitation of the vendors forecast inputs (every vendor if vendor_ids is None) from days_back days ago
+    up to the last day the archive has
+    training_mode: if true then we introduce random noise into the data by leaving 5% of records at -1.0 to ensure the trained model learns how "unknown" precip records look
+    progress is called with (cells done, cells to fetch) after every request
+    """
+    weather_provider = weather_provider or weather.provider
+    start = date.today() - timedelta(days=days_back)
+    end = date.today() - timedelta(days=ARCHIVE_DELAY_DAYS) # since precipitation is only added 3-5 after
+    report = BackfillReport()
+
+    pending = pending_ranges(session, vendor_ids, start, end)
+    cells = vendor_cells(session, list(pending))
+    if not cells:
+        return report
+
+    # the range each cell needs covers every vendor in it
+    cell_ranges: dict[tuple[float, float], tuple[date, date]] = {}
+    for vendor_id, cell in cells.items():
+        first, last = pending[vendor_id]
+        if cell in cell_ranges:
+            first, last = min(first, cell_ranges[cell][0]), max(last, cell_ranges[cell][1])
+        cell_ranges[cell] = (first, last)
+    report.cells = len(cell_ranges)
+
+    # only request the days weather_daily doesn't have yet, so a stopped run picks up where it was
+    missing = missing_days(session, set(cell_ranges), min(r[0] for r in cell_ranges.values()), max(r[1] for r in cell_ranges.values()))
+    requests = {}
+    for cell, days in missing.items():
+        days = [day for day in days if cell_ranges[cell][0] <= day <= cell_ranges[cell][1]]
+        if days:
+            requests[cell] = (min(days), max(days))
+
+    async def run():
+        dialect_name = session.get_bind().dialect.name
+        async for cell, result in fetch_cells(requests, weather_provider, concurrency):
+            if isinstance(result, Exception):
+                logger.error("weather backfill failed for %s, %s: %s", *cell, result)
+                report.failed.append(cell)
+            else:
+                now = datetime.now()
+                rows = [{"latitude": cell[0], "longitude": cell[1], "date": day, "precipitation": value, "is_forecast": False,
+                         "fetched_at": now} for day, value in result.items()]
+                if rows:
+                    session.exec(upsert_weather_statement(dialect_name, rows))
+                    session.commit()
+                report.fetched += 1
+            if progress:
+                progress(report.fetched + len(report.failed), len(requests))
+
+    if requests:
+        asyncio.run(run())
+
+    rows = [(vendor_id, latitude, longitude) for vendor_id, (latitude, longitude) in cells.items()]
+    report.updated = len(session.exec(fill_precipitation_statement(rows, training_mode)).all())
+    session.commit()
+    return report
 
 
 def update_weather_for_vendor(
@@ -34,197 +158,44 @@ def update_weather_for_vendor(
     days_back: int = 60,
     training_mode: bool = False
 ) -> str:
-    
+
     """
     for a partiular vendor the function goes back days_back days to update real life weather using their location
-    days_back: how many days back we should update weather for -> default weather is -1.0
-    if previous weather exists for an input forecasst then the precipitation will be overwritten
-    training_mode: if true then we introduce random noise into the data by adding precip = -1.0 to ensure the trained model learns how "unknow" precip records look
-    if training mode is not active then all relevant precip fields will be updated unless the API call fails (default -1.0)
+    only forecast inputs without precipitation (-1.0) are updated, see backfill_weather for many vendors at once
     """
 
-    vendor = session.get(Vendor, vendor_id)
-    if not vendor:
-        return f"Vendor with ID {vendor_id} not found."
-
-    postcode = vendor.post_code
-    if not postcode:
-        return f"Vendor {vendor_id} has no postcode."
-    
-    # logic to work out the longditude and latutude
-    latitude, longitude = get_vendor_coordinates(postcode)
-
-    # check if the postcode was found
-    if longitude is None or latitude is None:
-        return f"could not find the postcode: {postcode} -- exiting..."
-
-    # since precipitation is only added 3-5 after, we only add this measurement to 5-day-old forecast inputs
-    cutoff_actuals = date.today() - timedelta(days=5)
-    min_date = date.today() - timedelta(days=days_back)
-
-    # find relevant records where precipitation hasnt been set 
-    records = session.exec(
-        select(Forecast_Input).where(
-            Forecast_Input.vendor_id == vendor_id,
-            Forecast_Input.date <= cutoff_actuals,
-            Forecast_Input.date >= min_date,
-            Forecast_Input.precipitation == -1.0
-        )
-    ).all()
-
-    # return descriptive error message
-    if not records:
-        return f"No eligible forecast inputs for vendor {vendor_id}."
-
-    # Group by date to avoid repeated API calls
-    dates = {r.date for r in records}
-    updated = 0
-    failed = []
-
-    for target_date in dates:
-        # wrap this in a try except block to graceful handle api faliure
-        try: 
-
-            # call api
-            url = "https://archive-api.open-meteo.com/v1/archive"
-            params = {
-                "latitude": latitude,
-                "longitude": longitude,
-                "start_date": target_date.isoformat(),
-                "end_date": target_date.isoformat(),
-                "daily": "precipitation_sum",
-                "timezone": "Europe/London"
-            }
-            # extract the precipitation for that day
-            responses = _openmeteo.weather_api(url, params=params)
-            daily = responses[0].Daily()
-            precip = float(daily.Variables(0).ValuesAsNumpy()[0])
-
-            # Update all records for this date
-            if training_mode: # IMPORTANT -- if training mode is enabled then it is simulated that 5% of all weather flags are undetermined (-1.0) for whatever reason e.g. failed API call
-                for i, record in enumerate(records):
-                    if record.date == target_date and i % 20 != 0:
-                        record.precipitation = precip
-                        updated += 1
-
-            else: 
-                for i, record in enumerate(records):
-                    if record.date == target_date:
-                        record.precipitation = precip
-                        updated += 1
-
-
-        except Exception as e:
-            print(f"Failed weather report for {target_date}: {e}")
-            failed.append(target_date)
-            continue
+    report = backfill_weather(session, [vendor_id], days_back, training_mode)
 
-    session.commit()
+    # check if the api call failed
+    if report.failed:
+        return f"failed to get the weather for vendor {vendor_id}"
+    if report.cells == 0:
+        return f"No eligible forecast inputs with a known location for vendor {vendor_id}."
+    return f"Updated weather for {report.updated} records."
 
-    # check if the api call failed for one or more dates
-    if failed:
-        return f"failed on {len(failed)} days"
-    else:
-        return f"Updated weather for {updated} records."
 
-        
+def get_future_weather(session: Session, vendor_id: int, date_t: date) -> float:
+    """the vendors precipitation on one day, -1.0 if it isn't known, see core/weather.py for fetching many days at once"""
+    return precipitation_by_day(session, vendor_id, date_t, date_t)[date_t]
 
 
-def get_future_weather(session: Session, vendor_id: int, date_t: date) -> float:
 
-    vendor = session.get(Vendor, vendor_id)
-
-    if not vendor:
-        print(f"Vendor with ID {vendor_id} not found.")
-        return-1.0
-
-    postcode = vendor.post_code
-    if not postcode:
-        print(f"Vendor {vendor_id} has no postcode.")
-        return -1.0
-    
-    # logic to work out the longditude and latutude
-    latitude, longitude = get_vendor_coordinates(postcode)
-
-    # check if the postcode was found
-    if longitude is None or latitude is None:
-        print(f"could not find the postcode: {postcode}")
-        return -1.0
-
-    today = date.today()
-
-    if date_t <= today: # if the call is for the past we need to use a differne url
-
-        # call api
-        url = "https://archive-api.open-meteo.com/v1/archive"
-        params = {
-            "latitude": latitude,
-            "longitude": longitude,
-            "start_date": date_t.isoformat(),
-            "end_date": date_t.isoformat(),
-            "daily": "precipitation_sum",
-            "timezone": "Europe/London"
-        }    
-
-        try:
-            responses = _openmeteo.weather_api(url, params=params)
-            if not responses:
-                return -1.0
-            daily = responses[0].Daily()
-            # For archive API, the time array is reliable
-            time_array = pd.to_datetime(daily.Time(), unit='s', utc=True).date
-            indices = [i for i, d in enumerate(time_array) if d == date_t]
-            if not indices:
-                return -1.0
-            idx = indices[0]
-            precip = float(daily.Variables(0).ValuesAsNumpy()[idx])
-            return precip
-        except Exception as e:
-            print(f"Failed weather report for {date_t}: {e}")
-            return -1.0
-        
-    else: # if we are predicting the forecast
-
-        days_ahead = (date_t - today).days
-        if days_ahead > 16:
-            print(f"Requested date {date_t} is more than 16 days ahead")
-            return -1.0
-
-        # if we try to predict the future weather - max 16 days
-        url = "https://api.open-meteo.com/v1/forecast"
-        params = {
-            "latitude": latitude,
-            "longitude": longitude,
-            "forecast_days": days_ahead + 1,
-            "daily": "precipitation_sum",
-            "timezone": "Europe/London"
-        }
-
-        try:
-            responses = _openmeteo.weather_api(url, params=params)
-            if not responses:
-                return -1.0
-            daily = responses[0].Daily()
-           
-            precip_array = daily.Variables(0).ValuesAsNumpy()
-          
-            precip = float(precip_array[days_ahead]) # extract precipitation
-            return precip
-        
-        # if the api call failed
-        except Exception as e:
-            print(f"Failed weather report for {date_t}: {e}")
-            return -1.0
 
 
 
 
+if __name__ == "__main__":
 
+    # python -m app.forecasting.database_creation.previous_weather [--days-back 45] [--concurrency 4] [--training-mode]
+    # can be stopped and run again, it carries on from what is already stored
 
+    parser = argparse.ArgumentParser(description="backfill the measured weather of every vendors forecast inputs")
+    parser.add_argument("--days-back", type=int, default=45)
+    parser.add_argument("--concurrency", type=int, default=BACKFILL_CONCURRENCY)
+    parser.add_argument("--training-mode", action="store_true")
+    args = parser.parse_args()
 
-if __name__ == "__main__":
-    with  Session(engine) as session:
-        vendor_ids = session.exec(select(Vendor.vendor_id))
-        for id in vendor_ids:
-            update_weather_for_vendor(session, vendor_id=id, days_back=45)
-            
\ No newline at end of file
+    with Session(engine) as session:
+        report = backfill_weather(session, days_back=args.days_back, training_mode=args.training_mode, concurrency=args.concurrency,
+                                  progress=lambda done, total: print(f"\rweather fetched for {done}/{total} grid cells", end=""))
+    print(f"\n{report.updated} forecast inputs updated over {report.cells} grid cells ({report.fetched} fetched, {len(report.failed)} failed)")
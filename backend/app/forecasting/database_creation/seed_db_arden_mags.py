@@ -1,5 +1,7 @@
 from sqlmodel import Session, SQLModel, select, func
-from app.core.database import engine, seed_allergens, seed_badges
+from app.core.database import engine, reset_db, seed_allergens, seed_badges
+from app.core.badge_engine import award_badges, invalidate_badge_index
+from app.core.vendor_listing import rebuild_vendor_listing
 from app.core.security import get_password_hash
 from app.models import User, Vendor, Customer, Template, Bundle, Reservation, Streak, Allergen, Report, Badge, Forecast_Input
 from datetime import datetime, timedelta, time as dt_time
@@ -16,8 +18,7 @@ from app.forecasting.database_creation.previous_weather import update_weather_fo
 
 def seed_database():
 
-    SQLModel.metadata.drop_all(engine)
-    SQLModel.metadata.create_all(engine)
+    reset_db()
     seed_allergens()
     seed_badges()
 
@@ -399,17 +400,8 @@ def seed_database():
                 session.add(current_streak)
 
         # customer badge seeding
-        customer_badges = session.exec(
-            select(Badge).where(Badge.user_role == "customer")
-        ).all()
-
+        invalidate_badge_index() # the badges were just reseeded
         for customer in customer_list:
-            user = session.exec(
-                select(User).where(User.user_id == customer.user_id)
-            ).first()
-            if not user:
-                continue
-
             current_streak = session.exec(
                 select(Streak.count)
                 .where(Streak.customer_id == customer.customer_id)
@@ -422,23 +414,11 @@ def seed_database():
                 .where(Reservation.status == "collected")
             ).first() or 0
 
-            for badge in customer_badges:
-                if badge.metric == "carbon_saved":
-                    value = customer.carbon_saved
-                elif badge.metric == "food_saved":
-                    value = customer.food_saved
-                elif badge.metric == "money_saved":
-                    value = customer.money_saved
-                elif badge.metric == "bundles_saved":
-                    value = bundles_saved
-                elif badge.metric == "streak_count":
-                    value = current_streak
-                else:
-                    continue
-
-                if value >= badge.threshold and badge not in user.badges:
-                    user.badges.append(badge)
-                    session.add(user)
+            # the counters the badge engine tracks from now on
+            customer.bundles_saved = bundles_saved
+            customer.streak_count = current_streak
+            session.add(customer)
+            award_badges(session, customer)
 
         # Create Issue Reports with bell curve distribution of reporting customers on distribution of vendors
         num_reports = 150
@@ -490,7 +470,8 @@ def seed_database():
                 session.add(seeded_report)
         session.flush()
 
-
+        # the vendor list counts and the sell through rollup for every seeded day
+        rebuild_vendor_listing(session)
 
         session.commit()
 
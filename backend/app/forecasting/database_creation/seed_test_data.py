@@ -3,6 +3,7 @@ from datetime import datetime, timedelta, date, time
 from sqlmodel import Session, select
 from app.core.database import engine
 from app.core.security import get_password_hash
+from app.core.vendor_listing import rebuild_vendor_listing
 from app.models import User, Vendor, Customer, Template, Bundle, Reservation
 
 
@@ -198,6 +199,8 @@ def seed(weeks_of_history: int = 6):
                                 if status == 'collected':
                                     bundle.picked_up = True
 
+        session.flush()
+        rebuild_vendor_listing(session) # the vendor list counts and the sell through rollup for every seeded day
         session.commit()
 
 
@@ -1,6 +1,7 @@
 from sqlmodel import Session, SQLModel, select
-from app.core.database import engine, seed_allergens
+from app.core.database import engine, reset_db, seed_allergens
 from app.core.security import get_password_hash
+from app.core.vendor_listing import rebuild_vendor_listing
 from app.models import User, Vendor, Customer, Template, Bundle, Reservation, Streak, Allergen, Report
 from datetime import datetime, timedelta, time as dt_time
 import random
@@ -21,8 +22,7 @@ def seed_database():
     the function is intended to simulate real life spending and marketplace habits e.g. more sales on a weekend
     """
 
-    SQLModel.metadata.drop_all(engine) # make sure the db is empty first to prevent duplication
-    SQLModel.metadata.create_all(engine)
+    reset_db() # make sure the db is empty first to prevent duplication
     seed_allergens() # helper function for allergens
 
     vendors_runtime = copy.deepcopy(vendors)  # so as to keep the original dictionary
@@ -409,7 +409,8 @@ def seed_database():
                 session.add(seeded_report)
         session.flush()
 
-
+        # the vendor list counts and the sell through rollup for every seeded day
+        rebuild_vendor_listing(session)
 
         session.commit()
 
@@ -0,0 +1,168 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional
+from sqlalchemy import insert
+from sqlmodel import Session, create_engine, select, func
+from app.models import Forecast_Batch, Forecast_Batch_Vendor, Forecast_Output, Vendor
+from app.core.database import engine, engine_options
+from app.core.weather import prefetch_weather
+from app.forecasting.forecast_cache import model_forecast, MODEL_TYPES, CACHE_MISS
+from app.forecasting.linear_regression.model_registry import get_models
+
+# forecasts every validated vendor with every model ahead of the day, eg. from a nightly cron job after the ingestion
+# the vendors are shared out over a pool of BATCH_WORKERS processes, each with its own engine (one connection) and the
+# trained models loaded once when it starts, so the models run in parallel instead of one vendor after another
+# each model of each vendor goes through the forecast cache like a request does, so its outputs are written with one
+# upsert and its snapshot is stored, the endpoints then answer from the stored rows (see FORECAST_PRECOMPUTED in
+# forecast_cache.py to keep serving them after the inputs change)
+# a model that fails is rolled back and recorded without stopping the vendors other models or the other vendors
+# every run is stored in forecast_batch, with the time and rows written of each vendors models in forecast_batch_vendor
+
+BATCH_WORKERS = int(os.getenv("FORECAST_BATCH_WORKERS", str(os.cpu_count() or 1)))
+
+logger = logging.getLogger(__name__)
+
+# set in each worker process by init_worker
+worker_engine = None
+
+
+def init_worker(database_url: str):
+    """runs once in every worker process before it is given any vendors"""
+    global worker_engine
+    options = engine_options(database_url)
+    if "pool_size" in options:
+        options.update(pool_size=1, max_overflow=0) # a worker only ever uses one connection at a time
+    worker_engine = create_engine(database_url, **options)
+    try:
+        get_models()
+    except FileNotFoundError:
+        logger.warning("no trained models, the linear regression forecasts will fail")
+
+
+def output_rows(session: Session, vendor_id: int, model_type: str, start_date: date, days: int) -> int:
+    """how many outputs the model has stored for the vendor over the days from start_date"""
+    return session.exec(
+        select(func.count()).select_from(Forecast_Output)
+        .where(Forecast_Output.vendor_id == vendor_id,
+               Forecast_Output.model_type == model_type,
+               Forecast_Output.date.between(start_date, start_date + timedelta(days=days - 1)))
+    ).one()
+
+
+def forecast_vendor(vendor_id: int, start_date: date, days_ahead: int, model_types: Iterable[str],
+                    bind=None) -> list[dict]:
+    """
+    runs the models for one vendor on its own session (bind, or the workers engine) and returns one result per model
+    with the keys of forecast_batch_vendor
+    """
+    results = []
+    with Session(bind or worker_engine) as session:
+        for model_type in model_types:
+            started = time.perf_counter()
+            result = {"vendor_id": vendor_id, "model_type": model_type, "rows_written": 0, "source": None, "error": None}
+            try:
+                # precomputed is off so a forecast made earlier today from older inputs is made again
+                _, source = model_forecast(session, vendor_id, model_type, start_date, days_ahead, precomputed=False)
+                result["source"] = source
+                if source == CACHE_MISS:
+                    days = days_ahead if model_type == "linear_regression" else 7
+                    result["rows_written"] = output_rows(session, vendor_id, model_type, start_date, days)
+            except Exception as e:
+                session.rollback()
+                logger.exception("%s forecast failed for vendor %s", model_type, vendor_id)
+                result["error"] = f"{type(e).__name__}: {e}"[:500]
+            result["seconds"] = round(time.perf_counter() - started, 3)
+            results.append(result)
+    return results
+
+
+def record_results(session: Session, batch: Forecast_Batch, results: list[dict]):
+    session.exec(insert(Forecast_Batch_Vendor), params=[{**result, "batch_id": batch.batch_id} for result in results])
+    batch.failed += any(result["error"] for result in results)
+    batch.rows_written += sum(result["rows_written"] for result in results)
+    session.add(batch)
+    session.commit()
+
+
+def run_forecast_batch(session: Session, workers: int = BATCH_WORKERS, start_date: Optional[date] = None,
+                       days_ahead: int = 7, vendor_ids: Optional[Iterable[int]] = None,
+                       model_types: Iterable[str] = MODEL_TYPES) -> Forecast_Batch:
+    """
+    forecasts the vendors (every validated vendor if vendor_ids is None) from start_date (default tomorrow) and returns
+    the stored run, the summary is written on the callers session as each vendor finishes
+    with 1 worker or fewer the vendors run one after another in this process on the sessions engine (a pool of one
+    would only add its start up), otherwise the pool connects to the same database
+    """
+    start_date = start_date or date.today() + timedelta(days=1)
+    model_types = list(model_types)
+    for model_type in model_types:
+        if model_type not in MODEL_TYPES:
+            raise ValueError(f"unknown model type {model_type}")
+    if vendor_ids is None:
+        vendor_ids = session.exec(
+            select(Vendor.vendor_id).where(Vendor.validated == True).order_by(Vendor.vendor_id)).all()
+    vendor_ids = list(vendor_ids)
+
+    batch = Forecast_Batch(started_at=datetime.now(), start_date=start_date, days_ahead=days_ahead, workers=workers,
+                           vendors=len(vendor_ids))
+    session.add(batch)
+    session.commit()
+
+    # the weather of every vendor, one request per grid cell, so the workers only read it
+    if "linear_regression" in model_types:
+        prefetch_weather(session, start_date, start_date + timedelta(days=days_ahead - 1), vendor_ids)
+
+    bind = session.get_bind()
+    if workers <= 1:
+        for vendor_id in vendor_ids:
+            record_results(session, batch, forecast_vendor(vendor_id, start_date, days_ahead, model_types, bind))
+    else:
+        # spawned rather than forked so no worker inherits the parents connections
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=init_worker,
+                                 initargs=(bind.url.render_as_string(hide_password=False),)) as pool:
+            futures = {pool.submit(forecast_vendor, vendor_id, start_date, days_ahead, model_types): vendor_id
+                       for vendor_id in vendor_ids}
+            for future in as_completed(futures):
+                try:
+                    results = future.result()
+                except Exception as e:
+                    # the worker itself died, every model of the vendor counts as failed
+                    logger.exception("forecast batch worker failed for vendor %s", futures[future])
+                    results = [{"vendor_id": futures[future], "model_type": model_type, "seconds": 0.0,
+                                "rows_written": 0, "source": None, "error": f"{type(e).__name__}: {e}"[:500]}
+                               for model_type in model_types]
+                record_results(session, batch, results)
+
+    batch.finished_at = datetime.now()
+    session.add(batch)
+    session.commit()
+    session.refresh(batch)
+    return batch
+
+
+if __name__ == "__main__":
+
+    # python -m app.forecasting.forecast_batch [--workers 4] [--days-ahead 7] [--models seasonal_naive linear_regression]
+    # forecasts every validated vendor, eg. nightly after python -m app.core.forecast_ingestion
+
+    parser = argparse.ArgumentParser(description="forecast every validated vendor with a pool of processes")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--days-ahead", type=int, default=7)
+    parser.add_argument("--models", nargs="+", choices=MODEL_TYPES, default=list(MODEL_TYPES))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with Session(engine) as session:
+        batch = run_forecast_batch(session, workers=args.workers, days_ahead=args.days_ahead, model_types=args.models)
+        seconds = (batch.finished_at - batch.started_at).total_seconds()
+        print(f"forecast batch {batch.batch_id}: {batch.vendors} vendors in {seconds:.1f}s, "
+              f"{batch.rows_written} rows written, {batch.failed} vendors failed")
+        for row in session.exec(select(Forecast_Batch_Vendor).where(Forecast_Batch_Vendor.batch_id == batch.batch_id,
+                                                                    Forecast_Batch_Vendor.error != None)):
+            print(f"vendor {row.vendor_id} {row.model_type}: {row.error}")
@@ -0,0 +1,190 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from threading import Lock
+from typing import Callable, List, Optional
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+from app.models import Forecast_Output, Forecast_Snapshot, Forecast_Sync
+from app.schema import ForecastWeekData
+from app.forecasting.forecast_outputs import forecast_week
+from app.forecasting.baseline_approaches.seasonal_naive.seasonal_naive_forecast import get_naive_forecast_chart, naive_forecast_week
+from app.forecasting.baseline_approaches.moving_average.moving_average_forecast import get_moving_average_forecast_chart
+from app.forecasting.linear_regression.linear_regression_forecast import get_linear_regression_forecast_chart
+from app.forecasting.linear_regression.model_registry import get_models
+
+# answers repeated forecast requests without running the model again
+# a forecast is keyed by what it was made from: the vendors inputs (their watermark, when the ingestion last changed
+# them, and the day, since every model looks back from today) and for the linear regression the version of the models
+# a request is answered from this workers memory first, then from the forecast_output rows the last run with the same
+# key stored (forecast_snapshot says which key that was), and only otherwise computed and stored
+# entries also expire after FORECAST_CACHE_TTL so the linear regression picks up newer weather forecasts
+# a vendor the ingestion has never synced has no watermark, its forecasts are always computed
+# with FORECAST_PRECOMPUTED set the stored forecast of the day stands until the next day, whatever changed since, so the
+# api serves what the nightly batch (forecast_batch.py) made and only computes what it didn't
+
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", "1024"))
+FORECAST_CACHE_TTL = float(os.getenv("FORECAST_CACHE_TTL", str(6 * 3600))) # seconds
+FORECAST_CACHE_HEADER = "X-Forecast-Cache" # memory, stored or miss
+FORECAST_PRECOMPUTED = os.getenv("FORECAST_PRECOMPUTED", "false").lower() == "true"
+
+CACHE_MEMORY, CACHE_STORED, CACHE_MISS = "memory", "stored", "miss"
+
+MODEL_TYPES = ("seasonal_naive", "moving_average", "linear_regression")
+
+
+@dataclass(frozen=True)
+class ForecastKey:
+    vendor_id: int
+    model_type: str
+    start_date: date
+    days_ahead: int
+    watermark: str
+    model_version: str = ""
+
+
+class ForecastCache:
+    """least recently used cache of forecast responses, entries expire after ttl seconds"""
+
+    def __init__(self, maxsize: int = FORECAST_CACHE_SIZE, ttl: float = FORECAST_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[ForecastKey, tuple[float, ForecastWeekData]] = OrderedDict()
+        self._lock = Lock() # sync routes run in a threadpool
+
+    def get(self, key: ForecastKey) -> Optional[ForecastWeekData]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, week = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return week
+
+    def set(self, key: ForecastKey, week: ForecastWeekData):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, week)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False) # drop the least recently used
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+forecast_cache = ForecastCache()
+
+
+def input_watermark(session: Session, vendor_id: int, today: Optional[date] = None) -> Optional[str]:
+    """what the vendors forecasts are made from, None if the ingestion has never synced them"""
+    changed_at = session.exec(select(Forecast_Sync.changed_at).where(Forecast_Sync.vendor_id == vendor_id)).first()
+    if changed_at is None:
+        return None
+    return f"{(today or date.today()).isoformat()}/{changed_at.isoformat()}"
+
+
+def snapshot_statement(dialect_name: str, key: ForecastKey, made_at: datetime):
+    insert_for_dialect = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    statement = insert_for_dialect(Forecast_Snapshot).values(
+        vendor_id=key.vendor_id, model_type=key.model_type, start_date=key.start_date, days_ahead=key.days_ahead,
+        watermark=key.watermark, model_version=key.model_version, made_at=made_at,
+    )
+    return statement.on_conflict_do_update(
+        index_elements=["vendor_id", "model_type", "start_date", "days_ahead"],
+        set_={column: getattr(statement.excluded, column) for column in ["watermark", "model_version", "made_at"]},
+    )
+
+
+def stored_outputs(session: Session, key: ForecastKey, precomputed: bool = False) -> Optional[List[Forecast_Output]]:
+    """
+    the forecast_output rows of the last run with this key, None if the last run had another key or is too old
+    precomputed accepts any run made today by the same models, even if the inputs changed after it
+    """
+    snapshot = session.get(Forecast_Snapshot, (key.vendor_id, key.model_type, key.start_date, key.days_ahead))
+    if snapshot is None or snapshot.model_version != key.model_version:
+        return None
+    if precomputed:
+        fresh = snapshot.made_at.date() == date.today()
+    else:
+        fresh = snapshot.watermark == key.watermark and snapshot.made_at >= datetime.now() - timedelta(seconds=FORECAST_CACHE_TTL)
+    if not fresh:
+        return None
+    return list(session.exec(
+        select(Forecast_Output)
+        .where(Forecast_Output.vendor_id == key.vendor_id,
+               Forecast_Output.model_type == key.model_type,
+               Forecast_Output.date.between(key.start_date, key.start_date + timedelta(days=key.days_ahead - 1)))
+        .order_by(Forecast_Output.date, Forecast_Output.template_id, Forecast_Output.slot_start, Forecast_Output.slot_end)
+    ).all())
+
+
+def cached_forecast(session: Session, vendor_id: int, model_type: str, start_date: date, days_ahead: int,
+                    compute: Callable[[], ForecastWeekData],
+                    from_outputs: Callable[[List[Forecast_Output]], ForecastWeekData],
+                    model_version: str = "", precomputed: bool = FORECAST_PRECOMPUTED) -> tuple[ForecastWeekData, str]:
+    """
+    the vendors forecast and where it came from (CACHE_MEMORY, CACHE_STORED or CACHE_MISS)
+    compute runs the model and writes its outputs, replacing the models forecast of the days it covers
+    from_outputs puts the chart back together from the stored outputs, the way compute does
+    precomputed: see stored_outputs, the batch turns it off so it always brings the stored forecasts up to date
+    """
+    watermark = input_watermark(session, vendor_id)
+    if watermark is None:
+        return compute(), CACHE_MISS
+    key = ForecastKey(vendor_id, model_type, start_date, days_ahead, watermark, model_version)
+
+    week = forecast_cache.get(key)
+    if week is not None:
+        return week, CACHE_MEMORY
+
+    outputs = stored_outputs(session, key, precomputed)
+    if outputs is not None:
+        week = from_outputs(outputs)
+        forecast_cache.set(key, week)
+        return week, CACHE_STORED
+
+    # the watermark was read first, inputs changed while computing leave the snapshot behind and are redone next time
+    made_at = datetime.now()
+    week = compute()
+    session.exec(snapshot_statement(session.get_bind().dialect.name, key, made_at))
+    session.commit()
+    forecast_cache.set(key, week)
+    return week, CACHE_MISS
+
+
+def model_forecast(session: Session, vendor_id: int, model_type: str, start_date: date, days_ahead: int = 7,
+                   precomputed: bool = FORECAST_PRECOMPUTED) -> tuple[ForecastWeekData, str]:
+    """
+    the cached forecast of one of MODEL_TYPES, what the endpoints and the batch call
+    the baselines always forecast the 7 days from start_date, days_ahead only applies to the linear regression
+    """
+    if model_type == "seasonal_naive":
+        return cached_forecast(
+            session, vendor_id, model_type, start_date, 7,
+            compute=lambda: get_naive_forecast_chart(session, vendor_id, start_date),
+            from_outputs=lambda outputs: naive_forecast_week(session, outputs, start_date),
+            precomputed=precomputed,
+        )
+    if model_type == "moving_average":
+        return cached_forecast(
+            session, vendor_id, model_type, start_date, 7,
+            compute=lambda: get_moving_average_forecast_chart(session=session, vendor_id=vendor_id, start_date=start_date),
+            from_outputs=lambda outputs: forecast_week(session, outputs, start_date),
+            precomputed=precomputed,
+        )
+    if model_type == "linear_regression":
+        # a newer version of the models on disk is a different forecast
+        model_version = get_models().version
+        return cached_forecast(
+            session, vendor_id, model_type, start_date, days_ahead,
+            compute=lambda: get_linear_regression_forecast_chart(session=session, vendor_id=vendor_id, start_date=start_date, days_ahead=days_ahead),
+            from_outputs=lambda outputs: forecast_week(session, outputs, start_date, model_version=model_version),
+            model_version=model_version, precomputed=precomputed,
+        )
+    raise ValueError(f"unknown model type {model_type}")
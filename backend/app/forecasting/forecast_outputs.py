@@ -0,0 +1,163 @@
+from dataclasses import dataclass
+from datetime import date
+from typing import Iterable, List, Optional
+from sqlalchemy import Boolean, literal_column
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select, func, delete
+from app.models import Forecast_Output, Template
+from app.schema import ForecastDatapoint, ForecastWeekData, ForecastDayData
+
+# writes the forecast outputs of a whole run at once, every model goes through write_forecast_outputs
+# a forecast_output row is identified by OUTPUT_KEY (unique in the database), writing a slot that already has a forecast
+# from the same model replaces its prediction, so the rows are sent with one INSERT ... ON CONFLICT DO UPDATE instead
+# of a SELECT per slot to find out whether to insert or update
+# a run can replace a range of days, so the models forecast of those days is exactly what the run wrote and a repeated
+# request can be answered from the stored rows (see forecast_cache.py)
+
+OUTPUT_KEY = ["vendor_id", "template_id", "date", "slot_start", "slot_end", "model_type"]
+OUTPUT_FIELDS = ["reservation_prediction", "no_show_prediction", "recommendation", "rationale", "confidence"]
+
+
+@dataclass
+class OutputWriteReport:
+    inserted: int = 0 # slots the model hadn't forecast before
+    updated: int = 0 # slots whose existing forecast was replaced
+    removed: int = 0 # older forecasts in the replaced range for slots the run didn't forecast
+
+
+def upsert_outputs_statement(dialect_name: str):
+    """
+    the INSERT ... ON CONFLICT DO UPDATE the outputs are sent with as one executemany
+    on postgres each returned row says whether it was inserted (a row made by this statement has no xmax), on other
+    databases the new rows are the ones with an id above the highest from before the write
+    """
+    insert_for_dialect = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    table = Forecast_Output.__table__
+    statement = insert_for_dialect(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=OUTPUT_KEY,
+        set_={field: getattr(statement.excluded, field) for field in OUTPUT_FIELDS},
+    )
+    if dialect_name == "postgresql":
+        return statement.returning(table.c.output_id, literal_column("xmax = 0", Boolean).label("inserted"))
+    return statement.returning(table.c.output_id)
+
+
+def write_forecast_outputs(session: Session, outputs: Iterable[Forecast_Output],
+                           replace: Optional[tuple[int, str, date, date]] = None) -> OutputWriteReport:
+    """
+    upserts the outputs on the callers session (committing is left to the caller) and counts what was inserted and updated
+    when a slot appears more than once the last one is written, like calling update_or_create for each used to
+    replace: (vendor id, model type, first day, last day), the run is that models whole forecast of those days, the
+    vendors other forecasts from it in the range are deleted
+    """
+    rows = {}
+    for output in outputs:
+        row = {field: getattr(output, field) for field in OUTPUT_KEY + OUTPUT_FIELDS}
+        rows[tuple(row[field] for field in OUTPUT_KEY)] = row
+
+    report = OutputWriteReport()
+    written = []
+    if rows:
+        dialect_name = session.get_bind().dialect.name
+        if dialect_name == "postgresql":
+            written = session.exec(upsert_outputs_statement(dialect_name), params=list(rows.values())).all()
+            report.inserted = sum(1 for row in written if row.inserted)
+        else:
+            highest = session.exec(select(func.max(Forecast_Output.output_id))).one() or 0
+            written = session.exec(upsert_outputs_statement(dialect_name), params=list(rows.values())).all()
+            report.inserted = sum(1 for row in written if row.output_id > highest)
+        report.updated = len(written) - report.inserted
+
+    if replace is not None:
+        vendor_id, model_type, first, last = replace
+        report.removed = session.exec(
+            delete(Forecast_Output).where(
+                Forecast_Output.vendor_id == vendor_id,
+                Forecast_Output.model_type == model_type,
+                Forecast_Output.date.between(first, last),
+                Forecast_Output.output_id.not_in([row.output_id for row in written]),
+            )
+        ).rowcount
+    return report
+
+
+def forecast_week(session: Session, outputs: List[Forecast_Output], week_date: date, model_version: Optional[str] = None) -> ForecastWeekData:
+    """
+    the chart of the moving average and linear regression forecasts, the outputs of each day are grouped into one
+    datapoint per bundle (template title) in the order they come in
+    """
+    # if there were no outputs produced - meaning the vendor does not have enough data return []
+    if not outputs:
+        return ForecastWeekData(week_date=week_date.isoformat(), day_datapoints=[], model_version=model_version)
+
+    # logic for making a dictionary mapping template id -> template title
+    template_ids = list({o.template_id for o in outputs if o.template_id})
+    title_rows = session.exec(
+        select(Template.template_id, Template.title).where(Template.template_id.in_(template_ids))).all()
+
+    title_map = {row.template_id: row.title for row in title_rows}
+
+    day_datapoints: List[ForecastDayData] = [] # for adding all day datapoints in the loop to be processed before return
+
+    map_total: dict[tuple[str, str], int] = {} # must hold all relevant date, name unique tuples so we can determine how to correctly average averaged fields like confidence
+
+    # go through the forecast outputs
+    for output in outputs:
+        date_d = output.date.isoformat()
+        title = title_map.get(output.template_id, "Unknown") # use the dictionary to find the exact title from the template id
+
+        # calculate no show chance as no_show / no_show+predicted
+        total = output.reservation_prediction + output.no_show_prediction
+        chance_of_no_show = max((round(output.no_show_prediction / total, 3) if total > 0 else 0.0), 0.05)
+
+        index_day = next((i for i, day in enumerate(day_datapoints) if day.date == date_d), None)
+
+        if index_day is not None: # if the day data point already exists
+            day_to_add: List[ForecastDatapoint] = day_datapoints[index_day].datapoints
+            index_point = next((i for i, point in enumerate(day_to_add) if point.bundle_name == title), None)
+            if index_point is not None: #  there are duplicates - already exists
+                agg_point: ForecastDatapoint = day_to_add[index_point]
+                # must update it
+                agg_point.chance_of_no_show += chance_of_no_show
+                agg_point.confidence += output.confidence
+                agg_point.predicted_sales += output.reservation_prediction
+                agg_point.predicted_no_show += output.no_show_prediction
+                agg_point.recommendation.append(output.recommendation)
+                agg_point.rationale.append(output.rationale)
+
+            else: # the day is the same but the bundle name does not already exist
+                p = ForecastDatapoint(bundle_name = title,
+                chance_of_no_show = chance_of_no_show,
+                confidence = output.confidence,
+                predicted_sales = output.reservation_prediction,
+                predicted_no_show = output.no_show_prediction,
+                recommendation= [output.recommendation],
+                rationale = [output.rationale])
+
+                day_datapoints[index_day].datapoints.append(p) # add the new datapoint to the appropriate date
+
+        else: # the day datapoint does not yet exist we need to make a new day datapoint
+            new_day = ForecastDayData(
+                date=output.date.isoformat(),
+                datapoints= [ForecastDatapoint(bundle_name = title,
+                chance_of_no_show = chance_of_no_show,
+                confidence = output.confidence,
+                predicted_sales = output.reservation_prediction,
+                predicted_no_show = output.no_show_prediction,
+                recommendation= [output.recommendation],
+                rationale = [output.rationale])]
+            )
+            day_datapoints.append(new_day)
+
+        # add to the totals
+        map_total[(date_d, title)] = map_total.get((date_d, title), 0) + 1
+
+    # at this point we should have all datapoints added and inside the day datapoints list BUT averages have not yet been averaged
+    for day_da in day_datapoints:
+        for p in day_da.datapoints:
+            p.chance_of_no_show = round(p.chance_of_no_show / map_total.get((day_da.date, p.bundle_name), 1), 3)
+            p.confidence = round(p.confidence / map_total.get((day_da.date, p.bundle_name), 1), 3)
+
+    # return the weekdatapoints object
+    return ForecastWeekData(week_date=week_date.isoformat(), day_datapoints=day_datapoints, model_version=model_version)
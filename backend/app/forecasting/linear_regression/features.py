@@ -0,0 +1,189 @@
+import math
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, time, timedelta
+from typing import Optional
+import numpy as np
+import pandas as pd
+from sqlmodel import Session, select, func
+from app.models import Forecast_Input
+
+# the features of the linear regression model, worked out in bulk
+# for training (create_train_data) forecast_input is read with one query and the trailing aggregates are windows over
+# daily totals in pandas, instead of get_vendors_performance per cutoff date and get_rolling_avg_field twice per record
+# for a forecast (load_forecast_features) one grouped query gives the daily totals of every template and slot of the
+# vendor, so the number of queries doesn't grow with the number of slots
+# the values are the ones the per record helpers in preprocessing.py give
+
+INPUT_COLUMNS = ["record_id", "vendor_id", "template_id", "date", "slot_start", "slot_end", "discount", "precipitation",
+                 "bundles_reserved", "no_shows"]
+
+
+def load_forecast_inputs(session: Session, max_date: Optional[date] = None) -> pd.DataFrame:
+    """every forecast input (up to max_date if given) as a dataframe, in record order"""
+    statement = select(*[getattr(Forecast_Input, column) for column in INPUT_COLUMNS]).order_by(Forecast_Input.record_id)
+    if max_date:
+        statement = statement.where(Forecast_Input.date <= max_date)
+    inputs = pd.DataFrame(session.exec(statement).all(), columns=INPUT_COLUMNS)
+    inputs["date"] = pd.to_datetime(inputs["date"])
+    return inputs
+
+
+def vendor_trailing_stats(inputs: pd.DataFrame, cutoffs: pd.Series, weeks_history: int = 6) -> pd.DataFrame:
+    """
+    the get_vendors_performance aggregates for each row of inputs at its cutoff, over that vendors inputs dated from
+    weeks_history weeks before the cutoff up to the cutoff (both included)
+    a vendor without inputs in the window gets 0s like a forecast does
+    """
+    daily = inputs.groupby(["vendor_id", "date"]).agg(
+        reserved=("bundles_reserved", "sum"), no_shows=("no_shows", "sum"),
+        records=("record_id", "count"), discount=("discount", "sum"),
+    )
+
+    # the cutoffs are added as empty days so the windows can be read off at them
+    wanted = pd.MultiIndex.from_arrays([inputs["vendor_id"], cutoffs], names=["vendor_id", "date"])
+    days = daily.reindex(daily.index.union(wanted.unique()), fill_value=0).reset_index()
+
+    # the windows are in days not rows, (cutoff - N days, cutoff] is between(cutoff - weeks_history weeks, cutoff)
+    window = f"{weeks_history * 7 + 1}D"
+    columns = ["reserved", "no_shows", "records", "discount"]
+    totals = days.set_index("date").groupby("vendor_id").rolling(window)[columns].sum().reindex(wanted)
+
+    records = totals["records"].to_numpy()
+    seen = records > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return pd.DataFrame({
+            'vendor_avg_reserved': np.where(seen, totals["reserved"].to_numpy() / records, 0.0),
+            'vendor_avg_no_show': np.where(seen, totals["no_shows"].to_numpy() / records, 0.0),
+            'vendor_total_records': records.astype(int),
+            'vendor_avg_discount': np.where(seen, totals["discount"].to_numpy() / records, 0.0),
+        }, index=inputs.index)
+
+
+def slot_rolling_means(inputs: pd.DataFrame, cutoffs: pd.Series, weeks_back: int = 6) -> pd.DataFrame:
+    """
+    the get_rolling_avg_field means of bundles_reserved and no_shows for each row of inputs at its cutoff
+    over the vendors inputs in the same slot (any template) on the cutoffs weekday, from weeks_back weeks before
+    the cutoff up to the cutoff, 0.0 where there are none
+    """
+    keys = ["vendor_id", "slot_start", "slot_end", "date"]
+    daily = inputs.groupby(keys).agg(reserved=("bundles_reserved", "sum"), no_shows=("no_shows", "sum"),
+                                     records=("record_id", "count"))
+
+    # the same weekday every week back to the start of the window, summed a week at a time
+    totals = np.zeros((len(inputs), 3))
+    for week in range(weeks_back + 1):
+        lagged = pd.MultiIndex.from_arrays([inputs["vendor_id"], inputs["slot_start"], inputs["slot_end"],
+                                            cutoffs - pd.Timedelta(weeks=week)], names=keys)
+        totals += daily.reindex(lagged, fill_value=0).to_numpy()
+
+    reserved, no_shows, records = totals.T
+    seen = records > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return pd.DataFrame({
+            'avg_reserved_last_4w': np.where(seen, reserved / records, 0.0),
+            'avg_no_shows_last_4w': np.where(seen, no_shows / records, 0.0),
+        }, index=inputs.index)
+
+
+def build_training_features(inputs: pd.DataFrame, weeks_history: int = 6, weeks_back: int = 6) -> pd.DataFrame:
+    """the features preprocessing.create_train_data trains on plus the targets, one row per input"""
+    if inputs.empty:
+        return pd.DataFrame()
+    cutoffs = inputs["date"] - pd.Timedelta(days=1)
+    vendor_stats = vendor_trailing_stats(inputs, cutoffs, weeks_history)
+    rolling = slot_rolling_means(inputs, cutoffs, weeks_back)
+    day_of_week = inputs["date"].dt.weekday
+
+    return pd.DataFrame({
+        **vendor_stats,
+        'template_id': inputs["template_id"],
+        'day_of_week': day_of_week,
+        'month': inputs["date"].dt.month,
+        'slot_start_hour': [slot.hour for slot in inputs["slot_start"]],
+        'slot_end_hour': [slot.hour for slot in inputs["slot_end"]],
+        'discount': inputs["discount"],
+        'precipitation': inputs["precipitation"],
+        'trend': (inputs["date"] - pd.Timestamp(2020, 1, 1)).dt.days,
+        'is_weekend': (day_of_week >= 5).astype(int), # 1 for weekend or 0 for weekday
+        **rolling,
+        'target_reserved': inputs["bundles_reserved"],
+        'target_no_show': inputs["no_shows"],
+    }, index=inputs.index)
+
+
+@dataclass
+class ForecastFeatures:
+    """everything a linear regression forecast of one vendor reads from forecast_input"""
+    vendor_stats: dict # the get_vendors_performance aggregates of the vendor, empty without history
+    active_slots: list[tuple[int, time, time, int]] # (template id, slot start, slot end, weekday) to forecast
+    rolling_cache: dict[tuple[int, time, time, int], tuple[float, float]] # active slot -> (mean reserved, mean no shows)
+    spread: dict[tuple[int, time, time], tuple[int, float]] # (template id, slot start, slot end) -> (count, std of reserved)
+
+
+def forecast_totals_statement(vendor_id: int, since: date):
+    """the vendors daily totals per template and slot from since onwards"""
+    return (
+        select(Forecast_Input.template_id, Forecast_Input.slot_start, Forecast_Input.slot_end, Forecast_Input.date,
+               func.count().label("records"),
+               func.sum(Forecast_Input.bundles_reserved).label("reserved"),
+               func.sum(Forecast_Input.bundles_reserved * Forecast_Input.bundles_reserved).label("reserved_squared"),
+               func.sum(Forecast_Input.no_shows).label("no_shows"),
+               func.sum(Forecast_Input.discount).label("discount"))
+        .where(Forecast_Input.vendor_id == vendor_id, Forecast_Input.date >= since)
+        .group_by(Forecast_Input.template_id, Forecast_Input.slot_start, Forecast_Input.slot_end, Forecast_Input.date)
+    )
+
+
+def load_forecast_features(session: Session, vendor_id: int, today: Optional[date] = None, weeks_back: int = 6,
+                           weeks_history: int = 4) -> ForecastFeatures:
+    """
+    the vendors forecast features from one query
+    vendor_stats: the get_vendors_performance aggregates up to yesterday, weeks_history weeks back
+    active_slots: every (template, slot, weekday) seen in the last weeks_back weeks, the domain worth forecasting
+    rolling_cache: the get_rolling_avg_field means up to yesterday for every active slot
+    spread: the count and sample standard deviation of bundles reserved per template and slot over the last weeks_back weeks
+    """
+    today = today or date.today()
+    cutoff = today - timedelta(days=1) # history is only used up to yesterday
+    active_from = today - timedelta(weeks=weeks_back)
+    history_from = cutoff - timedelta(weeks=weeks_history)
+    rows = session.exec(forecast_totals_statement(vendor_id, cutoff - timedelta(weeks=weeks_back))).all()
+
+    vendor = [0, 0, 0, 0.0] # records, reserved, no shows, discount
+    active = set()
+    rolling_totals = defaultdict(lambda: [0, 0, 0]) # (slot start, slot end) -> records, reserved, no shows
+    spread_totals = defaultdict(lambda: [0, 0, 0]) # (template, slot start, slot end) -> records, reserved, reserved squared
+    for row in rows:
+        if history_from <= row.date <= cutoff:
+            vendor = [vendor[0] + row.records, vendor[1] + row.reserved, vendor[2] + row.no_shows, vendor[3] + row.discount]
+        if row.date >= active_from:
+            active.add((row.template_id, row.slot_start, row.slot_end, row.date.weekday()))
+        # the rolling means are across templates, on the weekday of the cutoff
+        if row.date <= cutoff and row.date.weekday() == cutoff.weekday():
+            totals = rolling_totals[(row.slot_start, row.slot_end)]
+            totals[0] += row.records
+            totals[1] += row.reserved
+            totals[2] += row.no_shows
+        if active_from <= row.date <= cutoff:
+            totals = spread_totals[(row.template_id, row.slot_start, row.slot_end)]
+            totals[0] += row.records
+            totals[1] += row.reserved
+            totals[2] += row.reserved_squared
+
+    records, reserved, no_shows, discount = vendor
+    vendor_stats = {'avg_reserved': reserved / records, 'avg_no_show': no_shows / records, 'total_records': records,
+                    'avg_discount': discount / records} if records else {}
+
+    active_slots = sorted(active, key=lambda slot: (slot[0] or 0, slot[1], slot[2], slot[3]))
+    rolling_cache = {}
+    for tmpl, s_start, s_end, dow in active_slots:
+        count, res, ns = rolling_totals.get((s_start, s_end), (0, 0, 0))
+        rolling_cache[(tmpl, s_start, s_end, dow)] = (res / count, ns / count) if count else (0.0, 0.0)
+
+    spread = {}
+    for key, (count, total, squares) in spread_totals.items():
+        # the sample variance from the sums, exact since they are whole numbers
+        spread[key] = (count, math.sqrt((count * squares - total * total) / (count * (count - 1))) if count > 1 else 0.0)
+
+    return ForecastFeatures(vendor_stats, active_slots, rolling_cache, spread)
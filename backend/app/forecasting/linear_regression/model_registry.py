@@ -0,0 +1,85 @@
+import hashlib
+import os
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any
+import joblib
+
+# keeps the trained ridge models in memory so a forecast doesn't deserialize them for every slot it predicts
+# the files are checked (just their size and modification time) on every get, when train.py writes a new version the
+# next forecast loads it, nothing has to be restarted
+# every uvicorn worker has its own registry
+
+MODEL_DIR = "app/forecasting/linear_regression/models"
+MODEL_FILES = ["ridge_reserved.pkl", "ridge_no_show.pkl", "feature_names.pkl"]
+METRICS_FILE = "metrics.pkl" # optional, forecasts fall back to a default error without it
+
+
+@dataclass(frozen=True)
+class LoadedModels:
+    """one version of the trained models, everything a linear regression forecast needs from the model dir"""
+    version: str # short hash of the model files, changes whenever train.py writes new ones
+    model_res: Any
+    model_ns: Any
+    feature_names: list[str]
+    metrics: dict = field(default_factory=dict)
+    feature_index: dict[str, int] = field(default_factory=dict) # column of each feature name, for building inputs in bulk
+
+
+class ModelRegistry:
+    """the loaded models per model dir, reloaded when the files on disk change"""
+
+    def __init__(self):
+        self._entries: dict[str, tuple[tuple, LoadedModels]] = {}
+        self._lock = Lock() # sync routes run in a threadpool
+
+    @staticmethod
+    def _signature(model_dir: str) -> tuple:
+        # (name, inode, size, mtime) of every file, a missing model file raises FileNotFoundError
+        signature = []
+        for name in MODEL_FILES + [METRICS_FILE]:
+            path = os.path.join(model_dir, name)
+            if name == METRICS_FILE and not os.path.exists(path):
+                continue
+            stat = os.stat(path)
+            signature.append((name, stat.st_ino, stat.st_size, stat.st_mtime_ns))
+        return tuple(signature)
+
+    @staticmethod
+    def _load(model_dir: str, signature: tuple) -> LoadedModels:
+        digest = hashlib.sha256()
+        for name, *_ in signature:
+            with open(os.path.join(model_dir, name), "rb") as file:
+                digest.update(file.read())
+        metrics_path = os.path.join(model_dir, METRICS_FILE)
+        feature_names = list(joblib.load(os.path.join(model_dir, "feature_names.pkl")))
+        return LoadedModels(
+            version=digest.hexdigest()[:12],
+            model_res=joblib.load(os.path.join(model_dir, "ridge_reserved.pkl")),
+            model_ns=joblib.load(os.path.join(model_dir, "ridge_no_show.pkl")),
+            feature_names=feature_names,
+            metrics=joblib.load(metrics_path) if os.path.exists(metrics_path) else {},
+            feature_index={name: column for column, name in enumerate(feature_names)},
+        )
+
+    def get(self, model_dir: str = MODEL_DIR) -> LoadedModels:
+        if not os.path.exists(model_dir):
+            raise FileNotFoundError("the model dir does not exist")
+        signature = self._signature(model_dir)
+        with self._lock:
+            entry = self._entries.get(model_dir)
+            if entry is None or entry[0] != signature:
+                entry = (signature, self._load(model_dir, signature))
+                self._entries[model_dir] = entry
+            return entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+model_registry = ModelRegistry()
+
+
+def get_models(model_dir: str = MODEL_DIR) -> LoadedModels:
+    return model_registry.get(model_dir)
@@ -3,6 +3,7 @@ from app.models import Forecast_Input
 from datetime import date, timedelta, time
 from typing import Optional
 import pandas as pd
+from app.forecasting.linear_regression.features import load_forecast_inputs, build_training_features
 
 
 def get_vendors_performance(session: Session, up_to: Optional[date], weeks_history: int = 4) -> dict[int:dict]:
@@ -51,7 +52,7 @@ def get_rolling_avg_field(session: Session, vendor_id: int, slot_start: time, sl
     for a given vendor we compute the average of a particular field for weeks_back weeks in the past
     this is likely to be used for e.g. avg no_shows and avg bundles_reserved
     the function is slot and day of week specifific so uses similar functionality to get moving average functions
-    weeks_back: must be the same as in compute_std_var to ensure consistency
+    weeks_back: must be the same as the spread in features.load_forecast_features to ensure consistency
     """
 
     if date_ow is None:
@@ -82,76 +83,14 @@ def get_rolling_avg_field(session: Session, vendor_id: int, slot_start: time, sl
     
   
 
-def extract_features_for_record(session: Session, record: Forecast_Input, vendor_stats_cache: dict) -> dict:
-    """
-    use a cache dictionary so that heavy computation can be avoided and does not become redundent
-    this is important as the db grows
-    """
-    cutoff = record.date - timedelta(days=1) 
-
-    # get vendor‑level aggregates for this cutoff date 
-    vendor_stats = vendor_stats_cache.get(cutoff, {}).get(record.vendor_id, {})
-
-    # basic features that will be used as input for training data - training both reservation predictor model and no_shows predictor model
-    features = {
-        'vendor_avg_reserved': vendor_stats.get('avg_reserved', 0.0),
-        'vendor_avg_no_show': vendor_stats.get('avg_no_show', 0.0),
-        'vendor_total_records': vendor_stats.get('total_records', 0),
-        'vendor_avg_discount': vendor_stats.get('avg_discount', 0.0),
-        'template_id': record.template_id,
-        'day_of_week': record.date.weekday(),
-        'month': record.date.month,
-        'slot_start_hour': record.slot_start.hour,
-        'slot_end_hour': record.slot_end.hour,
-        'discount': record.discount,
-        'precipitation': record.precipitation,
-        'trend': (record.date - date(2020, 1, 1)).days,
-        'is_weekend': 1 if record.date.weekday() >= 5 else 0, # 1 for weekend or 0 for weekday
-        'avg_reserved_last_4w': get_rolling_avg_field( # use the helper fucntiond defined above
-            session, record.vendor_id, record.slot_start, record.slot_end,
-            'bundles_reserved', date_ow=cutoff, weeks_back=6
-        ),
-        'avg_no_shows_last_4w': get_rolling_avg_field( # use the helper fucntiond defined above
-            session, record.vendor_id, record.slot_start, record.slot_end,
-            'no_shows', date_ow=cutoff, weeks_back=6
-        ),
-    }
-
-
-    return features
-
-
-
 def create_train_data(session: Session, max_date: Optional[date] = None) -> pd.DataFrame:
     """
-    here we make the cache used in extract_features_for_record
-    the training data is built as a list of dictinaries where ground truth labels are added
-    the list of dicts is convedted into a PD dataframe for ML use and efficiency when training
+    the training data, one row of features per forecast input with the ground truth labels added as target_ columns
+    the features are worked out for every record at once from a single query, see features.py
     """
     # if a max date parameter is specified then this becomes the end of history for training date so that we can still have a held out test set for fair validation later on
-    if max_date:
-        records = session.exec(select(Forecast_Input).where(Forecast_Input.date <= max_date)).all()
-    else:
-        records = session.exec(select(Forecast_Input)).all()
-
-    # make a set containing all unique dates that exists in the dataset
-    cutoff_dates = {r.date - timedelta(days=1) for r in records}
-    vendor_stats_cache = {}
-
-    # for all the cutoff dates populate the cache to give us cutoff_date: vendor performance
-    for cd in cutoff_dates:
-        vendor_stats_cache[cd] = get_vendors_performance(session, up_to=cd, weeks_history=6)
-    
-    # for all the records we go through and add the ground truth labels to the dict leaving us with a list of dicts containing the training data 
-    rows = []
-    for rec in records:
-        feat = extract_features_for_record(session, rec, vendor_stats_cache)
-        feat['target_reserved'] = rec.bundles_reserved
-        feat['target_no_show'] = rec.no_shows
-        rows.append(feat)
-    
-    df = pd.DataFrame(rows)
-    return df
+    inputs = load_forecast_inputs(session, max_date)
+    return build_training_features(inputs, weeks_history=6, weeks_back=6)
 
 
 
@@ -8,6 +8,13 @@ from sqlmodel import Session
 import os
 
 
+def save(obj, model_dir: str, name: str):
+    # written next to the old file and then swapped in so a forecast never loads a half written model
+    path = os.path.join(model_dir, name)
+    joblib.dump(obj, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
 def train_lin_regression(df: pd.DataFrame, model_dir: str = "app/forecasting/linear_regression/models"):
     X, y_res, y_ns, feature_names = prepare_X_y(df)
     X_train, X_test, y_res_train, y_res_test, y_ns_train, y_ns_test = train_test_split(
@@ -39,14 +46,15 @@ def train_lin_regression(df: pd.DataFrame, model_dir: str = "app/forecasting/lin
         'no_show_r2': r2_ns,
         'no_show_mae': mae_ns,
     }
-    joblib.dump(metrics, f"{model_dir}/metrics.pkl") # save the metrics
+    save(metrics, model_dir, "metrics.pkl") # save the metrics
 
     print(f"No‑show model – R-squared: {r2_ns:.3f}, MAE: {mae_ns:.2f}")
     
     # save models and feature names so they can be loaded for inference
-    joblib.dump(model_res, f"{model_dir}/ridge_reserved.pkl")
-    joblib.dump(model_ns, f"{model_dir}/ridge_no_show.pkl")
-    joblib.dump(feature_names, f"{model_dir}/feature_names.pkl")
+    # the running app picks the new version up on its next forecast (see model_registry.py)
+    save(model_res, model_dir, "ridge_reserved.pkl")
+    save(model_ns, model_dir, "ridge_no_show.pkl")
+    save(feature_names, model_dir, "feature_names.pkl")
 
 
 
@@ -1,5 +1,6 @@
 from typing import Optional, List
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index, text
 from datetime import date as Date, time as Time, datetime
 from random import random
 
@@ -57,6 +58,14 @@ class Vendor(SQLModel, table=True):
     food_saved: float = Field(default=0.0)
     user: Optional[User] = Relationship(back_populates="vendor_profile")
     validated: bool = Field(default=False)
+    latitude: Optional[float] = Field(default=None) # filled from the postcode, see core/geocoding.py
+    longitude: Optional[float] = Field(default=None)
+    lat_cell: Optional[int] = Field(default=None) # the band of latitude the vendor is in, see lat_cell in core/geocoding.py
+
+    __table_args__ = (
+        # the nearby vendors search reads one range of longitude in each band the radius covers
+        Index("ix_vendor_lat_cell_longitude", "lat_cell", "longitude"),
+    )
 
 
 class Customer(SQLModel, table=True):
@@ -68,11 +77,20 @@ class Customer(SQLModel, table=True):
     carbon_saved: float = Field(default=0.0)
     food_saved: float = Field(default=0.0)
     money_saved: float = Field(default=0.0)
+    bundles_saved: int = Field(default=0) # collected reservations, kept up to date for the badges (see core/badge_engine.py)
+    streak_count: int = Field(default=0) # count of the current streak
     rating: Optional[int] = Field(default=None)
+    latitude: Optional[float] = Field(default=None) # filled from the postcode, see core/geocoding.py
+    longitude: Optional[float] = Field(default=None)
 
     user: Optional[User] = Relationship(back_populates="customer_profile") 
 
 class Streak(SQLModel, table=True):
+    __table_args__ = (
+        # a customer only has one streak that hasn't ended, this finds it without reading their old ones
+        Index("ix_streak_active", "customer_id", postgresql_where=text("ended IS false"), sqlite_where=text("ended IS 0")),
+    )
+
     streak_id: Optional[int] =Field(default=None, primary_key=True)
     customer_id: Optional[int] =Field(foreign_key="customer.customer_id", ondelete="CASCADE")
     count: int = Field(default=0)
@@ -99,7 +117,7 @@ class Template(SQLModel, table=True):
     is_vegan: bool = Field(default=False)
     is_vegetarian: bool = Field(default=False)
 
-    vendor: Optional[int] = Field(default=None,foreign_key="vendor.vendor_id", ondelete="CASCADE")
+    vendor: Optional[int] = Field(default=None,foreign_key="vendor.vendor_id", ondelete="CASCADE", index=True)
 
     photo: Optional[str] = Field(default=None)
 
@@ -119,6 +137,13 @@ class Allergen(SQLModel, table=True):
 
 
 class Bundle(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_bundle_template_date_purchased", "template_id", "date", "purchased_by"),
+        # only the bundles still for sale, what reserving and the vendor list look for
+        Index("ix_bundle_unclaimed", "template_id", "date",
+              postgresql_where=text("purchased_by IS NULL"), sqlite_where=text("purchased_by IS NULL")),
+    )
+
     bundle_id: Optional[int] = Field(default=None, primary_key=True)
     template_id: Optional[int] = Field( default=None, foreign_key="template.template_id", ondelete="SET NULL")
     picked_up: bool = Field(default= False)
@@ -128,9 +153,48 @@ class Bundle(SQLModel, table=True):
     purchased_by: Optional[int] = Field(default=None, foreign_key="customer.customer_id", ondelete="SET NULL")
 
 
+# read model for the vendor list and the sell through analytics, one row per vendor per day, kept up to date by
+# core/vendor_listing.py whenever bundles are created, deleted, collected or marked as no shows
+# so neither has to aggregate every bundle ever posted, changed_at tells the forecast ingestion which days to redo
+# reserves and cancels are counted in vendor_listing_reserved instead, available = posted_count - reserved
+class Vendor_Listing(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_vendor_listing_date", "date"), # the vendor list only ever reads one day
+    )
+
+    vendor_id: int = Field(primary_key=True, foreign_key="vendor.vendor_id", ondelete="CASCADE")
+    date: Date = Field(primary_key=True)
+    posted_count: int = Field(default=0) # bundles posted that day and not deleted since
+    vegan_count: int = Field(default=0) # bundles posted that day from vegan templates
+    vegetarian_count: int = Field(default=0) # bundles posted that day from vegetarian templates
+    collected_count: int = Field(default=0) # reservations of that days bundles that were picked up
+    no_show_count: int = Field(default=0) # reservations of that days bundles that were marked as no shows
+    changed_at: datetime = Field(default_factory=datetime.now) # when any of the above last changed, read by the forecast ingestion
+
+
+# the bundles of each vendor and day that are held by a reservation (booked, collected or no show), written by every
+# reserve and cancel in the same transaction
+# the count is split over RESERVED_SHARDS rows per vendor and day (see core/vendor_listing.py) so concurrent reserves of
+# one vendor mostly land on different rows instead of all queueing on the lock of a single one, readers sum the shards
+class Vendor_Listing_Reserved(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_vendor_listing_reserved_date", "date"), # the vendor list only ever reads one day
+    )
+
+    vendor_id: int = Field(primary_key=True, foreign_key="vendor.vendor_id", ondelete="CASCADE")
+    date: Date = Field(primary_key=True)
+    shard: int = Field(primary_key=True)
+    reserved_count: int = Field(default=0)
+    changed_at: datetime = Field(default_factory=datetime.now) # read by the forecast ingestion like vendor_listing.changed_at
+
+
 class Reservation(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_reservation_customer_status", "customer_id", "status"),
+    )
+
     reservation_id:Optional[int] = Field(default=None, primary_key=True)
-    bundle_id: Optional[int] = Field(default=None, foreign_key="bundle.bundle_id", ondelete="SET NULL")
+    bundle_id: Optional[int] = Field(default=None, foreign_key="bundle.bundle_id", ondelete="SET NULL", index=True)
     customer_id: Optional[int] = Field(default=None, foreign_key="customer.customer_id",  ondelete="SET NULL") 
     time_created: datetime = Field(default_factory=datetime.now)
 
@@ -155,6 +219,12 @@ class Report(SQLModel, table=True):
     date_responded: Optional[Date] = Field(default=None)
 
 class Forecast_Input(SQLModel, table=True):
+    __table_args__ = (
+        # one row per template per 2 hour slot, the key the ingestion upserts on
+        Index("ux_forecast_input_vendor_date_slot_template", "vendor_id", "date", "slot_start", "slot_end", "template_id",
+              unique=True),
+    )
+
     record_id: Optional[int] = Field(default=None, primary_key=True)
     vendor_id: Optional[int] = Field(default=None, foreign_key="vendor.vendor_id", ondelete="CASCADE")
     template_id: Optional[int] = Field(default=None, foreign_key="template.template_id", ondelete="CASCADE")
@@ -170,7 +240,64 @@ class Forecast_Input(SQLModel, table=True):
     bundles_reserved: int = Field(default = 0)
     no_shows: int = Field(default = 0)
 
+
+# when the background ingestion (core/forecast_ingestion.py) last brought a vendors forecast inputs up to date
+# the analytics only read forecast_input and report this as how fresh their data is
+class Forecast_Sync(SQLModel, table=True):
+    vendor_id: int = Field(primary_key=True, foreign_key="vendor.vendor_id", ondelete="CASCADE")
+    synced_at: datetime
+    changed_at: Optional[datetime] = Field(default=None) # when a sync last changed any of the forecast inputs
+
+# what the forecast_output rows of a forecast request were made from, see forecasting/forecast_cache.py
+# a repeated request is answered from those rows while the vendors inputs and the models haven't changed
+class Forecast_Snapshot(SQLModel, table=True):
+    vendor_id: int = Field(primary_key=True, foreign_key="vendor.vendor_id", ondelete="CASCADE")
+    model_type: str = Field(primary_key=True)
+    start_date: Date = Field(primary_key=True)
+    days_ahead: int = Field(primary_key=True)
+    watermark: str # the vendors inputs it was made from, see forecast_cache.input_watermark
+    model_version: str = Field(default="") # the trained models that made it, empty for the baselines
+    made_at: datetime
+
+# a run of the nightly forecast batch (forecasting/forecast_batch.py) over every validated vendor
+class Forecast_Batch(SQLModel, table=True):
+    batch_id: Optional[int] = Field(default=None, primary_key=True)
+    started_at: datetime
+    finished_at: Optional[datetime] = Field(default=None) # None while it is running or if it died
+    start_date: Date # the first day forecast
+    days_ahead: int
+    workers: int # processes in the pool, 1 or less ran in the calling process
+    vendors: int = Field(default=0)
+    failed: int = Field(default=0) # vendors with at least one model that failed
+    rows_written: int = Field(default=0)
+
+# how one model of one vendor went in a batch
+class Forecast_Batch_Vendor(SQLModel, table=True):
+    batch_id: int = Field(primary_key=True, foreign_key="forecast_batch.batch_id", ondelete="CASCADE")
+    vendor_id: int = Field(primary_key=True, foreign_key="vendor.vendor_id", ondelete="CASCADE")
+    model_type: str = Field(primary_key=True)
+    seconds: float
+    rows_written: int = Field(default=0) # forecast_output rows the model wrote, 0 when its stored forecast was still current
+    source: Optional[str] = Field(default=None) # stored or miss, see forecast_cache.py, None when it failed
+    error: Optional[str] = Field(default=None)
+
+# daily precipitation per weather grid cell, filled a date range at a time by core/weather.py
+# nearby vendors round to the same cell and share its rows, forecasting only ever reads this table
+class Weather_Daily(SQLModel, table=True):
+    latitude: float = Field(primary_key=True) # the centre of the grid cell
+    longitude: float = Field(primary_key=True)
+    date: Date = Field(primary_key=True)
+    precipitation: float # mm over the day
+    is_forecast: bool = Field(default=False) # a forecast rather than a measurement, fetched again once it is stale
+    fetched_at: datetime = Field(default_factory=datetime.now)
+
 class Forecast_Output(SQLModel, table=True):
+    __table_args__ = (
+        # one forecast per model per template per slot, the key forecasting/forecast_outputs.py upserts on
+        Index("ux_forecast_output_vendor_template_date_slot_model", "vendor_id", "template_id", "date", "slot_start", "slot_end",
+              "model_type", unique=True),
+    )
+
     output_id: Optional[int] = Field(default=None, primary_key=True)
     vendor_id: Optional[int] = Field(default=None, foreign_key="vendor.vendor_id", ondelete="CASCADE")
     template_id: Optional[int] = Field(default=None, foreign_key="template.template_id", ondelete="CASCADE")
@@ -31,7 +31,8 @@ class VendorRead(BaseModel):
     photo: Optional[str]
 
 class AdminVendorList(BaseModel):
-    total_count: int
+    total_count: Optional[int] = None # see api/pagination.py, exact up to 10000 then estimated
+    next_cursor: Optional[str] = None # None on the last page
     vendors: List[VendorRead]
 
 # ___AUTH SCHEMAS___  
@@ -158,7 +159,8 @@ class TemplateRead(BaseModel):
 
 # list of templates returned for a specific vendor
 class TemplateList(BaseModel):
-    total_count: int
+    total_count: Optional[int] = None
+    next_cursor: Optional[str] = None
     templates: List[TemplateRead]
 
 # bundle create is small as all the detail is auto generated on back end or in template
@@ -166,6 +168,20 @@ class BundleCreate(BaseModel):
     template_id: int
     amount: int
 
+# for posting bundles of several templates in one request
+class BulkBundleCreate(BaseModel):
+    bundles: List[BundleCreate]
+
+# the ids given to the bundles of each template, in ascending order
+class CreatedBundles(BaseModel):
+    message: str
+    created: List["TemplateBundles"]
+    class TemplateBundles(BaseModel):
+        template_id: int
+        amount: int
+        first_bundle_id: Optional[int]
+        last_bundle_id: Optional[int]
+
 #for viewing one bundle
 class BundleRead(BaseModel):
     bundle_id: int
@@ -214,15 +230,18 @@ class CustReservationRead(BaseModel):
     status : str
 
 class CustReservationList(BaseModel):
-    total_count:int
+    total_count: Optional[int] = None
+    next_cursor: Optional[str] = None
     bundles: List[CustReservationRead]
 
 class VendReservationList(BaseModel):
-    total_count:int
+    total_count: Optional[int] = None
+    next_cursor: Optional[str] = None
     bundles: List[VendReservationRead]
 # get all stores
 class VendorList(BaseModel):
-    total_count:int
+    total_count: Optional[int] = None
+    next_cursor: Optional[str] = None
     vendors: List[VendorData]
     class VendorData(BaseModel):
         vendor_id: int
@@ -233,6 +252,13 @@ class VendorList(BaseModel):
         has_vegan: bool
         has_vegetarian: bool
 
+# vendors around the customer, closest first
+class NearbyVendorList(BaseModel):
+    total_count:int # vendors within the radius, not just this page
+    vendors: List[VendorData]
+    class VendorData(VendorList.VendorData):
+        distance_km: float
+
 class PickupCode(BaseModel):
     pickup_code: int
 
@@ -286,7 +312,8 @@ class ReportRespond(BaseModel):
     response:str
 
 class ReportList(BaseModel):
-    total_count: int
+    total_count: Optional[int] = None
+    next_cursor: Optional[str] = None
     reports: List [ReportRead]
 
     
@@ -316,6 +343,7 @@ class ForecastDatapoint(BaseModel):
 class ForecastWeekData(BaseModel):
     week_date: str
     day_datapoints: List[ForecastDayData]
+    model_version: Optional[str] = None # which trained models made the forecast, None for the baselines
 
 class ForecastDayData(BaseModel):
     date: str
@@ -327,6 +355,7 @@ class ForecastDayData(BaseModel):
 # for pricing effectiveness
 class discount_coordinate_data(BaseModel):
     coordinates: List[discount_coordinate] # a list of the discount coordinates
+    synced_at: Optional[datetime] = None # when the forecast inputs behind the data were last updated, None if never
 
 class discount_coordinate(BaseModel):
     discount: float # between 0 and 1 
@@ -343,6 +372,7 @@ class post_window_datapoint(BaseModel):
 class post_windows_data(BaseModel):
     top_post_window: str
     window_datapoints: List[post_window_datapoint]
+    synced_at: Optional[datetime] = None # when the forecast inputs behind the data were last updated, None if never
 
 
 # for the most popular 3 bundles
@@ -353,6 +383,7 @@ class popular_bundle_datapoint(BaseModel):
 class popular_bundle_data(BaseModel):
     top_bundle: str
     bundle_datapoints: List[popular_bundle_datapoint]
+    synced_at: Optional[datetime] = None # when the forecast inputs behind the data were last updated, None if never
     
 
 class waste_proxy_data(BaseModel):
@@ -390,9 +421,27 @@ class DeleteBundles(BaseModel):
 
 
 class AllUsers(BaseModel):
-    total_count: int
+    total_count: Optional[int] = None
+    next_cursor: Optional[str] = None
     users: List[UserData]
     class UserData(BaseModel):
         user_id: int
         email: str
-        role: str
\ No newline at end of file
+        role: str
+
+# for sizing the database connection pools
+class PoolStats(BaseModel):
+    pool: str
+    size: int
+    checked_out: int
+    checked_in: int
+    overflow: int
+    max_overflow: int
+    checkouts: int
+    timeouts: int
+    avg_wait_ms: float
+    max_wait_ms: float
+
+class DatabasePoolStats(BaseModel):
+    sync_engine: PoolStats
+    async_engine: PoolStats
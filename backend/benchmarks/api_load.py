@@ -0,0 +1,67 @@
+import httpx
+import asyncio
+import argparse
+import time
+
+# load test for the hot endpoints of a running api
+# run it once against a build with the sync handlers and once against the async handlers to compare requests per second
+
+# GET endpoints hit by the benchmark, {vendor_id} and {template_id} are filled from the arguments
+ENDPOINTS = [
+    "/vendors",
+    "/vendors/nearby?radius_km=50",
+    "/vendors/bundles/{vendor_id}",
+    "/templates/count/{template_id}",
+    "/customers/leaderboard",
+]
+
+
+async def hammer(client: httpx.AsyncClient, path: str, clients: int, total: int) -> tuple[float, int]:
+    """
+    sends total requests to path with at most clients in flight at once
+    returns (requests per second, number of failed requests)
+    """
+    semaphore = asyncio.Semaphore(clients)
+    failures = 0
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            try:
+                response = await client.get(path)
+                if response.status_code != 200:
+                    failures += 1
+            except httpx.HTTPError:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    return total / elapsed, failures
+
+
+async def run(base_url: str, token: str, clients: int, total: int, vendor_id: int, template_id: int):
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    headers = {"Authorization": "Bearer " + token}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=60) as client:
+        for endpoint in ENDPOINTS:
+            path = endpoint.format(vendor_id=vendor_id, template_id=template_id)
+            rps, failures = await hammer(client, path, clients, total)
+            print(f"{path:<32} {rps:>8.1f} req/s   failures: {failures}")
+
+
+if __name__ == "__main__":
+
+    # python -m benchmarks.api_load --token <customer access token> --clients 500 --requests 5000
+    # the token must belong to a customer as the leaderboard is customer only
+
+    parser = argparse.ArgumentParser(description="requests per second for the hot endpoints")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--vendor-id", type=int, default=1)
+    parser.add_argument("--template-id", type=int, default=1)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.base_url, args.token, args.clients, args.requests, args.vendor_id, args.template_id))
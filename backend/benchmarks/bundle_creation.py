@@ -0,0 +1,67 @@
+from sqlmodel import Session, select, delete
+from app.models import Bundle, Template
+from app.core.database import engine
+from app.core.bundle_engine import post_bundles
+from app.core.vendor_listing import bundles_posted, rebuild_vendor_listing
+from benchmarks.reservation_concurrency import seed, cleanup
+from datetime import datetime
+import argparse
+import time
+
+# times posting bundles the old way (an ORM object and INSERT per bundle) against post_bundles (batched multi row inserts)
+# each size is posted into an empty template and deleted again before the next run
+
+SIZES = [1, 10, 100, 1000, 10000]
+
+
+def post_one_by_one(session: Session, template_id: int, amount: int):
+    # what create_bundles used to do
+    template = session.exec(select(Template).where(Template.template_id == template_id)).first()
+    for _ in range(amount):
+        session.add(Bundle(template_id=template_id))
+    bundles_posted(session, template, datetime.now().date(), amount)
+
+
+def time_posting(template_id: int, vendor_id: int, amount: int, bulk: bool) -> float:
+    with Session(engine) as session:
+        start = time.perf_counter()
+        if bulk:
+            post_bundles(session, vendor_id, {template_id: amount})
+        else:
+            post_one_by_one(session, template_id, amount)
+        session.commit()
+        elapsed = time.perf_counter() - start
+
+        session.exec(delete(Bundle).where(Bundle.template_id == template_id))
+        rebuild_vendor_listing(session, datetime.now().date(), vendor_id)
+        session.commit()
+    return elapsed
+
+
+def run(sizes: list[int], repeats: int):
+    template_id, _, user_ids = seed(0, 0)
+    try:
+        with Session(engine) as session:
+            vendor_id = session.exec(select(Template.vendor).where(Template.template_id == template_id)).one()
+
+        print(f"{'bundles':>8} {'one by one':>12} {'bulk':>10} {'speed up':>9}")
+        for amount in sizes:
+            # best of the repeats so a cold cache or a checkpoint doesn't skew one size
+            one_by_one = min(time_posting(template_id, vendor_id, amount, bulk=False) for _ in range(repeats))
+            bulk = min(time_posting(template_id, vendor_id, amount, bulk=True) for _ in range(repeats))
+            print(f"{amount:>8} {one_by_one * 1000:>10.1f}ms {bulk * 1000:>8.1f}ms {one_by_one / bulk:>8.1f}x")
+    finally:
+        cleanup(template_id, user_ids)
+
+
+if __name__ == "__main__":
+
+    # python -m benchmarks.bundle_creation --repeats 3
+    # run against a development database, everything seeded is deleted afterwards
+
+    parser = argparse.ArgumentParser(description="time creating 1 to 10k bundles one by one and in bulk")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    run(args.sizes, args.repeats)
@@ -0,0 +1,70 @@
+from sqlmodel import Session, select
+from sqlalchemy import event
+from app.models import Template, Reservation
+from app.core.database import engine
+from app.core.reservation_engine import reserve_bundle
+from app.core.principal_cache import Principal
+from app.core.badge_engine import get_badge_index
+from app.api.reservations import finalise_reservation
+from app.schema import PickupCode
+from benchmarks.reservation_concurrency import seed, cleanup
+import argparse
+import time
+
+# counts the sql statements sent for each pickup (finalise_reservation)
+# a pickup used to cost about 12 round trips, it should now stay at or under MAX_STATEMENTS_PER_PICKUP
+
+# the joined fetch, the reservation/customer/vendor updates, ending the old streak and starting a new one,
+# the owned badge check, the badge insert and the sell through upsert
+MAX_STATEMENTS_PER_PICKUP = 9
+
+
+def run(pickups: int):
+    template_id, customer_ids, user_ids = seed(pickups, pickups)
+    try:
+        with Session(engine) as session:
+            vendor_id = session.exec(select(Template.vendor).where(Template.template_id == template_id)).one()
+            get_badge_index(session) # loaded once per process, not part of a pickup
+            for customer_id in customer_ids:
+                reserve_bundle(session, template_id, customer_id)
+            reservations = session.exec(
+                select(Reservation.reservation_id, Reservation.code)
+                .where(Reservation.customer_id.in_(customer_ids))
+            ).all()
+
+        vendor = Principal(user_id=user_ids[0], role="vendor", vendor_id=vendor_id)
+        counts = []
+        elapsed = 0.0
+
+        for reservation_id, code in reservations:
+            statements = []
+            def count(conn, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+
+            with Session(engine) as session:
+                event.listen(engine, "before_cursor_execute", count)
+                start = time.perf_counter()
+                try:
+                    finalise_reservation(reservation_id, PickupCode(pickup_code=code), session=session, current_user=vendor)
+                finally:
+                    elapsed += time.perf_counter() - start
+                    event.remove(engine, "before_cursor_execute", count)
+            counts.append(len(statements))
+
+        print(f"pickups: {len(counts)}, avg time: {elapsed / len(counts) * 1000:.2f}ms")
+        print(f"statements per pickup: min {min(counts)}, max {max(counts)}, avg {sum(counts) / len(counts):.1f}")
+        assert max(counts) <= MAX_STATEMENTS_PER_PICKUP, f"a pickup sent {max(counts)} statements, the limit is {MAX_STATEMENTS_PER_PICKUP}"
+    finally:
+        cleanup(template_id, user_ids)
+
+
+if __name__ == "__main__":
+
+    # python -m benchmarks.finalise_statements --pickups 100
+    # run against a development database, everything seeded is deleted afterwards
+
+    parser = argparse.ArgumentParser(description="statements sent per reservation pickup")
+    parser.add_argument("--pickups", type=int, default=100)
+    args = parser.parse_args()
+
+    run(args.pickups)
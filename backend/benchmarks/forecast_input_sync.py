@@ -0,0 +1,117 @@
+from sqlmodel import Session, select
+from app.models import Bundle, Reservation, Template, Forecast_Input
+from app.core.database import engine
+from app.core.vendor_listing import rebuild_vendor_listing
+from app.forecasting.database_creation.generate_input_forecasts import sync_forecast_inputs, get_slot_from_time
+from benchmarks.reservation_concurrency import seed, cleanup
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+import argparse
+import random
+import time as timer
+
+# times syncing one vendors forecast inputs the old way (grouped in python, a SELECT per group) against
+# sync_forecast_inputs, both over every day and incrementally once nothing has changed
+
+
+def sync_one_by_one(session: Session, vendor_id: int, days_back: int):
+    # what sync_forecast_inputs used to do
+    start_date = date.today() - timedelta(days=days_back)
+    bundles = session.exec(
+        select(Bundle, Reservation.status)
+        .join(Template, Bundle.template_id == Template.template_id)
+        .where(Template.vendor == vendor_id)
+        .where(Bundle.date >= start_date)
+        .outerjoin(Reservation, Bundle.bundle_id == Reservation.bundle_id)
+    ).all()
+
+    groups = defaultdict(lambda: {"posted": 0, "reserved": 0, "no_shows": 0})
+    for bundle, status in bundles:
+        slot_start, slot_end = get_slot_from_time(bundle.time)
+        key = (bundle.date, slot_start, slot_end, bundle.template_id)
+        groups[key]["posted"] += 1
+        if status is not None:
+            groups[key]["reserved"] += 1
+            if status == "no_show":
+                groups[key]["no_shows"] += 1
+
+    for (rec_date, slot_start, slot_end, template_id), agg in groups.items():
+        template = session.get(Template, template_id)
+        existing = session.exec(
+            select(Forecast_Input).where(
+                Forecast_Input.vendor_id == vendor_id,
+                Forecast_Input.template_id == template_id,
+                Forecast_Input.date == rec_date,
+                Forecast_Input.slot_start == slot_start,
+                Forecast_Input.slot_end == slot_end,
+            )
+        ).first()
+        existing.bundles_posted = agg["posted"]
+        existing.bundles_reserved = agg["reserved"]
+        existing.no_shows = agg["no_shows"]
+        existing.discount = (template.estimated_value - template.cost) / template.estimated_value
+        session.add(existing)
+    session.commit()
+
+
+def seed_history(template_id: int, customer_ids: list[int], days: int, per_slot: int):
+    """per_slot bundles in every 2 hour slot of every day, about half of them reserved"""
+    with Session(engine) as session:
+        bundles = [
+            {"template_id": template_id, "picked_up": False, "date": date.today() - timedelta(days=day),
+             "time": time(hour, 30), "purchased_by": None}
+            for day in range(days) for hour in range(0, 24, 2) for _ in range(per_slot)
+        ]
+        bundle_ids = session.exec(Bundle.__table__.insert().returning(Bundle.__table__.c.bundle_id, sort_by_parameter_order=True),
+                                  params=bundles).scalars().all()
+        reservations = [
+            {"bundle_id": bundle_id, "customer_id": random.choice(customer_ids), "time_created": datetime.now(),
+             "status": random.choice(["collected", "no_show"]), "code": 1234}
+            for bundle_id in bundle_ids if random.random() < 0.5
+        ]
+        session.exec(Reservation.__table__.insert(), params=reservations)
+        rebuild_vendor_listing(session)
+        session.commit()
+        return len(bundle_ids)
+
+
+def timed(run) -> float:
+    with Session(engine) as session:
+        start = timer.perf_counter()
+        run(session)
+        return timer.perf_counter() - start
+
+
+def run(days: int, per_slot: int):
+    template_id, customer_ids, user_ids = seed(0, 10)
+    try:
+        bundles = seed_history(template_id, customer_ids, days, per_slot)
+        with Session(engine) as session:
+            vendor_id = session.exec(select(Template.vendor).where(Template.template_id == template_id)).one()
+
+        # the first sync makes the rows, the old way could only update them afterwards
+        timed(lambda session: sync_forecast_inputs(session, vendor_id, days))
+        one_by_one = timed(lambda session: sync_one_by_one(session, vendor_id, days))
+        full = timed(lambda session: sync_forecast_inputs(session, vendor_id, days))
+        since = datetime.now()
+        incremental = timed(lambda session: sync_forecast_inputs(session, vendor_id, days, since))
+
+        print(f"{bundles} bundles over {days} days, {days * 12} slots")
+        print(f"one by one: {one_by_one * 1000:.1f}ms")
+        print(f"full sync: {full * 1000:.1f}ms ({one_by_one / full:.1f}x)")
+        print(f"incremental sync with nothing changed: {incremental * 1000:.1f}ms")
+    finally:
+        cleanup(template_id, user_ids)
+
+
+if __name__ == "__main__":
+
+    # python -m benchmarks.forecast_input_sync --days 60 --per-slot 5
+    # run against a development database, everything seeded is deleted afterwards
+
+    parser = argparse.ArgumentParser(description="time syncing one vendors forecast inputs")
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--per-slot", type=int, default=5)
+    args = parser.parse_args()
+
+    run(args.days, args.per_slot)
@@ -0,0 +1,102 @@
+from sqlmodel import Session, select, delete
+from app.models import Forecast_Output, Template
+from app.core.database import engine
+from app.forecasting.forecast_outputs import write_forecast_outputs
+from benchmarks.reservation_concurrency import seed, cleanup
+from datetime import date, time, timedelta
+import argparse
+import time as timer
+
+# times writing a forecast run of --outputs rows the old way (update_or_create, a SELECT per row) against
+# write_forecast_outputs, both into an empty table and over a run that is already stored
+
+
+def update_or_create(session: Session, output: Forecast_Output):
+    # what every forecast used to do for each slot
+    existing = session.exec(select(Forecast_Output).where(
+        Forecast_Output.vendor_id == output.vendor_id,
+        Forecast_Output.template_id == output.template_id,
+        Forecast_Output.date == output.date,
+        Forecast_Output.slot_start == output.slot_start,
+        Forecast_Output.slot_end == output.slot_end,
+        Forecast_Output.model_type == output.model_type,
+    )).first()
+    if existing:
+        existing.reservation_prediction = output.reservation_prediction
+        existing.no_show_prediction = output.no_show_prediction
+        existing.recommendation = output.recommendation
+        existing.rationale = output.rationale
+        existing.confidence = output.confidence
+        session.add(existing)
+    else:
+        session.add(output)
+
+
+def forecast_run(vendor_id: int, template_id: int, count: int, reserved: int) -> list[Forecast_Output]:
+    """count outputs over every 2 hour slot of the days ahead, for each of the three models"""
+    outputs = []
+    day = 0
+    while len(outputs) < count:
+        for hour in range(0, 24, 2):
+            for model_type in ("seasonal_naive", "moving_average", "linear_regression"):
+                outputs.append(Forecast_Output(
+                    vendor_id=vendor_id, template_id=template_id, date=date.today() + timedelta(days=day),
+                    slot_start=time(hour), slot_end=time((hour + 2) % 24), model_type=model_type,
+                    reservation_prediction=reserved, no_show_prediction=1, recommendation=f"Post {reserved} bundles",
+                    rationale="benchmark", confidence=0.5,
+                ))
+        day += 1
+    return outputs[:count]
+
+
+def timed(write, outputs: list[Forecast_Output]) -> tuple[float, object]:
+    with Session(engine) as session:
+        start = timer.perf_counter()
+        result = write(session, outputs)
+        session.commit()
+        return timer.perf_counter() - start, result
+
+
+def one_by_one(session: Session, outputs: list[Forecast_Output]):
+    for output in outputs:
+        update_or_create(session, output)
+
+
+def clear(vendor_id: int):
+    with Session(engine) as session:
+        session.exec(delete(Forecast_Output).where(Forecast_Output.vendor_id == vendor_id))
+        session.commit()
+
+
+def run(count: int):
+    template_id, _, user_ids = seed(0, 0)
+    try:
+        with Session(engine) as session:
+            vendor_id = session.exec(select(Template.vendor).where(Template.template_id == template_id)).one()
+
+        old_insert, _ = timed(one_by_one, forecast_run(vendor_id, template_id, count, 1))
+        old_update, _ = timed(one_by_one, forecast_run(vendor_id, template_id, count, 2))
+        clear(vendor_id)
+        bulk_insert, inserted = timed(write_forecast_outputs, forecast_run(vendor_id, template_id, count, 1))
+        bulk_update, updated = timed(write_forecast_outputs, forecast_run(vendor_id, template_id, count, 2))
+
+        print(f"{count} forecast outputs")
+        print(f"into an empty table, one by one: {old_insert * 1000:.1f}ms, bulk: {bulk_insert * 1000:.1f}ms "
+              f"({old_insert / bulk_insert:.1f}x, {inserted.inserted} inserted {inserted.updated} updated)")
+        print(f"over the stored run, one by one: {old_update * 1000:.1f}ms, bulk: {bulk_update * 1000:.1f}ms "
+              f"({old_update / bulk_update:.1f}x, {updated.inserted} inserted {updated.updated} updated)")
+    finally:
+        # the outputs go with the vendor
+        cleanup(template_id, user_ids)
+
+
+if __name__ == "__main__":
+
+    # python -m benchmarks.forecast_output_writes --outputs 10000
+    # run against a development database, everything seeded is deleted afterwards
+
+    parser = argparse.ArgumentParser(description="time writing a forecast run to forecast_output")
+    parser.add_argument("--outputs", type=int, default=10000)
+    args = parser.parse_args()
+
+    run(args.outputs)
@@ -0,0 +1,117 @@
+from sqlmodel import Session, select, func, delete
+from app.models import User, Vendor, Customer, Template, Bundle, Reservation, Vendor_Listing, Vendor_Listing_Reserved
+from app.core.database import engine
+from app.core.reservation_engine import reserve_bundle
+from app.core.bundle_engine import post_bundles
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from collections import Counter
+import argparse
+import time
+
+
+def seed(bundles: int, customers: int) -> tuple[int, list[int], list[int]]:
+    """
+    creates a throwaway vendor with one template, `bundles` bundles for today and `customers` customers
+    returns (template_id, customer_ids, user_ids) so the run can be cleaned up afterwards
+    """
+    with Session(engine) as session:
+        vendor_user = User(email=f"bench_vendor_{time.time_ns()}@bench.local", password_hash="x", role="vendor")
+        session.add(vendor_user)
+        session.flush()
+
+        vendor = Vendor(user_id=vendor_user.user_id, name="bench vendor", street="1 street", city="Exeter",
+                        post_code="EX44QJ", phone_number="01392 000000", opening_hours="09:00-17:00", validated=True)
+        session.add(vendor)
+        session.flush()
+
+        template = Template(title="bench bundle", description="benchmark", estimated_value=10.0, cost=1.0,
+                            meat_percent=0.33, carb_percent=0.33, veg_percent=0.34, carbon_saved=1.0,
+                            weight=1.0, vendor=vendor.vendor_id)
+        session.add(template)
+        session.flush()
+
+        if bundles:
+            post_bundles(session, vendor.vendor_id, {template.template_id: bundles})
+
+        user_ids = [vendor_user.user_id]
+        customer_ids = []
+        for i in range(customers):
+            user = User(email=f"bench_customer_{i}_{time.time_ns()}@bench.local", password_hash="x", role="customer")
+            session.add(user)
+            session.flush()
+            customer = Customer(user_id=user.user_id, name=f"bench{i}", post_code="EX44QJ")
+            session.add(customer)
+            session.flush()
+            user_ids.append(user.user_id)
+            customer_ids.append(customer.customer_id)
+
+        session.commit()
+        return template.template_id, customer_ids, user_ids
+
+
+def reserve(template_id: int, customer_id: int) -> str:
+    # each request gets its own session just like a request handled by the api
+    with Session(engine) as session:
+        try:
+            reserve_bundle(session, template_id, customer_id)
+            return "reserved"
+        except HTTPException as e:
+            return "sold_out" if e.status_code == 404 else f"error_{e.status_code}"
+
+
+def cleanup(template_id: int, user_ids: list[int]):
+    with Session(engine) as session:
+        bundle_ids = select(Bundle.bundle_id).where(Bundle.template_id == template_id)
+        session.exec(delete(Reservation).where(Reservation.bundle_id.in_(bundle_ids)))
+        session.exec(delete(Bundle).where(Bundle.template_id == template_id))
+        vendor_ids = select(Vendor.vendor_id).where(Vendor.user_id.in_(user_ids))
+        session.exec(delete(Vendor_Listing).where(Vendor_Listing.vendor_id.in_(vendor_ids)))
+        session.exec(delete(Vendor_Listing_Reserved).where(Vendor_Listing_Reserved.vendor_id.in_(vendor_ids)))
+        session.exec(delete(Template).where(Template.template_id == template_id))
+        session.exec(delete(Customer).where(Customer.user_id.in_(user_ids)))
+        session.exec(delete(Vendor).where(Vendor.user_id.in_(user_ids)))
+        session.exec(delete(User).where(User.user_id.in_(user_ids)))
+        session.commit()
+
+
+def run(bundles: int, requests: int, workers: int):
+    template_id, customer_ids, user_ids = seed(bundles, requests)
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            outcomes = list(pool.map(lambda cid: reserve(template_id, cid), customer_ids))
+        elapsed = time.perf_counter() - start
+
+        with Session(engine) as session:
+            # a bundle with more than one reservation has been sold twice
+            per_bundle = (
+                select(Reservation.bundle_id, func.count().label("cnt"))
+                .join(Bundle, Bundle.bundle_id == Reservation.bundle_id)
+                .where(Bundle.template_id == template_id)
+                .group_by(Reservation.bundle_id)
+            ).subquery()
+            double_sold = session.exec(select(func.count()).select_from(per_bundle).where(per_bundle.c.cnt > 1)).one()
+            reserved = session.exec(select(func.sum(per_bundle.c.cnt))).one() or 0
+
+        counts = Counter(outcomes)
+        print(f"requests: {requests}, bundles: {bundles}, workers: {workers}")
+        print(f"elapsed: {elapsed:.3f}s, throughput: {requests / elapsed:.1f} reserves/s")
+        print(f"outcomes: {dict(counts)}")
+        print(f"reservations stored: {reserved}, double sold bundles: {double_sold}")
+    finally:
+        cleanup(template_id, user_ids)
+
+
+if __name__ == "__main__":
+
+    # python -m benchmarks.reservation_concurrency --bundles 200 --requests 500 --workers 50
+    # run against a development database, everything seeded is deleted afterwards
+
+    parser = argparse.ArgumentParser(description="fire parallel reserves at one template")
+    parser.add_argument("--bundles", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=50)
+    args = parser.parse_args()
+
+    run(args.bundles, args.requests, args.workers)
@@ -0,0 +1,107 @@
+from sqlmodel import Session, select
+from app.models import Forecast_Input, Template
+from app.core.database import engine
+from app.forecasting.database_creation.generate_input_forecasts import sync_forecast_inputs
+from app.forecasting.linear_regression.preprocessing import create_train_data, get_vendors_performance, get_rolling_avg_field
+from benchmarks.reservation_concurrency import seed, cleanup
+from benchmarks.forecast_input_sync import seed_history
+from datetime import date, timedelta
+import argparse
+import numpy as np
+import pandas as pd
+import time as timer
+
+# times building the training set the old way (get_vendors_performance per cutoff date, get_rolling_avg_field twice
+# per record) against create_train_data, and checks both give the same features
+# by default a few vendors with a history are seeded, --no-seed runs on whatever is in the database (eg. after
+# python -m app.forecasting.database_creation.seed_db_arden_mags)
+
+
+def extract_features_for_record(session: Session, record: Forecast_Input, vendor_stats_cache: dict) -> dict:
+    # what create_train_data used to do for every record
+    cutoff = record.date - timedelta(days=1)
+    vendor_stats = vendor_stats_cache.get(cutoff, {}).get(record.vendor_id, {})
+    return {
+        'vendor_avg_reserved': vendor_stats.get('avg_reserved', 0.0),
+        'vendor_avg_no_show': vendor_stats.get('avg_no_show', 0.0),
+        'vendor_total_records': vendor_stats.get('total_records', 0),
+        'vendor_avg_discount': vendor_stats.get('avg_discount', 0.0),
+        'template_id': record.template_id,
+        'day_of_week': record.date.weekday(),
+        'month': record.date.month,
+        'slot_start_hour': record.slot_start.hour,
+        'slot_end_hour': record.slot_end.hour,
+        'discount': record.discount,
+        'precipitation': record.precipitation,
+        'trend': (record.date - date(2020, 1, 1)).days,
+        'is_weekend': 1 if record.date.weekday() >= 5 else 0,
+        'avg_reserved_last_4w': get_rolling_avg_field(session, record.vendor_id, record.slot_start, record.slot_end,
+                                                      'bundles_reserved', date_ow=cutoff, weeks_back=6),
+        'avg_no_shows_last_4w': get_rolling_avg_field(session, record.vendor_id, record.slot_start, record.slot_end,
+                                                      'no_shows', date_ow=cutoff, weeks_back=6),
+    }
+
+
+def create_train_data_one_by_one(session: Session) -> pd.DataFrame:
+    records = session.exec(select(Forecast_Input).order_by(Forecast_Input.record_id)).all()
+    vendor_stats_cache = {cd: get_vendors_performance(session, up_to=cd, weeks_history=6)
+                          for cd in {r.date - timedelta(days=1) for r in records}}
+    rows = []
+    for rec in records:
+        feat = extract_features_for_record(session, rec, vendor_stats_cache)
+        feat['target_reserved'] = rec.bundles_reserved
+        feat['target_no_show'] = rec.no_shows
+        rows.append(feat)
+    return pd.DataFrame(rows)
+
+
+def timed(build) -> tuple[float, pd.DataFrame]:
+    with Session(engine) as session:
+        start = timer.perf_counter()
+        df = build(session)
+        return timer.perf_counter() - start, df
+
+
+def compare(one_by_one: pd.DataFrame, bulk: pd.DataFrame) -> float:
+    """the largest difference between the two, the averages come back from postgres as decimals"""
+    assert list(one_by_one.columns) == list(bulk.columns) and len(one_by_one) == len(bulk)
+    return float(np.max(np.abs(one_by_one.astype(float).to_numpy() - bulk.astype(float).to_numpy()), initial=0.0))
+
+
+def run(vendors: int, days: int, per_slot: int, seed_data: bool):
+    seeded = []
+    try:
+        if seed_data:
+            for _ in range(vendors):
+                template_id, customer_ids, user_ids = seed(0, 5)
+                seeded.append((template_id, user_ids))
+                seed_history(template_id, customer_ids, days, per_slot)
+                with Session(engine) as session:
+                    vendor_id = session.exec(select(Template.vendor).where(Template.template_id == template_id)).one()
+                    sync_forecast_inputs(session, vendor_id, days)
+
+        one_by_one, old = timed(create_train_data_one_by_one)
+        bulk, new = timed(create_train_data)
+
+        print(f"{len(new)} forecast inputs")
+        print(f"one by one: {one_by_one * 1000:.1f}ms")
+        print(f"bulk: {bulk * 1000:.1f}ms ({one_by_one / bulk:.1f}x)")
+        print(f"largest difference between the features: {compare(old, new):.3g}")
+    finally:
+        for template_id, user_ids in seeded:
+            cleanup(template_id, user_ids)
+
+
+if __name__ == "__main__":
+
+    # python -m benchmarks.training_features --vendors 3 --days 90
+    # run against a development database, everything seeded is deleted afterwards
+
+    parser = argparse.ArgumentParser(description="time building the linear regression training set")
+    parser.add_argument("--vendors", type=int, default=3)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--per-slot", type=int, default=2)
+    parser.add_argument("--no-seed", action="store_true")
+    args = parser.parse_args()
+
+    run(args.vendors, args.days, args.per_slot, not args.no_seed)
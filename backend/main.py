@@ -5,7 +5,12 @@ from fastapi.staticfiles import StaticFiles
 from app.core.database import create_db_and_tables
 from app.api import customers, auth, vendors, bundles, templates, reservations, forecasting, analytics, reports, admin
 from app.core.database import engine, create_db_and_tables 
-from sqlmodel import SQLModel
+from app.core.geocoding import get_postcode_index, fill_missing_coordinates
+from app.core.vendor_listing import rebuild_vendor_listing
+from app.core.forecast_ingestion import forecast_ingestion_loop, FORECAST_SYNC_IN_APP, FORECAST_SYNC_INTERVAL
+from datetime import datetime
+from sqlmodel import SQLModel, Session
+import asyncio
 import os
 
 # this function will handle the start up, and shut down of the app
@@ -14,9 +19,20 @@ async def lifespan(app: FastAPI):
     # things written above yield happen when the app starts 
     # like creating the db
     create_db_and_tables()
+    # load the postcode index once so no request pays for it, and give older profiles their coordinates
+    get_postcode_index()
+    with Session(engine) as session:
+        fill_missing_coordinates(session)
+        # bundles may have changed while the app was down (eg. seeding), recount todays vendor list
+        rebuild_vendor_listing(session, datetime.now().date())
+        session.commit()
     os.makedirs("uploads", exist_ok=True)
+    # keep the forecast inputs the analytics read up to date in the background, only on the worker it is turned on for
+    ingestion = asyncio.create_task(forecast_ingestion_loop()) if FORECAST_SYNC_IN_APP and FORECAST_SYNC_INTERVAL > 0 else None
     yield
     # write shut down here
+    if ingestion:
+        ingestion.cancel()
 
 # starts fast api app 
 app = FastAPI(lifespan=lifespan)
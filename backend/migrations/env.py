@@ -0,0 +1,53 @@
+from logging.config import fileConfig
+from alembic import context
+from sqlmodel import SQLModel
+from app.core.database import engine
+import app.models # registers every table on SQLModel.metadata
+
+# alembic runs this file for every command
+# migrations use the app's engine (so the same DATABASE_URL and pool settings)
+
+target_metadata = SQLModel.metadata
+
+# only log from the alembic command line, the app has its own logging set up
+if context.config.config_file_name and "connection" not in context.config.attributes:
+    fileConfig(context.config.config_file_name)
+
+
+def run_migrations_offline():
+    # alembic upgrade head --sql prints the sql instead of running it
+    context.configure(
+        url=engine.url.render_as_string(hide_password=False),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        render_as_batch=engine.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    # the app passes in its own connection when it migrates on start up
+    connection = context.config.attributes.get("connection")
+    if connection is not None:
+        run_with(connection)
+        return
+
+    with engine.connect() as connection:
+        run_with(connection)
+
+
+def run_with(connection):
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        render_as_batch=connection.dialect.name == "sqlite", # sqlite can only alter tables by copying them
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
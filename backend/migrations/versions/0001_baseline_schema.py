@@ -0,0 +1,204 @@
+"""baseline schema
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-18 11:07:09.856927
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('allergen',
+    sa.Column('allergen_id', sa.Integer(), nullable=False),
+    sa.Column('title', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.PrimaryKeyConstraint('allergen_id')
+    )
+    op.create_table('badge',
+    sa.Column('badge_id', sa.Integer(), nullable=False),
+    sa.Column('title', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('description', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('user_role', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('metric', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('threshold', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('badge_id')
+    )
+    op.create_table('user',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('password_hash', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('email', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('role', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id'),
+    sa.UniqueConstraint('email')
+    )
+    op.create_table('customer',
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('post_code', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('store_credit', sa.Float(), nullable=False),
+    sa.Column('carbon_saved', sa.Float(), nullable=False),
+    sa.Column('food_saved', sa.Float(), nullable=False),
+    sa.Column('money_saved', sa.Float(), nullable=False),
+    sa.Column('rating', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.user_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('customer_id')
+    )
+    op.create_table('user_badge',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('badge_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['badge_id'], ['badge.badge_id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.user_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'badge_id')
+    )
+    op.create_table('vendor',
+    sa.Column('vendor_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('street', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('city', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('post_code', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('phone_number', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('opening_hours', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('photo', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('total_revenue', sa.Float(), nullable=False),
+    sa.Column('carbon_saved', sa.Float(), nullable=False),
+    sa.Column('food_saved', sa.Float(), nullable=False),
+    sa.Column('validated', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.user_id'], ),
+    sa.PrimaryKeyConstraint('vendor_id')
+    )
+    op.create_table('report',
+    sa.Column('report_id', sa.Integer(), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=True),
+    sa.Column('vendor_id', sa.Integer(), nullable=True),
+    sa.Column('title', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('complaint', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('responded', sa.Boolean(), nullable=False),
+    sa.Column('response', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('date_made', sa.Date(), nullable=False),
+    sa.Column('date_responded', sa.Date(), nullable=True),
+    sa.ForeignKeyConstraint(['customer_id'], ['customer.customer_id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['vendor_id'], ['vendor.vendor_id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('report_id')
+    )
+    op.create_table('streak',
+    sa.Column('streak_id', sa.Integer(), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=True),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('started', sa.Date(), nullable=False),
+    sa.Column('last', sa.Date(), nullable=False),
+    sa.Column('ended', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['customer_id'], ['customer.customer_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('streak_id')
+    )
+    op.create_table('template',
+    sa.Column('template_id', sa.Integer(), nullable=False),
+    sa.Column('title', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('description', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('estimated_value', sa.Float(), nullable=False),
+    sa.Column('cost', sa.Float(), nullable=False),
+    sa.Column('meat_percent', sa.Float(), nullable=False),
+    sa.Column('carb_percent', sa.Float(), nullable=False),
+    sa.Column('veg_percent', sa.Float(), nullable=False),
+    sa.Column('carbon_saved', sa.Float(), nullable=True),
+    sa.Column('weight', sa.Float(), nullable=False),
+    sa.Column('is_vegan', sa.Boolean(), nullable=False),
+    sa.Column('is_vegetarian', sa.Boolean(), nullable=False),
+    sa.Column('vendor', sa.Integer(), nullable=True),
+    sa.Column('photo', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.ForeignKeyConstraint(['vendor'], ['vendor.vendor_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('template_id')
+    )
+    op.create_table('allergen_template',
+    sa.Column('allergen_id', sa.Integer(), nullable=False),
+    sa.Column('template_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['allergen_id'], ['allergen.allergen_id'], ),
+    sa.ForeignKeyConstraint(['template_id'], ['template.template_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('allergen_id', 'template_id')
+    )
+    op.create_table('bundle',
+    sa.Column('bundle_id', sa.Integer(), nullable=False),
+    sa.Column('template_id', sa.Integer(), nullable=True),
+    sa.Column('picked_up', sa.Boolean(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('time', sa.Time(), nullable=False),
+    sa.Column('purchased_by', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['purchased_by'], ['customer.customer_id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['template_id'], ['template.template_id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('bundle_id')
+    )
+    op.create_table('forecast_input',
+    sa.Column('record_id', sa.Integer(), nullable=False),
+    sa.Column('vendor_id', sa.Integer(), nullable=True),
+    sa.Column('template_id', sa.Integer(), nullable=True),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('slot_start', sa.Time(), nullable=False),
+    sa.Column('slot_end', sa.Time(), nullable=False),
+    sa.Column('discount', sa.Float(), nullable=False),
+    sa.Column('precipitation', sa.Float(), nullable=False),
+    sa.Column('bundles_posted', sa.Integer(), nullable=False),
+    sa.Column('bundles_reserved', sa.Integer(), nullable=False),
+    sa.Column('no_shows', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['template_id'], ['template.template_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['vendor_id'], ['vendor.vendor_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('record_id')
+    )
+    op.create_table('forecast_output',
+    sa.Column('output_id', sa.Integer(), nullable=False),
+    sa.Column('vendor_id', sa.Integer(), nullable=True),
+    sa.Column('template_id', sa.Integer(), nullable=True),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('slot_start', sa.Time(), nullable=False),
+    sa.Column('slot_end', sa.Time(), nullable=False),
+    sa.Column('model_type', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('reservation_prediction', sa.Integer(), nullable=False),
+    sa.Column('no_show_prediction', sa.Integer(), nullable=False),
+    sa.Column('recommendation', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('rationale', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('confidence', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['template_id'], ['template.template_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['vendor_id'], ['vendor.vendor_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('output_id')
+    )
+    op.create_table('reservation',
+    sa.Column('reservation_id', sa.Integer(), nullable=False),
+    sa.Column('bundle_id', sa.Integer(), nullable=True),
+    sa.Column('customer_id', sa.Integer(), nullable=True),
+    sa.Column('time_created', sa.DateTime(), nullable=False),
+    sa.Column('status', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('code', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['bundle_id'], ['bundle.bundle_id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['customer_id'], ['customer.customer_id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('reservation_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('reservation')
+    op.drop_table('forecast_output')
+    op.drop_table('forecast_input')
+    op.drop_table('bundle')
+    op.drop_table('allergen_template')
+    op.drop_table('template')
+    op.drop_table('streak')
+    op.drop_table('report')
+    op.drop_table('vendor')
+    op.drop_table('user_badge')
+    op.drop_table('customer')
+    op.drop_table('user')
+    op.drop_table('badge')
+    op.drop_table('allergen')
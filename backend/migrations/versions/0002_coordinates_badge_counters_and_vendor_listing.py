@@ -0,0 +1,64 @@
+"""coordinates, badge counters and vendor listing
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 11:07:56.427370
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, Sequence[str], None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('vendor_listing',
+    sa.Column('vendor_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('bundle_count', sa.Integer(), nullable=False),
+    sa.Column('vegan_count', sa.Integer(), nullable=False),
+    sa.Column('vegetarian_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['vendor_id'], ['vendor.vendor_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('vendor_id', 'date')
+    )
+    # existing customers start at 0 and are recounted below
+    op.add_column('customer', sa.Column('bundles_saved', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('customer', sa.Column('streak_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('customer', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('customer', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('vendor', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('vendor', sa.Column('longitude', sa.Float(), nullable=True))
+    op.create_index(op.f('ix_vendor_latitude'), 'vendor', ['latitude'], unique=False)
+    op.create_index(op.f('ix_vendor_longitude'), 'vendor', ['longitude'], unique=False)
+
+    # same as recount_customer_metrics in core/badge_engine.py
+    # coordinates are filled on start up and the vendor listing is rebuilt on start up, so neither is done here
+    op.execute("""
+        UPDATE customer SET
+            bundles_saved = (SELECT count(*) FROM reservation
+                             WHERE reservation.customer_id = customer.customer_id AND reservation.status = 'collected'),
+            streak_count = (SELECT coalesce(max(streak.count), 0) FROM streak
+                            WHERE streak.customer_id = customer.customer_id AND streak.ended IS false)
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_vendor_longitude'), table_name='vendor')
+    op.drop_index(op.f('ix_vendor_latitude'), table_name='vendor')
+    op.drop_column('vendor', 'longitude')
+    op.drop_column('vendor', 'latitude')
+    op.drop_column('customer', 'longitude')
+    op.drop_column('customer', 'latitude')
+    op.drop_column('customer', 'streak_count')
+    op.drop_column('customer', 'bundles_saved')
+    op.drop_table('vendor_listing')
@@ -0,0 +1,50 @@
+"""hot query indexes
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 11:20:41.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, Sequence[str], None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the indexes declared on the models, tests/test_query_plans.py checks the queries use them
+    op.create_index('ix_bundle_template_date_purchased', 'bundle', ['template_id', 'date', 'purchased_by'], unique=False)
+    op.create_index('ix_bundle_unclaimed', 'bundle', ['template_id', 'date'], unique=False,
+                    postgresql_where=sa.text('purchased_by IS NULL'), sqlite_where=sa.text('purchased_by IS NULL'))
+    op.create_index(op.f('ix_reservation_bundle_id'), 'reservation', ['bundle_id'], unique=False)
+    op.create_index('ix_reservation_customer_status', 'reservation', ['customer_id', 'status'], unique=False)
+    op.create_index(op.f('ix_template_vendor'), 'template', ['vendor'], unique=False)
+    op.create_index('ix_vendor_listing_date', 'vendor_listing', ['date'], unique=False)
+    op.create_index('ix_streak_active', 'streak', ['customer_id'], unique=False,
+                    postgresql_where=sa.text('ended IS false'), sqlite_where=sa.text('ended IS 0'))
+    op.create_index('ix_forecast_input_vendor_date_slot', 'forecast_input',
+                    ['vendor_id', 'date', 'slot_start', 'slot_end'], unique=False)
+    op.create_index('ix_forecast_output_vendor_template_date_slot', 'forecast_output',
+                    ['vendor_id', 'template_id', 'date', 'slot_start', 'slot_end', 'model_type'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_forecast_output_vendor_template_date_slot', table_name='forecast_output')
+    op.drop_index('ix_forecast_input_vendor_date_slot', table_name='forecast_input')
+    op.drop_index('ix_streak_active', table_name='streak')
+    op.drop_index('ix_vendor_listing_date', table_name='vendor_listing')
+    op.drop_index(op.f('ix_template_vendor'), table_name='template')
+    op.drop_index('ix_reservation_customer_status', table_name='reservation')
+    op.drop_index(op.f('ix_reservation_bundle_id'), table_name='reservation')
+    op.drop_index('ix_bundle_unclaimed', table_name='bundle')
+    op.drop_index('ix_bundle_template_date_purchased', table_name='bundle')
@@ -0,0 +1,49 @@
+"""sell through rollup
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 15:42:18.304117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, Sequence[str], None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('vendor_listing', sa.Column('collected_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('vendor_listing', sa.Column('no_show_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # until now only days with bundles posted since the last start up had rows, the analytics need every day
+    # same as rebuild_vendor_listing in core/vendor_listing.py for every vendor and every day
+    op.execute("DELETE FROM vendor_listing")
+    op.execute("""
+        INSERT INTO vendor_listing (vendor_id, date, bundle_count, vegan_count, vegetarian_count,
+                                    collected_count, no_show_count)
+        SELECT template.vendor, bundle.date,
+               count(DISTINCT bundle.bundle_id) FILTER (WHERE bundle.purchased_by IS NULL AND bundle.picked_up IS false),
+               count(DISTINCT bundle.bundle_id) FILTER (WHERE template.is_vegan = true),
+               count(DISTINCT bundle.bundle_id) FILTER (WHERE template.is_vegetarian = true),
+               count(reservation.reservation_id) FILTER (WHERE reservation.status = 'collected'),
+               count(reservation.reservation_id) FILTER (WHERE reservation.status = 'no_show')
+        FROM bundle
+        JOIN template ON template.template_id = bundle.template_id
+        LEFT OUTER JOIN reservation ON reservation.bundle_id = bundle.bundle_id
+        GROUP BY template.vendor, bundle.date
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('vendor_listing', 'no_show_count')
+    op.drop_column('vendor_listing', 'collected_count')
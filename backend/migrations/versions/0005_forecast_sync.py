@@ -0,0 +1,34 @@
+"""forecast sync watermark
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 16:20:04.118532
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, Sequence[str], None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('forecast_sync',
+    sa.Column('vendor_id', sa.Integer(), nullable=False),
+    sa.Column('synced_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['vendor_id'], ['vendor.vendor_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('vendor_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('forecast_sync')
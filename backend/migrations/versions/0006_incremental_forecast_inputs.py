@@ -0,0 +1,48 @@
+"""incremental forecast inputs
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 17:05:41.672390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, Sequence[str], None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # existing days count as changed now
+    op.add_column('vendor_listing', sa.Column('changed_at', sa.DateTime(), nullable=False,
+                                              server_default=sa.text('CURRENT_TIMESTAMP')))
+
+    # the old select then insert sync could write the same slot twice, keep the first row of each
+    op.execute("""
+        DELETE FROM forecast_input WHERE record_id NOT IN (
+            SELECT min(record_id) FROM forecast_input GROUP BY vendor_id, date, slot_start, slot_end, template_id
+        )
+    """)
+    # the unique index starts with the same columns so it replaces the old one
+    op.drop_index('ix_forecast_input_vendor_date_slot', table_name='forecast_input')
+    op.create_index('ux_forecast_input_vendor_date_slot_template', 'forecast_input',
+                    ['vendor_id', 'date', 'slot_start', 'slot_end', 'template_id'], unique=True)
+
+    # the marks were taken before days were tracked, the next ingestion redoes every vendors whole window
+    op.execute("DELETE FROM forecast_sync")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ux_forecast_input_vendor_date_slot_template', table_name='forecast_input')
+    op.create_index('ix_forecast_input_vendor_date_slot', 'forecast_input',
+                    ['vendor_id', 'date', 'slot_start', 'slot_end'], unique=False)
+    op.drop_column('vendor_listing', 'changed_at')
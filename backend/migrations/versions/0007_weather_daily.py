@@ -0,0 +1,37 @@
+"""weather daily
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 18:02:17.408215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, Sequence[str], None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('weather_daily',
+    sa.Column('latitude', sa.Float(), nullable=False),
+    sa.Column('longitude', sa.Float(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('precipitation', sa.Float(), nullable=False),
+    sa.Column('is_forecast', sa.Boolean(), nullable=False),
+    sa.Column('fetched_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('latitude', 'longitude', 'date')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('weather_daily')
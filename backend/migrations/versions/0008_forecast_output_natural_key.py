@@ -0,0 +1,40 @@
+"""forecast output natural key
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 19:12:06.318402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, Sequence[str], None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # update_or_create could write the same slot twice, keep the newest row of each
+    op.execute("""
+        DELETE FROM forecast_output WHERE output_id NOT IN (
+            SELECT max(output_id) FROM forecast_output GROUP BY vendor_id, template_id, date, slot_start, slot_end, model_type
+        )
+    """)
+    # the unique index has the same columns so it replaces the old one
+    op.drop_index('ix_forecast_output_vendor_template_date_slot', table_name='forecast_output')
+    op.create_index('ux_forecast_output_vendor_template_date_slot_model', 'forecast_output',
+                    ['vendor_id', 'template_id', 'date', 'slot_start', 'slot_end', 'model_type'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ux_forecast_output_vendor_template_date_slot_model', table_name='forecast_output')
+    op.create_index('ix_forecast_output_vendor_template_date_slot', 'forecast_output',
+                    ['vendor_id', 'template_id', 'date', 'slot_start', 'slot_end', 'model_type'], unique=False)
@@ -0,0 +1,43 @@
+"""forecast cache
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 20:04:37.512908
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, Sequence[str], None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('forecast_snapshot',
+    sa.Column('vendor_id', sa.Integer(), nullable=False),
+    sa.Column('model_type', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('start_date', sa.Date(), nullable=False),
+    sa.Column('days_ahead', sa.Integer(), nullable=False),
+    sa.Column('watermark', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('model_version', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('made_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['vendor_id'], ['vendor.vendor_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('vendor_id', 'model_type', 'start_date', 'days_ahead')
+    )
+    op.add_column('forecast_sync', sa.Column('changed_at', sa.DateTime(), nullable=True))
+    # nothing is known about earlier changes, the last sync is the closest there is
+    op.execute("UPDATE forecast_sync SET changed_at = synced_at")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('forecast_sync', 'changed_at')
+    op.drop_table('forecast_snapshot')
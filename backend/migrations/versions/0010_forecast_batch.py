@@ -0,0 +1,53 @@
+"""forecast batch
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 21:12:05.418337
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010'
+down_revision: Union[str, Sequence[str], None] = '0009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('forecast_batch',
+    sa.Column('batch_id', sa.Integer(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('start_date', sa.Date(), nullable=False),
+    sa.Column('days_ahead', sa.Integer(), nullable=False),
+    sa.Column('workers', sa.Integer(), nullable=False),
+    sa.Column('vendors', sa.Integer(), nullable=False),
+    sa.Column('failed', sa.Integer(), nullable=False),
+    sa.Column('rows_written', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('batch_id')
+    )
+    op.create_table('forecast_batch_vendor',
+    sa.Column('batch_id', sa.Integer(), nullable=False),
+    sa.Column('vendor_id', sa.Integer(), nullable=False),
+    sa.Column('model_type', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('seconds', sa.Float(), nullable=False),
+    sa.Column('rows_written', sa.Integer(), nullable=False),
+    sa.Column('source', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('error', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.ForeignKeyConstraint(['batch_id'], ['forecast_batch.batch_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['vendor_id'], ['vendor.vendor_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('batch_id', 'vendor_id', 'model_type')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('forecast_batch_vendor')
+    op.drop_table('forecast_batch')
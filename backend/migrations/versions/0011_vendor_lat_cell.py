@@ -0,0 +1,37 @@
+"""vendor lat cell
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18 22:04:17.532918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0011'
+down_revision: Union[str, Sequence[str], None] = '0010'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the single column indexes are replaced by one over the band and longitude, see the nearby search in api/vendors.py
+    # the bands of existing vendors are filled on start up with their coordinates (fill_missing_coordinates)
+    op.add_column('vendor', sa.Column('lat_cell', sa.Integer(), nullable=True))
+    op.drop_index(op.f('ix_vendor_latitude'), table_name='vendor')
+    op.drop_index(op.f('ix_vendor_longitude'), table_name='vendor')
+    op.create_index('ix_vendor_lat_cell_longitude', 'vendor', ['lat_cell', 'longitude'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_vendor_lat_cell_longitude', table_name='vendor')
+    op.create_index(op.f('ix_vendor_longitude'), 'vendor', ['longitude'], unique=False)
+    op.create_index(op.f('ix_vendor_latitude'), 'vendor', ['latitude'], unique=False)
+    op.drop_column('vendor', 'lat_cell')
@@ -0,0 +1,65 @@
+"""vendor listing posted and reserved counts
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18 22:31:07.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0012'
+down_revision: Union[str, Sequence[str], None] = '0011'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # reserves and cancels are counted on their own sharded rows, vendor_listing keeps the bundles posted instead of the
+    # ones still available (see core/vendor_listing.py), both are recounted from the bundles here
+    op.create_table('vendor_listing_reserved',
+    sa.Column('vendor_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.Column('reserved_count', sa.Integer(), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['vendor_id'], ['vendor.vendor_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('vendor_id', 'date', 'shard')
+    )
+    op.create_index('ix_vendor_listing_reserved_date', 'vendor_listing_reserved', ['date'], unique=False)
+    with op.batch_alter_table('vendor_listing', schema=None) as batch_op:
+        batch_op.alter_column('bundle_count', new_column_name='posted_count')
+
+    op.execute("""
+        UPDATE vendor_listing SET posted_count = (
+            SELECT count(*) FROM bundle JOIN template ON template.template_id = bundle.template_id
+            WHERE template.vendor = vendor_listing.vendor_id AND bundle.date = vendor_listing.date)
+    """)
+    op.execute("""
+        INSERT INTO vendor_listing_reserved (vendor_id, date, shard, reserved_count, changed_at)
+        SELECT template.vendor, bundle.date, 0, count(*), CURRENT_TIMESTAMP
+        FROM bundle JOIN template ON template.template_id = bundle.template_id
+        WHERE bundle.purchased_by IS NOT NULL OR bundle.picked_up = true
+        GROUP BY template.vendor, bundle.date
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # back to the bundles still available
+    with op.batch_alter_table('vendor_listing', schema=None) as batch_op:
+        batch_op.alter_column('posted_count', new_column_name='bundle_count')
+    op.execute("""
+        UPDATE vendor_listing SET bundle_count = bundle_count - coalesce((
+            SELECT sum(reserved_count) FROM vendor_listing_reserved
+            WHERE vendor_listing_reserved.vendor_id = vendor_listing.vendor_id
+              AND vendor_listing_reserved.date = vendor_listing.date), 0)
+    """)
+    op.drop_index('ix_vendor_listing_reserved_date', table_name='vendor_listing_reserved')
+    op.drop_table('vendor_listing_reserved')
@@ -0,0 +1,26 @@
+import api from "./axiosConfig";
+
+// the list endpoints return one page at a time (see backend/app/api/pagination.py)
+// next_cursor is set while there are more pages, and sent back as ?cursor= to get the next one
+export interface Paged {
+  total_count?: number | null;
+  next_cursor?: string | null;
+}
+
+const PAGE_SIZE = 500; // the most the backend allows in one page
+
+// fetches every page of a list endpoint and returns them as one response, the items of each page are under `key`
+// only the first page is counted, the later ones skip the count
+export async function getAllPages<T extends Paged>(url: string, key: keyof T): Promise<T> {
+  const first = (await api.get<T>(url, { params: { limit: PAGE_SIZE } })).data;
+  const items = [...((first[key] as unknown[] | undefined) ?? [])];
+
+  let cursor = first.next_cursor;
+  while (cursor) {
+    const page = (await api.get<T>(url, { params: { limit: PAGE_SIZE, cursor, include_total: false } })).data;
+    items.push(...((page[key] as unknown[] | undefined) ?? []));
+    cursor = page.next_cursor;
+  }
+
+  return { ...first, [key]: items, next_cursor: null };
+}
@@ -1,14 +1,14 @@
 import api from "./axiosConfig";
+import { getAllPages, type Paged } from "./pagination";
 import type { Report } from "../types"
 
-export interface ReportListResponse {
-    total_count: number;
+export interface ReportListResponse extends Paged {
     reports: Report[];
 }
 
+// every page of the reports
 export const getReportList = async (): Promise<ReportListResponse> => {
-    const response = await api.get<ReportListResponse>("/reports/list");
-    return response.data;
+    return getAllPages<ReportListResponse>("/reports/list", "reports");
 };
 
 export const submitReportResponse = async (reportId: number, responseText: string) => {
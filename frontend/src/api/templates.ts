@@ -1,8 +1,8 @@
 import api from "./axiosConfig";
+import { getAllPages, type Paged } from "./pagination";
 import type { Template } from "../types";
 
-interface TemplateListResponse {
-  total_count: number;
+interface TemplateListResponse extends Paged {
   templates: Template[];
 }
 
@@ -20,11 +20,9 @@ export interface CreateTemplatePayload {
   allergen_titles: string[]; 
 }
 
+// every page of the vendors templates
 export async function getVendorTemplates(vendorId: number): Promise<TemplateListResponse> {
-  const response = await api.get<TemplateListResponse>(
-    `/templates/vendor/${vendorId}`
-  );
-  return response.data;
+  return getAllPages<TemplateListResponse>(`/templates/vendor/${vendorId}`, "templates");
 }
 
 export async function getTemplateBundleCount(templateId: number): Promise<number> {
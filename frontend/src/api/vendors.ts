@@ -1,4 +1,5 @@
 import api from "./axiosConfig";
+import { getAllPages, type Paged } from "./pagination";
 import type { Vendor } from "../types";
 
 export const getVendorProfile = async (): Promise<Vendor> => {
@@ -13,14 +14,13 @@ type HomeVendor = Vendor & {
   has_vegetarian: boolean;
 };
 
-interface VendorResponse {
-  total_count: number;
+interface VendorResponse extends Paged {
   vendors: HomeVendor[];
 }
 
+// every page of the vendor list
 export const getAllVendors = async (): Promise<VendorResponse> => {
-  const response = await api.get<VendorResponse>("/vendors");
-  return response.data;
+  return getAllPages<VendorResponse>("/vendors", "vendors");
 };
 
 export async function getVendorById(vendorId: number): Promise<Vendor> {
@@ -1,6 +1,7 @@
 import { useState, useEffect } from "react";
 import api from "../api/axiosConfig";
 import { getReportList } from "../api/reports";
+import { getAllPages, type Paged } from "../api/pagination";
 import type { Vendor, Report, User } from "../types";
 
 const CheckCircleIcon = () => (
@@ -43,8 +44,8 @@ export default function AdminDashboard() {
     const fetchVendors = async () => {
         try {
             setLoading(true);
-            const res = await api.get<{total_count: number; vendors: Vendor[]}>("/admin/vendors");
-            setUnverifiedVendors(res.data.vendors || []);
+            const res = await getAllPages<{vendors: Vendor[]} & Paged>("/admin/vendors", "vendors");
+            setUnverifiedVendors(res.vendors || []);
         } catch {
             setErrorMsg("Failed to fetch vendors.");
         } finally {
@@ -67,8 +68,8 @@ export default function AdminDashboard() {
     const fetchUsers = async () => {
         try {
             setLoading(true);
-            const res = await api.get<{total_count: number; users: User[]}>("/admin/users");
-            setAllUsers(res.data.users || []);
+            const res = await getAllPages<{users: User[]} & Paged>("/admin/users", "users");
+            setAllUsers(res.users || []);
         } catch {
             setErrorMsg("Failed to fetch users.");
         } finally {
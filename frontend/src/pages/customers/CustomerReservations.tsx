@@ -1,6 +1,7 @@
 import { useEffect, useState } from "react";
 import { useNavigate } from "react-router-dom";
 import type { Reservation } from "../../types";
+import { getAllPages, type Paged } from "../../api/pagination";
 
 export default function CustomerReservations() {
   const navigate = useNavigate();
@@ -10,15 +11,8 @@ export default function CustomerReservations() {
   useEffect(() => {
     async function fetchReservations() {
       try {
-        const token = localStorage.getItem("token");
-
-        const res = await fetch("/api/reservations/customer", {
-          headers: { Authorization: `Bearer ${token}` },
-        });
-
-        if (!res.ok) throw new Error("Failed to fetch");
-
-        const data = await res.json();
+        // every page, the list is paged by the backend
+        const data = await getAllPages<{ bundles: Reservation[] } & Paged>("/reservations/customer", "bundles");
         setReservations(data.bundles ?? []);
       } catch (err) {
         console.error(err);
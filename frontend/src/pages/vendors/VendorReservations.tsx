@@ -1,6 +1,7 @@
 import { useEffect, useState } from "react";
 import { useNavigate } from "react-router-dom";
 import type { VendorReservation } from "../../types";
+import { getAllPages, type Paged } from "../../api/pagination";
 
 export default function VendorReservations() {
   const navigate = useNavigate();
@@ -12,14 +13,8 @@ export default function VendorReservations() {
   useEffect(() => {
     async function fetchReservations() {
       try {
-        const token = localStorage.getItem("token");
-        const res = await fetch("/api/reservations/vendor", {
-          headers: { Authorization: `Bearer ${token}` },
-        });
-
-        if (!res.ok) throw new Error("Failed to fetch");
-
-        const data = await res.json();
+        // every page, the list is paged by the backend
+        const data = await getAllPages<{ bundles: VendorReservation[] } & Paged>("/reservations/vendor", "bundles");
         setReservations(data.bundles ?? []);
       } catch (err) {
         console.error(err);
@@ -3,7 +3,11 @@
 from dotenv import load_dotenv
 load_dotenv(".env.test") # loads the test env variables, create this locally with SECRET_KEY and HASH_ALGORITHM to test
 
+import os
+os.environ.setdefault("WEATHER_PROVIDER", "stub") # the tests never call the weather api
+
 import pytest
+from contextlib import contextmanager
 from fastapi import FastAPI
 from app.models import Report
 from fastapi.testclient import TestClient
@@ -16,26 +20,49 @@ from app.api.vendors import router as vendors_router
 from app.api.bundles import router as bundles_router
 from app.api.reports import router as reports_router
 from app.api.reservations import router as reservations_router
-from app.core.database import get_session
+from app.api.admin import router as admin_router
+from app.api.analytics import router as analytics_router
+from app.api.forecasting import router as forecasting_router
+from app.core.database import get_session, get_async_session
 from app.core.security import get_password_hash
+from app.core.principal_cache import principal_cache
+from app.core import geocoding
+from app.core.badge_engine import invalidate_badge_index
+from app.forecasting.forecast_cache import forecast_cache
 from app.models import User, Vendor, Customer, Allergen # UserBase no longer exists
+from app.models import Forecast_Input, Template, Bundle
 from uploads.issue_reports_data import issue_data_pool
-from sqlalchemy.pool import StaticPool
-from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy import event
+from sqlalchemy.pool import StaticPool, NullPool
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, create_engine, Session, select
+from datetime import date, time, timedelta
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 
 
-TEST_DATABASE_URL = "sqlite://"  # local database for testing
+# local database for testing, shared cache so the sync and async engines see the same in memory database
+TEST_DATABASE_URL = "sqlite:///file:testdb?mode=memory&cache=shared&uri=true"
 test_engine = create_engine(
     TEST_DATABASE_URL, 
     connect_args={"check_same_thread": False}, 
     poolclass=StaticPool
 )
 
+# the static pool of the sync engine keeps the database alive so the async engine can open fresh connections
+test_async_engine = create_async_engine(
+    "sqlite+aiosqlite:///file:testdb?mode=memory&cache=shared&uri=true",
+    poolclass=NullPool
+)
+
 def get_test_session():
     with Session(test_engine) as session:
         yield session
 
+async def get_test_async_session():
+    async with AsyncSession(test_async_engine, expire_on_commit=False) as session:
+        yield session
+
 
 @pytest.fixture
 def session(): # to make changes to db using session in test files
@@ -52,7 +79,11 @@ def app():
     app.include_router(bundles_router, prefix="/bundles")
     app.include_router(reports_router, prefix="/reports")
     app.include_router(reservations_router, prefix="/reservations")
+    app.include_router(admin_router, prefix="/admin")
+    app.include_router(analytics_router, prefix="/analytics")
+    app.include_router(forecasting_router, prefix="/forecast")
     app.dependency_overrides[get_session] = get_test_session
+    app.dependency_overrides[get_async_session] = get_test_async_session
     return app
 
 @pytest.fixture(scope="session")
@@ -64,6 +95,32 @@ def setup_test_db():
     SQLModel.metadata.create_all(test_engine) # setup local test database
     yield # tests run at this point
     SQLModel.metadata.drop_all(test_engine) # destroy local test database
+    principal_cache.clear() # user ids are reused by the next test
+    invalidate_badge_index() # so are badge ids
+    forecast_cache.clear() # and vendor ids
+
+@pytest.fixture
+def count_statements(): # with count_statements() as statements: ... collects the sql sent to the test database meanwhile
+    @contextmanager
+    def counting():
+        statements = []
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(test_engine, "before_cursor_execute", count)
+        try:
+            yield statements
+        finally:
+            event.remove(test_engine, "before_cursor_execute", count)
+    return counting
+
+@pytest.fixture
+def postcode_index(monkeypatch): # replaces the downloaded GB dataset with the postcodes used by the fixtures
+    index = geocoding.PostcodeIndex({
+        "EX4": (50.7300, -3.5300),
+        "SW1A": (51.5010, -0.1416),
+    })
+    monkeypatch.setattr(geocoding, "_index", index)
+    return index
 
 @pytest.fixture(autouse=True)
 def seed_allergens(setup_test_db):
@@ -254,6 +311,20 @@ def registered_bundle(test_client, vendor_login_response, template_factory):
     )
     return bundle_response
 
+@pytest.fixture
+def forecast_history(session, registered_bundle): # two weeks of inputs for the first template, two slots a day
+    template = session.exec(select(Template)).first()
+    # todays bundles go in one of the slots of the history, not whichever slot the test happens to run in
+    for bundle in session.exec(select(Bundle)).all():
+        bundle.time = time(12, 30)
+        session.add(bundle)
+    for day in range(1, 15):
+        for hour in (10, 12):
+            session.add(Forecast_Input(vendor_id=template.vendor, template_id=template.template_id, date=date.today() - timedelta(days=day),
+                                       slot_start=time(hour), slot_end=time(hour + 2), bundles_posted=4, bundles_reserved=day % 3))
+    session.commit()
+    return template
+
 @pytest.fixture
 def customer_factory():
     def create(
@@ -0,0 +1,41 @@
+from app.models import User
+from app.core.security import get_password_hash
+
+def test_get_pool_stats_success(test_client, session):
+    session.add(User(email="admin@byte.com", password_hash=get_password_hash("Admin123"), role="admin"))
+    session.commit()
+    token = test_client.post("/login", json={"email": "admin@byte.com", "password": "Admin123"}).json()["access_token"]
+
+    pool_response = test_client.get("/admin/pool",
+                                    headers={"Authorization": "Bearer " + token})
+    pool_response_data = pool_response.json()
+    assert pool_response_data["sync_engine"]["checked_out"] >= 0
+    assert pool_response_data["async_engine"]["timeouts"] == 0
+    assert pool_response.status_code == 200
+
+def test_get_pool_stats_wrong_role_fail(test_client, customer_login_response):
+    token = customer_login_response["access_token"]
+    pool_response = test_client.get("/admin/pool",
+                                    headers={"Authorization": "Bearer " + token})
+    assert pool_response.json()["detail"] == "Must be an admin to view the connection pools."
+    assert pool_response.status_code == 401
+
+def test_delete_user_revokes_token_success(test_client, session, customer_login_response):
+    session.add(User(email="admin@byte.com", password_hash=get_password_hash("Admin123"), role="admin"))
+    session.commit()
+    admin_token = test_client.post("/login", json={"email": "admin@byte.com", "password": "Admin123"}).json()["access_token"]
+    customer_token = customer_login_response["access_token"]
+
+    # caches the customer's principal
+    streak_response = test_client.get("/customers/streak",
+                                      headers={"Authorization": "Bearer " + customer_token})
+    assert streak_response.status_code == 200
+
+    delete_response = test_client.delete(f"/admin/users/{customer_login_response['user']['user_id']}",
+                                         headers={"Authorization": "Bearer " + admin_token})
+    assert delete_response.status_code == 200
+
+    streak_response = test_client.get("/customers/streak",
+                                      headers={"Authorization": "Bearer " + customer_token})
+    assert streak_response.json()["detail"] == "Could not validate credentials"
+    assert streak_response.status_code == 401
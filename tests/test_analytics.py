@@ -0,0 +1,72 @@
+from app.models import Forecast_Input, Vendor, Bundle, Reservation
+from app.core.forecast_ingestion import ingest_forecast_inputs, last_synced
+from app.forecasting.database_creation.generate_input_forecasts import sync_forecast_inputs, get_slot_from_time
+from sqlmodel import select, func
+from datetime import datetime
+
+def test_get_pricing_effectiveness_only_reads_success(test_client, session, vendor_login_response, registered_bundle):
+    token = vendor_login_response["access_token"]
+    pricing_response = test_client.get("/analytics/pricing_effectiveness",
+                                       headers={"Authorization": "Bearer " + token})
+
+    # nothing has been ingested yet, so there is nothing to plot and the data has never been synced
+    assert pricing_response.status_code == 200
+    assert pricing_response.json() == {"coordinates": [], "synced_at": None}
+    assert session.exec(select(func.count()).select_from(Forecast_Input)).one() == 0
+
+def test_get_sell_through_proportions_counts_reserves_without_ingestion_success(test_client, session, vendor_login_response, customer_login_response, registered_bundle):
+    customer_token = customer_login_response["access_token"]
+    vendor_headers = {"Authorization": "Bearer " + vendor_login_response["access_token"]}
+    test_client.post("reservations/1/reserve", headers={"Authorization": "Bearer " + customer_token})
+    test_client.post("reservations/1/check", headers=vendor_headers,
+                     json={"pickup_code": session.get(Reservation, 1).code})
+
+    # 5 bundles posted and one picked up, the ingestion never ran so the reserve is counted as it happened
+    sell_through_response = test_client.get("/analytics/sell_through_proportions", headers=vendor_headers)
+    assert sell_through_response.status_code == 200
+    assert sell_through_response.json()["all_time_proportions"] == {"collected": 1, "no_show": 0, "expired": 4}
+
+def test_ingest_forecast_inputs_reports_freshness_success(test_client, session, vendor_login_response, customer_login_response, registered_bundle):
+    customer_token = customer_login_response["access_token"]
+    vendor_token = vendor_login_response["access_token"]
+    test_client.post("reservations/1/reserve", headers={"Authorization": "Bearer " + customer_token})
+    vendor_id = session.exec(select(Vendor.vendor_id)).first()
+    assert last_synced(session, vendor_id) is None
+
+    assert ingest_forecast_inputs(session) == []
+
+    forecast_input = session.exec(select(Forecast_Input)).one()
+    assert (forecast_input.bundles_posted, forecast_input.bundles_reserved) == (5, 1)
+    synced_at = last_synced(session, vendor_id)
+    assert synced_at is not None
+
+    for path in ("/analytics/pricing_effectiveness", "/analytics/posting_windows", "/analytics/bestsellers"):
+        method = test_client.get if path == "/analytics/pricing_effectiveness" else test_client.post
+        response = method(path, headers={"Authorization": "Bearer " + vendor_token})
+        assert response.status_code == 200
+        assert response.json()["synced_at"] == synced_at.isoformat()
+
+def test_sync_forecast_inputs_only_redoes_changed_days_success(test_client, session, count_statements, customer_login_response, registered_bundle):
+    customer_token = customer_login_response["access_token"]
+    vendor_id = session.exec(select(Vendor.vendor_id)).first()
+
+    with count_statements() as statements:
+        assert sync_forecast_inputs(session, vendor_id) == 1
+
+    # grouped by the database and written with one upsert
+    assert len(statements) == 2
+    bundle = session.get(Bundle, 1)
+    forecast_input = session.exec(select(Forecast_Input)).one()
+    assert (forecast_input.slot_start, forecast_input.slot_end) == get_slot_from_time(bundle.time)
+    assert (forecast_input.bundles_posted, forecast_input.bundles_reserved) == (5, 0)
+
+    # nothing has changed since, so there is nothing to redo
+    synced = datetime.now()
+    assert sync_forecast_inputs(session, vendor_id, since=synced) == 0
+
+    # a reservation marks the day as changed and the same row is updated
+    test_client.post("reservations/1/reserve", headers={"Authorization": "Bearer " + customer_token})
+    assert sync_forecast_inputs(session, vendor_id, since=synced) == 1
+    session.expire_all()
+    forecast_input = session.exec(select(Forecast_Input)).one()
+    assert (forecast_input.bundles_posted, forecast_input.bundles_reserved) == (5, 1)
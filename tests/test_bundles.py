@@ -82,6 +82,47 @@ def test_create_bundle_with_template_of_an_other_vendor_role_fail(test_client, v
     assert bundle_response_data["detail"] == "You are not the vendor of the template"
     assert bundle_response.status_code == 403
 
+def test_create_bundles_bulk_success(test_client, vendor_login_response, template_factory):
+    template_factory()
+    template_factory()
+    token = vendor_login_response["access_token"]
+    bundle_response = test_client.post("/bundles/create/bulk",
+        headers={"Authorization": "Bearer " + token},
+        json={"bundles": [
+            {"template_id": 1, "amount": 3},
+            {"template_id": 2, "amount": 2}
+        ]}
+    )
+    bundle_response_data = bundle_response.json()
+    assert bundle_response.status_code == 200
+    assert bundle_response_data["created"] == [
+        {"template_id": 1, "amount": 3, "first_bundle_id": 1, "last_bundle_id": 3},
+        {"template_id": 2, "amount": 2, "first_bundle_id": 4, "last_bundle_id": 5},
+    ]
+
+    mystore_response = test_client.get("/bundles/mystore",
+        headers={"Authorization": "Bearer " + token},
+    )
+    assert mystore_response.json()["total_count"] == 5
+
+def test_create_bundles_bulk_with_a_missing_template_creates_none_fail(test_client, vendor_login_response, template_factory):
+    template_factory()
+    token = vendor_login_response["access_token"]
+    bundle_response = test_client.post("/bundles/create/bulk",
+        headers={"Authorization": "Bearer " + token},
+        json={"bundles": [
+            {"template_id": 1, "amount": 3},
+            {"template_id": 404, "amount": 2}
+        ]}
+    )
+    assert bundle_response.json()["detail"] == "No corresponding template"
+    assert bundle_response.status_code == 400
+
+    mystore_response = test_client.get("/bundles/mystore",
+        headers={"Authorization": "Bearer " + token},
+    )
+    assert mystore_response.json()["total_count"] == 0
+
 def test_get_mystore_view_of_bundles_success(test_client, vendor_login_response, registered_bundle):
     token = vendor_login_response["access_token"]
     d = datetime.now()
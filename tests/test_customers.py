@@ -370,3 +370,13 @@ def test_get_badges_owned_with_multiple_badges_success(test_client, registered_c
     assert len(badges_response_data["badges"]) == 1
     assert badges_response.status_code == 200
 
+
+def test_get_leaderboard_success(test_client, customer_login_response):
+    token = customer_login_response["access_token"]
+    leaderboard_response = test_client.get("/customers/leaderboard",
+                     headers={"Authorization": "Bearer " + token})
+    leaderboard_response_data = leaderboard_response.json()
+    assert leaderboard_response_data["total_count"] == 1
+    assert leaderboard_response_data["entries"][0]["rank"] == 1
+    assert leaderboard_response_data["entries"][0]["is_you"] == True
+    assert leaderboard_response.status_code == 200
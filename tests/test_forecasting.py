@@ -0,0 +1,383 @@
+import os
+import random
+import joblib
+import pandas as pd
+import pytest
+from datetime import date, time, timedelta
+from sqlmodel import Session, create_engine, select
+from conftest import test_engine
+from app.core.forecast_ingestion import ingest_forecast_inputs
+from app.core.weather import StubWeatherProvider, prefetch_weather, precipitation_by_day
+from app.forecasting import forecast_batch
+from app.forecasting.baseline_approaches.seasonal_naive.evaluate_seasonal_naive import naive_confidences
+from app.forecasting.baseline_approaches.seasonal_naive.seasonal_naive_forecast import get_naive_forecast_chart
+from app.forecasting.database_creation.previous_weather import backfill_weather
+from app.forecasting.forecast_cache import forecast_cache, model_forecast, FORECAST_CACHE_HEADER
+from app.forecasting.forecast_outputs import write_forecast_outputs
+from app.forecasting.linear_regression import model_registry
+from app.forecasting.linear_regression.linear_regression_forecast import predict_batch, slot_features, generate_linear_regression_forecast
+from app.forecasting.linear_regression.model_registry import ModelRegistry
+from app.forecasting.linear_regression.preprocessing import create_train_data, get_vendors_performance, get_rolling_avg_field
+from app.models import Bundle, Forecast_Batch_Vendor, Forecast_Input, Forecast_Output, Template, Vendor
+
+def write_models(model_dir, coefficient):
+    joblib.dump({"coef": coefficient}, os.path.join(model_dir, "ridge_reserved.pkl"))
+    joblib.dump({"coef": coefficient}, os.path.join(model_dir, "ridge_no_show.pkl"))
+    joblib.dump(["discount", "trend"], os.path.join(model_dir, "feature_names.pkl"))
+
+def test_model_registry_loads_each_version_once_success(tmp_path, monkeypatch):
+    write_models(tmp_path, 1)
+    loads = []
+    real_load = joblib.load
+    monkeypatch.setattr(model_registry.joblib, "load", lambda path: loads.append(path) or real_load(path))
+    registry = ModelRegistry()
+
+    first = registry.get(str(tmp_path))
+    for _ in range(10):
+        assert registry.get(str(tmp_path)) is first
+
+    # the three model files, loaded once between them all
+    assert len(loads) == 3
+    assert first.model_res == {"coef": 1}
+    assert first.feature_names == ["discount", "trend"]
+    assert first.metrics == {}
+
+def test_model_registry_reloads_a_new_version_success(tmp_path):
+    write_models(tmp_path, 1)
+    registry = ModelRegistry()
+    first = registry.get(str(tmp_path))
+
+    # what train.py does, a new version (and its metrics) written over the old one
+    write_models(tmp_path, 2)
+    joblib.dump({"reserved_mae": 1.5}, os.path.join(tmp_path, "metrics.pkl"))
+    second = registry.get(str(tmp_path))
+
+    assert second.version != first.version
+    assert second.model_res == {"coef": 2}
+    assert second.metrics == {"reserved_mae": 1.5}
+
+def test_predict_batch_matches_one_row_at_a_time_success():
+    models = model_registry.get_models()
+
+    vendor_aggr = {"avg_reserved": 3.5, "avg_no_show": 0.4, "total_records": 120, "avg_discount": 0.3}
+    rolling_cache = {(1, time(12), time(14), date(2026, 3, 2).weekday()): (4.0, 0.5)}
+    # a few days and slots, one template the models never saw
+    rows = [
+        slot_features(vendor_aggr, rolling_cache, date(2026, 3, 2) + timedelta(days=day), template_id, time(hour), time(hour + 2),
+                      precipitation=day * 0.5, discount=0.25)
+        for day in range(7) for template_id in (1, 2, 99999) for hour in (8, 12, 18)
+    ]
+    pred_res, pred_ns = predict_batch(models, rows)
+
+    # what was done for every slot before, get_dummies on the one row then aligned to the training columns
+    for row, res, ns in zip(rows, pred_res, pred_ns):
+        encoded = pd.get_dummies(pd.DataFrame([row]), columns=["template_id", "day_of_week", "month"])
+        encoded = encoded.reindex(columns=models.feature_names, fill_value=0)
+        assert res == int(round(models.model_res.predict(encoded)[0]))
+        assert ns == int(round(models.model_ns.predict(encoded)[0]))
+
+def test_weather_is_fetched_once_per_grid_cell_success(postcode_index, session, registered_vendor, registered_vendor_2):
+    provider = StubWeatherProvider(precipitation=1.5)
+    start, end = date.today(), date.today() + timedelta(days=6)
+    vendor_ids = session.exec(select(Vendor.vendor_id)).all()
+
+    # forecasting never fetches, until the weather is prefetched it is unknown
+    assert precipitation_by_day(session, vendor_ids[0], start, end) == {start + timedelta(days=i): -1.0 for i in range(7)}
+
+    # both vendors are in EX4 so they share a cell, the whole week is one request
+    assert prefetch_weather(session, start, end, weather_provider=provider) == 1
+    assert [request[2:] for request in provider.requests] == [(start, end)]
+
+    # forecasting reads the stored days
+    for vendor_id in vendor_ids:
+        precipitation = precipitation_by_day(session, vendor_id, start, end)
+        assert precipitation == {start + timedelta(days=i): 1.5 for i in range(7)}
+
+    # past the forecast horizon nothing is fetched and the weather is unknown
+    far = date.today() + timedelta(days=30)
+    assert prefetch_weather(session, far, far, weather_provider=provider) == 0
+    assert precipitation_by_day(session, vendor_ids[0], far, far) == {far: -1.0}
+    assert len(provider.requests) == 1
+
+def test_backfill_weather_requests_each_cell_once_and_resumes_success(postcode_index, session, registered_vendor, registered_vendor_2):
+    class FailingProvider:
+        def daily_precipitation(self, latitude, longitude, start, end):
+            raise ConnectionError("no network")
+
+    # three weeks of inputs for both vendors, the last few days are too recent for the archive
+    vendor_ids = session.exec(select(Vendor.vendor_id)).all()
+    for vendor_id in vendor_ids:
+        for day in range(1, 22):
+            session.add(Forecast_Input(vendor_id=vendor_id, date=date.today() - timedelta(days=day), slot_start=time(12), slot_end=time(14)))
+    session.commit()
+
+    # a failed run changes nothing and says so
+    report = backfill_weather(session, days_back=30, weather_provider=FailingProvider())
+    assert (report.cells, report.fetched, len(report.failed), report.updated) == (1, 0, 1, 0)
+
+    # the vendors share a cell so the run again is one request for the range both need
+    provider = StubWeatherProvider(precipitation=2.0)
+    progress = []
+    report = backfill_weather(session, days_back=30, weather_provider=provider, concurrency=2, progress=lambda *p: progress.append(p))
+    assert (report.cells, report.fetched, report.failed, report.updated) == (1, 1, [], 2 * 17)
+    assert [request[2:] for request in provider.requests] == [(date.today() - timedelta(days=21), date.today() - timedelta(days=5))]
+    assert progress == [(1, 1)]
+
+    session.expire_all()
+    precipitation = session.exec(select(Forecast_Input.date, Forecast_Input.precipitation)).all()
+    assert all(value == (2.0 if day <= date.today() - timedelta(days=5) else -1.0) for day, value in precipitation)
+
+    # nothing left to do
+    report = backfill_weather(session, days_back=30, weather_provider=provider)
+    assert (report.cells, report.updated, len(provider.requests)) == (0, 0, 1)
+
+def test_create_train_data_matches_the_per_record_queries_success(session, registered_vendor, registered_vendor_2):
+    # ten weeks of made up inputs with gaps, a few slots and discounts
+    rng = random.Random(7)
+    for vendor_id in session.exec(select(Vendor.vendor_id)).all():
+        for day in range(70):
+            for hour in (10, 12, 16):
+                if rng.random() < 0.7:
+                    session.add(Forecast_Input(vendor_id=vendor_id, date=date(2026, 1, 1) + timedelta(days=day),
+                                               slot_start=time(hour), slot_end=time(hour + 2), discount=rng.choice([0.25, 0.4, 0.6]),
+                                               bundles_posted=5, bundles_reserved=rng.randint(0, 5), no_shows=rng.randint(0, 2)))
+    session.commit()
+
+    train = create_train_data(session)
+    records = session.exec(select(Forecast_Input).order_by(Forecast_Input.record_id)).all()
+    assert len(train) == len(records)
+
+    for record, row in zip(records, train.to_dict("records")):
+        cutoff = record.date - timedelta(days=1)
+        stats = get_vendors_performance(session, up_to=cutoff, weeks_history=6).get(record.vendor_id, {})
+        assert row["vendor_avg_reserved"] == float(stats.get("avg_reserved", 0.0))
+        assert row["vendor_avg_no_show"] == float(stats.get("avg_no_show", 0.0))
+        assert row["vendor_total_records"] == stats.get("total_records", 0)
+        # the discounts are floats added up in a different order
+        assert row["vendor_avg_discount"] == pytest.approx(float(stats.get("avg_discount", 0.0)), rel=1e-12)
+        assert row["avg_reserved_last_4w"] == get_rolling_avg_field(session, record.vendor_id, record.slot_start, record.slot_end,
+                                                                    "bundles_reserved", date_ow=cutoff, weeks_back=6)
+        assert row["avg_no_shows_last_4w"] == get_rolling_avg_field(session, record.vendor_id, record.slot_start, record.slot_end,
+                                                                    "no_shows", date_ow=cutoff, weeks_back=6)
+        assert (row["day_of_week"], row["trend"], row["target_reserved"]) == (record.date.weekday(), (record.date - date(2020, 1, 1)).days, record.bundles_reserved)
+
+def test_linear_regression_forecast_queries_dont_grow_with_slots_success(session, count_statements, registered_bundle):
+    template = session.exec(select(Template)).first()
+
+    def add_history(hours):
+        for day in range(1, 22):
+            for hour in hours:
+                session.add(Forecast_Input(vendor_id=template.vendor, template_id=template.template_id,
+                                           date=date.today() - timedelta(days=day), slot_start=time(hour), slot_end=time(hour + 2),
+                                           bundles_posted=4, bundles_reserved=(day + hour) % 4, no_shows=day % 2))
+        session.commit()
+
+    def forecast_statements():
+        # the reads, the forecast_output writes are checked in test_forecast_outputs_are_upserted_in_one_statement_success
+        with count_statements() as statements:
+            outputs = generate_linear_regression_forecast(session, template.vendor)
+        return outputs, [statement for statement in statements if "forecast_output" not in statement]
+
+    add_history([10, 12])
+    few_outputs, few = forecast_statements()
+    add_history([8, 14, 16, 18])
+    many_outputs, many = forecast_statements()
+
+    assert (len(few_outputs), len(many_outputs)) == (14, 42)
+    assert len(many) == len(few)
+    assert sum("FROM forecast_input" in statement for statement in many) == 1
+
+def test_naive_forecast_scores_every_template_at_once_success(session, count_statements, registered_bundle):
+    # 2 reserved in every slot, except on yesterdays weekday where it swings between 4 and 2 from week to week
+    template = session.exec(select(Template)).first()
+    yesterday = date.today() - timedelta(days=1)
+    for day in range(1, 36):
+        input_date = date.today() - timedelta(days=day)
+        reserved = (4 if (day - 1) // 7 % 2 == 0 else 2) if input_date.weekday() == yesterday.weekday() else 2
+        for hour in (10, 12, 14):
+            session.add(Forecast_Input(vendor_id=template.vendor, template_id=template.template_id, date=input_date,
+                                       slot_start=time(hour), slot_end=time(hour + 2), bundles_posted=5, bundles_reserved=reserved))
+    session.commit()
+
+    # an error of 2 against 3 sold on average
+    expected = {weekday: 0.333 if weekday == yesterday.weekday() else 1.0 for weekday in range(7)}
+    assert naive_confidences(session, template.vendor) == {(template.template_id, weekday): value for weekday, value in expected.items()}
+
+    with count_statements() as statements:
+        week = get_naive_forecast_chart(session, template.vendor)
+
+    # the week being copied and the history the confidences come from, however many slots there are
+    assert sum("FROM forecast_input" in statement for statement in statements) == 2
+    assert len(week.day_datapoints) == 6
+    for day in week.day_datapoints:
+        assert day.datapoints[0].confidence == expected[date.fromisoformat(day.date).weekday()]
+
+def test_forecast_outputs_are_upserted_in_one_statement_success(session, count_statements, registered_bundle):
+    template = session.exec(select(Template)).first()
+
+    def outputs(days, reserved):
+        return [Forecast_Output(vendor_id=template.vendor, template_id=template.template_id, date=date.today() + timedelta(days=day),
+                                slot_start=time(hour), slot_end=time(hour + 2), model_type=model_type,
+                                reservation_prediction=reserved, no_show_prediction=0, recommendation="", rationale="", confidence=0.5)
+                for day in range(days) for hour in (10, 12) for model_type in ("seasonal_naive", "linear_regression")]
+
+    def write(rows):
+        with count_statements() as statements:
+            report = write_forecast_outputs(session, rows)
+        session.commit()
+        return report, sum(statement.startswith("INSERT INTO forecast_output") for statement in statements)
+
+    first, first_inserts = write(outputs(7, 1))
+    assert (first.inserted, first.updated, first_inserts) == (28, 0, 1)
+
+    # a week later run over the same days and a few more, the repeated slot is written once with its last prediction
+    second, second_inserts = write(outputs(10, 3) + outputs(1, 4)[:1])
+    assert (second.inserted, second.updated, second_inserts) == (12, 28, 1)
+
+    stored = session.exec(select(Forecast_Output).where(Forecast_Output.vendor_id == template.vendor)).all()
+    assert len(stored) == 40
+    assert sorted(output.reservation_prediction for output in stored) == [3] * 39 + [4]
+
+def test_forecast_requests_are_cached_until_the_inputs_change_success(test_client, session, vendor_login_response, forecast_history):
+    template = forecast_history
+    headers = {"Authorization": "Bearer " + vendor_login_response["access_token"]}
+
+    def forecast():
+        response = test_client.post("/forecast/naive", headers=headers)
+        assert response.status_code == 200
+        return response.headers[FORECAST_CACHE_HEADER], response.json()
+
+    # never synced, nothing to key the cache on
+    assert forecast()[0] == "miss"
+    assert forecast()[0] == "miss"
+
+    assert ingest_forecast_inputs(session) == []
+    source, computed = forecast()
+    assert source == "miss" and len(computed["day_datapoints"]) == 7
+    assert forecast() == ("memory", computed)
+
+    # another worker (or a restart) reads the outputs the first request stored
+    forecast_cache.clear()
+    assert forecast() == ("stored", computed)
+
+    # a sync that changes nothing keeps the watermark
+    assert ingest_forecast_inputs(session) == []
+    assert forecast() == ("memory", computed)
+
+    # one that does moves it, the week is worked out again and replaces the stored one
+    old_input = session.exec(select(Forecast_Input).where(Forecast_Input.date == date.today() - timedelta(days=6),
+                                                          Forecast_Input.slot_start == time(10))).one()
+    old_input.bundles_reserved = 9
+    session.add(old_input)
+    session.commit()
+    assert test_client.post("/bundles/create", headers=headers, json={"template_id": 1, "amount": 2}).status_code == 200
+    for bundle in session.exec(select(Bundle)).all():
+        bundle.time = time(12, 30) # with the others, as in forecast_history
+        session.add(bundle)
+    session.commit()
+    assert ingest_forecast_inputs(session) == []
+    source, recomputed = forecast()
+    assert source == "miss" and recomputed["day_datapoints"][0]["datapoints"][0]["predicted_sales"] == 9
+    stored = session.exec(select(Forecast_Output).where(Forecast_Output.model_type == "seasonal_naive")).all()
+    assert len(stored) == 13 # 2 slots a day and the one the bundles were posted in today
+
+def test_forecast_batch_isolates_failing_vendors_and_stores_the_forecasts_success(test_client, session, vendor_login_response, forecast_history, registered_vendor_2, monkeypatch):
+    template = forecast_history
+    for vendor in session.exec(select(Vendor)).all():
+        vendor.validated = True
+        session.add(vendor)
+    session.commit()
+    assert ingest_forecast_inputs(session) == []
+    other = session.exec(select(Vendor.vendor_id).where(Vendor.vendor_id != template.vendor)).one()
+
+    def failing_forecast(session, vendor_id, model_type, *args, **kwargs):
+        if vendor_id == other and model_type == "seasonal_naive":
+            raise RuntimeError("model blew up")
+        return model_forecast(session, vendor_id, model_type, *args, **kwargs)
+    monkeypatch.setattr(forecast_batch, "model_forecast", failing_forecast)
+
+    models = ["seasonal_naive", "linear_regression"]
+    batch = forecast_batch.run_forecast_batch(session, workers=0, model_types=models)
+    assert (batch.vendors, batch.failed, batch.workers) == (2, 1, 0)
+    assert batch.finished_at is not None
+
+    results = {(row.vendor_id, row.model_type): row for row in
+               session.exec(select(Forecast_Batch_Vendor).where(Forecast_Batch_Vendor.batch_id == batch.batch_id)).all()}
+    assert len(results) == 4
+    assert results[(other, "seasonal_naive")].error == "RuntimeError: model blew up"
+    # the failure is kept to that model, the vendors other model and the other vendor still ran
+    assert results[(other, "linear_regression")].error is None
+    assert results[(template.vendor, "seasonal_naive")].rows_written == 13
+    assert results[(template.vendor, "linear_regression")].rows_written == 14
+    assert batch.rows_written == sum(row.rows_written for row in results.values())
+
+    # the api is answered from what the batch stored
+    forecast_cache.clear()
+    headers = {"Authorization": "Bearer " + vendor_login_response["access_token"]}
+    for path in ("/forecast/naive", "/forecast/linear-regression"):
+        response = test_client.post(path, headers=headers)
+        assert response.status_code == 200
+        assert response.headers[FORECAST_CACHE_HEADER] == "stored"
+
+    # nothing changed since, a second run writes nothing
+    rerun = forecast_batch.run_forecast_batch(session, workers=0, vendor_ids=[template.vendor], model_types=models)
+    assert (rerun.vendors, rerun.failed, rerun.rows_written) == (1, 0, 0)
+
+    # once the inputs change the forecasts are stale, unless the days precomputed forecasts are served
+    session.add(Forecast_Input(vendor_id=template.vendor, template_id=template.template_id, date=date.today() - timedelta(days=7),
+                               slot_start=time(14), slot_end=time(16), bundles_posted=4, bundles_reserved=5))
+    session.commit()
+    assert test_client.post("/bundles/create", headers=headers, json={"template_id": 1, "amount": 2}).status_code == 200
+    assert ingest_forecast_inputs(session) == []
+    forecast_cache.clear()
+    tomorrow = date.today() + timedelta(days=1)
+    assert model_forecast(session, template.vendor, "seasonal_naive", tomorrow, precomputed=True)[1] == "stored"
+    forecast_cache.clear()
+    assert model_forecast(session, template.vendor, "seasonal_naive", tomorrow, precomputed=False)[1] == "miss"
+
+def forecast_vendor_in_worker(vendor_id, *args):
+    """
+    stands in for forecast_batch.forecast_vendor in the pool test, it is run by the spawned workers so it checks what
+    init_worker set up there, and fails like a crashed worker for the vendor in CRASHING_VENDOR
+    """
+    if forecast_batch.worker_engine is None:
+        raise RuntimeError("init_worker didn't make the worker engine")
+    if model_registry.MODEL_DIR not in model_registry.model_registry._entries:
+        raise RuntimeError("init_worker didn't load the models")
+    if vendor_id == int(os.environ["CRASHING_VENDOR"]):
+        raise RuntimeError("worker crashed")
+    return forecast_batch.forecast_vendor(vendor_id, *args)
+
+def test_forecast_batch_runs_vendors_in_worker_processes_success(tmp_path, session, forecast_history, registered_vendor_2, monkeypatch):
+    template = forecast_history
+    for vendor in session.exec(select(Vendor)).all():
+        vendor.validated = True
+        session.add(vendor)
+    session.commit()
+    assert ingest_forecast_inputs(session) == []
+    other = session.exec(select(Vendor.vendor_id).where(Vendor.vendor_id != template.vendor)).one()
+
+    # the workers open the database themselves, so it is copied out of memory into a file they can all reach
+    file_engine = create_engine(f"sqlite:///{tmp_path / 'batch.db'}")
+    with test_engine.connect() as source, file_engine.connect() as target:
+        source.connection.driver_connection.backup(target.connection.driver_connection)
+
+    monkeypatch.setenv("CRASHING_VENDOR", str(other))
+    monkeypatch.setattr(forecast_batch, "forecast_vendor", forecast_vendor_in_worker)
+    models = ["seasonal_naive", "linear_regression"]
+    with Session(file_engine) as file_session:
+        batch = forecast_batch.run_forecast_batch(file_session, workers=2, model_types=models)
+        assert (batch.vendors, batch.failed, batch.workers) == (2, 1, 2)
+
+        results = {(row.vendor_id, row.model_type): row for row in
+                   file_session.exec(select(Forecast_Batch_Vendor).where(Forecast_Batch_Vendor.batch_id == batch.batch_id)).all()}
+        # every model of the crashed vendor is recorded as failed, the other vendor ran in a worker
+        assert [results[(other, model_type)].error for model_type in models] == ["RuntimeError: worker crashed"] * 2
+        assert results[(template.vendor, "seasonal_naive")].error is None
+        assert results[(template.vendor, "linear_regression")].error is None
+        assert (results[(template.vendor, "seasonal_naive")].rows_written, results[(template.vendor, "linear_regression")].rows_written) == (13, 14)
+
+        # written by the workers engine to the same database
+        stored = file_session.exec(select(Forecast_Output).where(Forecast_Output.vendor_id == template.vendor)).all()
+        assert len(stored) == batch.rows_written == 27
+    file_engine.dispose()
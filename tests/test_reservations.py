@@ -1,3 +1,9 @@
+from app.models import Customer, Reservation, Badge, Vendor
+from app.analytics.sell_through_prop import proportions_all_time, sell_through_statement
+from app.core.vendor_listing import rebuild_vendor_listing
+from sqlmodel import select
+from datetime import datetime
+
 def test_post_reserve_bundle_success(test_client, customer_login_response, registered_bundle):
     token = customer_login_response["access_token"]
     reservation_response = test_client.post("reservations/1/reserve",
@@ -15,3 +21,143 @@ def test_post_reserve_bundle_when_no_bundle_exist_fail(test_client, customer_log
     reservation_response_data = reservation_response.json()
     assert reservation_response_data["detail"] == "No bundle found for that template on the current day"
     assert reservation_response.status_code == 404
+
+def test_post_reserve_more_bundles_than_available_fail(test_client, customer_login_response, registered_bundle):
+    token = customer_login_response["access_token"]
+    for i in range(5):
+        reservation_response = test_client.post("reservations/1/reserve",
+                                                headers={"Authorization": "Bearer " + token})
+        assert reservation_response.status_code == 200
+
+    reservation_response = test_client.post("reservations/1/reserve",
+                                            headers={"Authorization": "Bearer " + token})
+    assert reservation_response.json()["detail"] == "No bundle found for that template on the current day"
+    assert reservation_response.status_code == 404
+
+def test_post_reserve_bundle_debits_credit_success(test_client, customer_login_response, registered_bundle):
+    token = customer_login_response["access_token"]
+    test_client.post("reservations/1/reserve",
+                     headers={"Authorization": "Bearer " + token})
+    profile_response = test_client.get("/customers/profile",
+                                       headers={"Authorization": "Bearer " + token})
+    assert profile_response.json()["store_credit"] == 95.0
+
+def test_post_reserve_bundle_without_enough_credit_fail(test_client, session, customer_login_response, registered_bundle):
+    token = customer_login_response["access_token"]
+    customer = session.get(Customer, 1)
+    customer.store_credit = 1.0
+    session.add(customer)
+    session.commit()
+
+    reservation_response = test_client.post("reservations/1/reserve",
+                                            headers={"Authorization": "Bearer " + token})
+    assert reservation_response.json()["detail"] == "Customer does not have enough credit to purchase"
+    assert reservation_response.status_code == 403
+
+    # the claimed bundle is released again when the purchase fails
+    count_response = test_client.get("/templates/count/1",
+                                     headers={"Authorization": "Bearer " + token})
+    assert count_response.json() == 5
+
+def test_post_finalise_reservation_awards_badges_success(test_client, session, customer_login_response, vendor_login_response, registered_bundle):
+    session.add_all([
+        Badge(title="Local Helper", description="Buy 1 bundle", metric="bundles_saved", threshold=1, user_role="customer"),
+        Badge(title="Local Pro", description="Buy 5 bundles", metric="bundles_saved", threshold=5, user_role="customer"),
+        Badge(title="Streak Beginner", description="Reach a 3 day streak", metric="streak_count", threshold=3, user_role="customer"),
+    ])
+    session.commit()
+    customer_token = customer_login_response["access_token"]
+    vendor_token = vendor_login_response["access_token"]
+    test_client.post("reservations/1/reserve",
+                     headers={"Authorization": "Bearer " + customer_token})
+    code = session.get(Reservation, 1).code
+
+    finalise_response = test_client.post("reservations/1/check",
+                                         headers={"Authorization": "Bearer " + vendor_token},
+                                         json={"pickup_code": code})
+    badges_response = test_client.get("/customers/badges/owned",
+                                      headers={"Authorization": "Bearer " + customer_token})
+
+    assert finalise_response.status_code == 200
+    assert [badge["title"] for badge in badges_response.json()["badges"]] == ["Local Helper"]
+    session.expire_all()
+    customer = session.get(Customer, 1)
+    assert customer.bundles_saved == 1
+    assert customer.streak_count == 1
+
+def test_post_finalise_reservation_statement_count_success(test_client, session, count_statements, customer_login_response, vendor_login_response, registered_bundle):
+    session.add(Badge(title="Local Helper", description="Buy 1 bundle", metric="bundles_saved", threshold=1, user_role="customer"))
+    session.commit()
+    customer_token = customer_login_response["access_token"]
+    vendor_token = vendor_login_response["access_token"]
+    for _ in range(2):
+        test_client.post("reservations/1/reserve",
+                         headers={"Authorization": "Bearer " + customer_token})
+    codes = [session.get(Reservation, reservation_id).code for reservation_id in (1, 2)]
+    test_client.post("reservations/1/check",
+                     headers={"Authorization": "Bearer " + vendor_token},
+                     json={"pickup_code": codes[0]}) # loads the badges and the vendor's principal
+
+    with count_statements() as statements:
+        finalise_response = test_client.post("reservations/2/check",
+                                             headers={"Authorization": "Bearer " + vendor_token},
+                                             json={"pickup_code": codes[1]})
+
+    # the joined fetch (with the streak), the updates of the customer, reservation and vendor, the badges already owned
+    # and the sell through upsert
+    assert finalise_response.status_code == 200
+    assert len(statements) <= 6
+
+def test_pickups_and_no_shows_keep_sell_through_rollup_in_step_success(test_client, session, customer_login_response, vendor_login_response, registered_bundle):
+    customer_token = customer_login_response["access_token"]
+    vendor_token = vendor_login_response["access_token"]
+    for _ in range(3):
+        test_client.post("reservations/1/reserve",
+                         headers={"Authorization": "Bearer " + customer_token})
+    test_client.post("reservations/3/cancel", headers={"Authorization": "Bearer " + customer_token})
+    code = session.get(Reservation, 1).code
+    test_client.post("reservations/1/check",
+                     headers={"Authorization": "Bearer " + vendor_token},
+                     json={"pickup_code": code})
+    no_show_response = test_client.post("reservations/vendor/noshows",
+                                        headers={"Authorization": "Bearer " + vendor_token})
+    assert no_show_response.status_code == 200
+
+    # 5 bundles, one collected, one no show and the rest (including the cancelled one) still up for grabs
+    vendor_id = session.exec(select(Vendor.vendor_id)).first()
+    today = datetime.now().date()
+    all_time = proportions_all_time(session, vendor_id)
+    assert (all_time.collected, all_time.no_show, all_time.expired) == (1, 1, 3)
+    assert tuple(session.exec(sell_through_statement(vendor_id, today, today)).one()) == (1, 1, 3)
+
+    # the maintained rollup matches counting from scratch
+    rebuild_vendor_listing(session)
+    rebuilt = proportions_all_time(session, vendor_id)
+    assert rebuilt == all_time
+
+def test_post_finalise_reservation_twice_or_after_no_show_fail(test_client, session, customer_login_response, vendor_login_response, registered_bundle):
+    customer_token = customer_login_response["access_token"]
+    vendor_headers = {"Authorization": "Bearer " + vendor_login_response["access_token"]}
+    for _ in range(2):
+        test_client.post("reservations/1/reserve",
+                         headers={"Authorization": "Bearer " + customer_token})
+    code = session.get(Reservation, 1).code
+
+    first_response = test_client.post("reservations/1/check", headers=vendor_headers, json={"pickup_code": code})
+    repeat_response = test_client.post("reservations/1/check", headers=vendor_headers, json={"pickup_code": code})
+    assert first_response.status_code == 200
+    assert repeat_response.status_code == 409
+
+    # the other reservation becomes a no show and can't then be collected
+    assert test_client.post("reservations/vendor/noshows", headers=vendor_headers).status_code == 200
+    no_show_response = test_client.post("reservations/2/check", headers=vendor_headers,
+                                        json={"pickup_code": session.get(Reservation, 2).code})
+    assert no_show_response.status_code == 409
+
+    session.expire_all()
+    customer = session.get(Customer, 1)
+    assert (customer.bundles_saved, customer.streak_count) == (1, 1)
+    assert session.get(Reservation, 2).status == "no_show"
+    vendor_id = session.exec(select(Vendor.vendor_id)).first()
+    all_time = proportions_all_time(session, vendor_id)
+    assert (all_time.collected, all_time.no_show, all_time.expired) == (1, 1, 3)
@@ -1,3 +1,11 @@
+import pytest
+from sqlmodel import select
+from app.models import Vendor, Vendor_Listing, Vendor_Listing_Reserved
+from app.core.vendor_listing import rebuild_vendor_listing
+from app.core.geocoding import lat_cell
+from app.core.principal_cache import principal_cache
+from datetime import datetime
+
 def test_get_profile_success(test_client, registered_vendor, vendor_login_response):
     vendor = registered_vendor["vendor_data"]
     token = vendor_login_response["access_token"]
@@ -15,6 +23,149 @@ def test_get_profile_success(test_client, registered_vendor, vendor_login_respon
     assert profile_vendor_id > 0
     assert profile_response.status_code == 200
 
+def test_get_all_vendors_bundle_count_follows_bundles_success(test_client, session, registered_bundle, vendor_login_response, customer_login_response):
+    vendor = session.exec(select(Vendor)).first()
+    vendor.validated = True
+    session.add(vendor)
+    session.commit()
+    customer_token = customer_login_response["access_token"]
+    vendor_token = vendor_login_response["access_token"]
+
+    def bundle_count():
+        vendors_response = test_client.get("/vendors", headers={"Authorization": "Bearer " + customer_token})
+        return vendors_response.json()["vendors"][0]["bundle_count"]
+
+    assert bundle_count() == 5
+    test_client.post("reservations/1/reserve", headers={"Authorization": "Bearer " + customer_token})
+    assert bundle_count() == 4
+    test_client.post("reservations/1/cancel", headers={"Authorization": "Bearer " + customer_token})
+    assert bundle_count() == 5
+    test_client.post("/bundles/delete", headers={"Authorization": "Bearer " + vendor_token},
+                     json={"template_id": 1, "amount": 2})
+    assert bundle_count() == 3
+
+    # the maintained counts match counting the bundles from scratch
+    today = datetime.now().date()
+
+    def counts():
+        listing = session.get(Vendor_Listing, (vendor.vendor_id, today))
+        reserved = sum(session.exec(select(Vendor_Listing_Reserved.reserved_count)).all())
+        return (listing.posted_count, reserved, listing.vegan_count, listing.vegetarian_count)
+
+    maintained = counts()
+    session.expire_all()
+    rebuild_vendor_listing(session, today)
+    assert maintained == counts()
+
+def test_get_all_vendors_authorizes_on_the_async_session_success(test_client, count_statements, customer_login_response):
+    principal_cache.clear()
+    with count_statements() as statements:
+        vendors_response = test_client.get("/vendors", headers={"Authorization": "Bearer " + customer_login_response["access_token"]})
+
+    # the principal is loaded through the async engine like the rest of the request, the sync one isn't touched
+    assert vendors_response.status_code == 200
+    assert statements == []
+
+def test_get_all_vendors_pagination_success(test_client, vendor_factory, customer_login_response):
+    vendor_factory(5)
+    token = customer_login_response["access_token"]
+
+    names = []
+    cursor = None
+    while True:
+        query = "/vendors?limit=2" + (f"&cursor={cursor}" if cursor else "")
+        page_response = test_client.get(query, headers={"Authorization": "Bearer " + token})
+        page_response_data = page_response.json()
+        assert page_response.status_code == 200
+        assert page_response_data["total_count"] == 5
+        names += [v["name"] for v in page_response_data["vendors"]]
+        cursor = page_response_data["next_cursor"]
+        if cursor is None:
+            break
+
+    assert names == ["Vendor0", "Vendor1", "Vendor2", "Vendor3", "Vendor4"]
+
+def test_get_all_vendors_invalid_cursor_fail(test_client, customer_login_response):
+    token = customer_login_response["access_token"]
+    vendors_response = test_client.get(
+        "/vendors?cursor=not-a-cursor",
+        headers={"Authorization": "Bearer " + token}
+    )
+
+    assert vendors_response.json()["detail"] == "Invalid cursor"
+    assert vendors_response.status_code == 400
+
+def test_get_nearby_vendors_success(postcode_index, test_client, vendor_factory, customer_login_response, session):
+    vendors = vendor_factory(3)
+    # customer is at SW1A, vendors are about 3km, 1km and 250km away
+    for vendor, (lat, lon) in zip(vendors, [(51.5250, -0.1416), (51.5010, -0.1272), (50.7300, -3.5300)]):
+        vendor_account = session.get(Vendor, vendor["vendor_id"])
+        vendor_account.latitude, vendor_account.longitude, vendor_account.lat_cell = lat, lon, lat_cell(lat)
+        session.add(vendor_account)
+    session.commit()
+    token = customer_login_response["access_token"]
+
+    nearby_response = test_client.get(
+        "/vendors/nearby?radius_km=10",
+        headers={"Authorization": "Bearer " + token}
+    )
+    page_response = test_client.get(
+        "/vendors/nearby?radius_km=500&limit=2&offset=1",
+        headers={"Authorization": "Bearer " + token}
+    )
+
+    nearby_response_data = nearby_response.json()
+    assert nearby_response.status_code == 200
+    assert nearby_response_data["total_count"] == 2
+    assert [v["name"] for v in nearby_response_data["vendors"]] == ["Vendor1", "Vendor0"]
+    assert nearby_response_data["vendors"][0]["distance_km"] == pytest.approx(1.0, abs=0.05)
+
+    page_response_data = page_response.json()
+    assert page_response_data["total_count"] == 3
+    assert [v["name"] for v in page_response_data["vendors"]] == ["Vendor0", "Vendor2"]
+
+def test_get_nearby_vendors_wrong_role_fail(test_client, vendor_login_response):
+    token = vendor_login_response["access_token"]
+    nearby_response = test_client.get(
+        "/vendors/nearby",
+        headers={"Authorization": "Bearer " + token}
+    )
+
+    assert nearby_response.json()["detail"] == "Not a customer account"
+    assert nearby_response.status_code == 403
+
+def test_get_dist_to_vendor_success(postcode_index, test_client, registered_vendor, customer_login_response, session):
+    token = customer_login_response["access_token"]
+    vendor_id = session.exec(select(Vendor.vendor_id)).first()
+
+    km_response = test_client.get(
+        f"/vendors/{vendor_id}/distance",
+        headers={"Authorization": "Bearer " + token}
+    )
+    miles_response = test_client.get(
+        f"/vendors/{vendor_id}/distance?useMiles=true",
+        headers={"Authorization": "Bearer " + token}
+    )
+
+    assert km_response.status_code == 200
+    assert km_response.json() == pytest.approx(251.55, abs=0.01)
+    assert miles_response.json() == pytest.approx(156.31, abs=0.01)
+
+def test_get_dist_to_vendor_unknown_postcode_fail(postcode_index, test_client, registered_vendor, customer_login_response, session):
+    token = customer_login_response["access_token"]
+    vendor = session.exec(select(Vendor)).first()
+    vendor.latitude, vendor.longitude, vendor.post_code = None, None, "ZZ11ZZ"
+    session.add(vendor)
+    session.commit()
+
+    distance_response = test_client.get(
+        f"/vendors/{vendor.vendor_id}/distance",
+        headers={"Authorization": "Bearer " + token}
+    )
+
+    assert distance_response.json()["detail"] == "Could not find the location of that postcode"
+    assert distance_response.status_code == 404
+
 def test_get_profile_wrong_role_fail(test_client, customer_login_response):
     token = customer_login_response["access_token"]
     profile_response = test_client.get(
@@ -25,3 +176,16 @@ def test_get_profile_wrong_role_fail(test_client, customer_login_response):
     profile_response_data = profile_response.json()
     assert profile_response_data["detail"] == "Not a vendor account"
     assert profile_response.status_code == 403
+
+def test_get_all_vendors_success(test_client, vendor_factory, customer_login_response):
+    vendor_factory(3)
+    token = customer_login_response["access_token"]
+    vendors_response = test_client.get(
+        "/vendors",
+        headers={"Authorization": "Bearer " + token}
+    )
+
+    vendors_response_data = vendors_response.json()
+    assert vendors_response_data["total_count"] == 3
+    assert vendors_response_data["vendors"][0]["bundle_count"] == 0
+    assert vendors_response.status_code == 200